@@ -2,110 +2,385 @@
 # -*- coding: utf-8 -*-
 """
 Vercel 部署入口文件
+
+GET  /            说明页面
+GET  /api/health  健康检查
+POST /api/match   上传美团订单和预订记录文件（multipart/form-data），执行匹配，
+                  返回JSON统计信息和结果文件（base64），加 ?download=1 时直接返回结果文件
+POST /api/jobs    同上，但提交为后台任务，立即返回任务编号
+GET  /api/jobs/<任务编号>         查询任务进度和统计信息
+GET  /api/jobs/<任务编号>/result  下载任务结果文件（?format=xlsx/csv/parquet&all_records=1）
+
+后台任务保存在进程内，需以本地服务或常驻服务方式运行（无服务器环境中请求结束后任务不保留）。
+任务结果按内存上限和保留时长释放（YOUYI_JOB_RESULT_MB，默认32MB、30分钟），释放后下载返回410。
+
+本地运行:
+    python api/index.py --port 8600
 """
 
-from http.server import BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import base64
+import json
 import sys
 import os
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
 from pathlib import Path
+from urllib.parse import parse_qs, quote, urlencode, urlparse
 
 # 添加项目根目录到 Python 路径
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-class handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        # 返回简单的 HTML 页面，提示用户 Streamlit 应用无法直接在 Vercel 上运行
-        html_content = """
-        <!DOCTYPE html>
-        <html lang="zh-CN">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>工具集合网站</title>
-            <style>
-                body {
-                    font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                    margin: 0;
-                    padding: 0;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    min-height: 100vh;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                }
-                .container {
-                    background: white;
-                    padding: 3rem;
-                    border-radius: 20px;
-                    box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-                    text-align: center;
-                    max-width: 600px;
-                    margin: 2rem;
-                }
-                .icon {
-                    font-size: 4rem;
-                    margin-bottom: 1rem;
-                }
-                h1 {
-                    color: #333;
-                    margin-bottom: 1rem;
-                    font-size: 2.5rem;
-                }
-                p {
-                    color: #666;
-                    line-height: 1.6;
-                    margin-bottom: 2rem;
-                    font-size: 1.1rem;
-                }
-                .btn {
-                    display: inline-block;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    padding: 1rem 2rem;
-                    text-decoration: none;
-                    border-radius: 50px;
-                    font-weight: 600;
-                    transition: transform 0.3s ease;
-                    margin: 0.5rem;
-                }
-                .btn:hover {
-                    transform: translateY(-2px);
-                }
-                .note {
-                    background: #f8f9fa;
-                    padding: 1.5rem;
-                    border-radius: 10px;
-                    margin-top: 2rem;
-                    border-left: 4px solid #667eea;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="icon">🧰</div>
-                <h1>工具集合网站</h1>
-                <p>很抱歉，Streamlit 应用无法直接在 Vercel 的无服务器环境中运行。</p>
-                <p>建议使用以下平台部署 Streamlit 应用：</p>
-                
-                <a href="https://render.com" class="btn" target="_blank">🚀 Render</a>
-                <a href="https://railway.app" class="btn" target="_blank">🚄 Railway</a>
-                <a href="https://share.streamlit.io" class="btn" target="_blank">☁️ Streamlit Cloud</a>
-                
-                <div class="note">
-                    <strong>💡 部署建议：</strong><br>
-                    推荐使用 Render 或 Railway 平台，它们专为后端应用设计，支持长时间运行的 Streamlit 应用，并且可以绑定自定义域名 youyi.work。
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+from matcher_core import (
+    EXPORT_FORMATS, PARSE_CACHE, MATCH_JOBS, MATCH_RESULTS, MATCH_OVERRIDES,
+    export_result_bytes, load_meituan_data, load_reservation_data, match_summary, match_upload_job
+)
+
+# 单次请求上传内容的大小上限（MB）
+MAX_UPLOAD_MB_ENV = 'YOUYI_API_MAX_UPLOAD_MB'
+DEFAULT_MAX_UPLOAD_MB = 50
+
+MATCH_PATHS = {'/api/match', '/match'}
+JOB_PATHS = {'/api/jobs', '/jobs'}
+HEALTH_PATHS = {'/api/health', '/health'}
+
+INDEX_HTML = """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>工具集合网站</title>
+    <style>
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
+            margin: 0;
+            padding: 0;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            min-height: 100vh;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+        }
+        .container {
+            background: white;
+            padding: 3rem;
+            border-radius: 20px;
+            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
+            text-align: center;
+            max-width: 600px;
+            margin: 2rem;
+        }
+        .icon {
+            font-size: 4rem;
+            margin-bottom: 1rem;
+        }
+        h1 {
+            color: #333;
+            margin-bottom: 1rem;
+            font-size: 2.5rem;
+        }
+        p {
+            color: #666;
+            line-height: 1.6;
+            margin-bottom: 2rem;
+            font-size: 1.1rem;
+        }
+        .btn {
+            display: inline-block;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 1rem 2rem;
+            text-decoration: none;
+            border-radius: 50px;
+            font-weight: 600;
+            transition: transform 0.3s ease;
+            margin: 0.5rem;
+        }
+        .btn:hover {
+            transform: translateY(-2px);
+        }
+        .note {
+            background: #f8f9fa;
+            padding: 1.5rem;
+            border-radius: 10px;
+            margin-top: 2rem;
+            border-left: 4px solid #667eea;
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="icon">🧰</div>
+        <h1>工具集合网站</h1>
+        <p>很抱歉，Streamlit 应用无法直接在 Vercel 的无服务器环境中运行。</p>
+        <p>建议使用以下平台部署 Streamlit 应用：</p>
+        
+        <a href="https://render.com" class="btn" target="_blank">🚀 Render</a>
+        <a href="https://railway.app" class="btn" target="_blank">🚄 Railway</a>
+        <a href="https://share.streamlit.io" class="btn" target="_blank">☁️ Streamlit Cloud</a>
         
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html; charset=utf-8')
+        <div class="note">
+            <strong>🔌 匹配接口：</strong><br>
+            POST /api/match（multipart/form-data，字段 meituan、reservation 分别为美团订单和预订记录文件），
+            返回JSON统计信息和结果文件；加 ?download=1 直接下载结果文件。
+        </div>
+        
+        <div class="note">
+            <strong>💡 部署建议：</strong><br>
+            推荐使用 Render 或 Railway 平台，它们专为后端应用设计，支持长时间运行的 Streamlit 应用，并且可以绑定自定义域名 youyi.work。
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+
+class RequestError(ValueError):
+    """请求不合法，附带HTTP状态码"""
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def job_route(path):
+    """解析任务路径，返回(任务编号, 是否下载结果)，不是任务路径时返回None"""
+    base, _, tail = path.rpartition('/')
+    if base in JOB_PATHS and tail:
+        return tail, False
+    base, _, job_id = base.rpartition('/')
+    if base in JOB_PATHS and job_id and tail == 'result':
+        return job_id, True
+    return None
+
+
+def max_upload_bytes():
+    try:
+        return int(float(os.environ.get(MAX_UPLOAD_MB_ENV) or DEFAULT_MAX_UPLOAD_MB) * 1024 * 1024)
+    except ValueError:
+        return DEFAULT_MAX_UPLOAD_MB * 1024 * 1024
+
+
+def parse_multipart(content_type, body):
+    """解析multipart/form-data请求体，返回 {字段名: (文件名, 内容字节)}，普通字段的文件名为None"""
+    header = f"Content-Type: {content_type}\r\n\r\n".encode('latin-1')
+    message = BytesParser(policy=HTTP).parsebytes(header + body)
+    if not message.is_multipart():
+        raise ValueError("请求必须是 multipart/form-data 格式")
+    
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if name:
+            fields[name] = (part.get_filename(), part.get_payload(decode=True) or b'')
+    return fields
+
+
+def optional_int(value, name):
+    """解析可选的正整数参数，空值返回None"""
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"参数 {name} 必须是整数")
+    return number if number > 0 else None
+
+
+def is_true(value):
+    return (value or '').lower() in ('1', 'true', 'yes')
+
+
+def match_settings(options):
+    """从请求参数中读取匹配设置（进程数由服务器环境变量决定，不接受请求指定）"""
+    return dict(
+        top_k=optional_int(options.get('top_k'), 'top_k'),
+        tolerance_minutes=optional_int(options.get('tolerance_minutes'), 'tolerance_minutes')
+    )
+
+
+def result_format(options):
+    """请求参数中的导出格式，默认xlsx，不支持时抛出RequestError"""
+    file_format = options.get('format') or 'xlsx'
+    if file_format not in EXPORT_FORMATS:
+        raise RequestError(f"不支持的导出格式: {file_format}（可选 {'/'.join(EXPORT_FORMATS)}）")
+    return file_format
+
+
+def result_file(result_df, options):
+    """按请求参数生成结果文件信息"""
+    file_format = result_format(options)
+    content, rows = export_result_bytes(result_df, file_format, is_true(options.get('all_records')))
+    return {
+        'filename': f"匹配结果_{time.strftime('%Y%m%d_%H%M%S')}.{file_format}",
+        'format': file_format,
+        'content_type': EXPORT_FORMATS[file_format],
+        'rows': rows,
+        'content': content,
+    }
+
+
+def match_uploads(meituan_data, reservation_data, options):
+    """读取上传的文件并匹配，返回(结果文件信息, 统计信息)"""
+    started = time.perf_counter()
+    result_format(options)
+    
+    meituan_df, _ = PARSE_CACHE.get_or_load(meituan_data, load_meituan_data)
+    reservation_df, _ = PARSE_CACHE.get_or_load(reservation_data, load_reservation_data)
+    if meituan_df.empty or reservation_df.empty:
+        raise ValueError("上传的文件为空，请检查文件内容")
+    
+    result_df, _ = MATCH_RESULTS.get_or_match(meituan_df, reservation_df, **match_settings(options))
+    result_df, _ = MATCH_OVERRIDES.apply(result_df, meituan_df)
+    result = result_file(result_df, options)
+    
+    summary = {
+        'meituan_rows': len(meituan_df),
+        'reservation_rows': len(reservation_df),
+        'failed_sheets': reservation_df.attrs.get('failed_sheets', []),
+        **match_summary(result_df),
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+    return result, summary
+
+
+class handler(BaseHTTPRequestHandler):
+    def send_body(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
-        self.wfile.write(html_content.encode('utf-8'))
-        return
+        self.wfile.write(body)
+    
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_body(status, 'application/json; charset=utf-8', body)
+    
+    def send_file(self, result, summary):
+        """直接返回结果文件，统计信息（不含预订人明细）放在响应头中"""
+        header_summary = {key: value for key, value in summary.items() if key != 'bookers'}
+        self.send_body(200, result['content_type'], result['content'], {
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(result['filename'])}",
+            'X-Match-Summary': json.dumps(header_summary, ensure_ascii=True),
+        })
+    
+    def read_uploads(self, url):
+        """读取上传的文件和选项，返回(美团文件内容, 预订文件内容, 选项)；请求不合法时抛出ValueError"""
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            raise RequestError("请求缺少内容", 411)
+        if length > max_upload_bytes():
+            raise RequestError(f"上传内容超过 {max_upload_bytes() // (1024 * 1024)} MB 上限", 413)
+        
+        fields = parse_multipart(self.headers.get('Content-Type', ''), self.rfile.read(length))
+        missing = [name for name in ('meituan', 'reservation') if not fields.get(name, (None, b''))[1]]
+        if missing:
+            raise ValueError(f"缺少上传文件: {', '.join(missing)}")
+        # 选项可放在表单字段或查询参数中
+        options = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        options.update({
+            name: value.decode('utf-8') for name, (filename, value) in fields.items() if filename is None
+        })
+        return fields['meituan'][1], fields['reservation'][1], options
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        if path in HEALTH_PATHS:
+            self.send_json(200, {'status': 'ok'})
+        elif path in MATCH_PATHS or path in JOB_PATHS:
+            self.send_json(405, {'error': "请使用POST上传 meituan 和 reservation 文件"})
+        elif job_route(path):
+            self.get_job(url, *job_route(path))
+        else:
+            # 返回简单的 HTML 页面，说明匹配接口和 Streamlit 应用的部署方式
+            self.send_body(200, 'text/html; charset=utf-8', INDEX_HTML.encode('utf-8'))
     
     def do_POST(self):
-        self.do_GET()
\ No newline at end of file
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        if path not in MATCH_PATHS and path not in JOB_PATHS:
+            self.send_json(404, {'error': f"接口不存在: {url.path}"})
+            return
+        
+        try:
+            meituan_data, reservation_data, options = self.read_uploads(url)
+            if path in JOB_PATHS:
+                # 后台任务：先检查参数，再提交，立即返回任务编号；提交时指定的导出格式带入结果地址
+                settings = match_settings(options)
+                result_query = {'format': result_format(options)}
+                if is_true(options.get('all_records')):
+                    result_query['all_records'] = '1'
+                job_id = MATCH_JOBS.submit(match_upload_job, meituan_data, reservation_data, **settings)
+                self.send_json(202, {
+                    'job_id': job_id,
+                    'status_url': f"/api/jobs/{job_id}",
+                    'result_url': f"/api/jobs/{job_id}/result?{urlencode(result_query)}",
+                })
+                return
+            result, summary = match_uploads(meituan_data, reservation_data, options)
+        except ValueError as e:
+            self.send_json(getattr(e, 'status', 400), {'error': str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {'error': f"匹配失败: {str(e)}"})
+            return
+        
+        if is_true(options.get('download')):
+            self.send_file(result, summary)
+            return
+        
+        content = result.pop('content')
+        result['content_base64'] = base64.b64encode(content).decode('ascii')
+        self.send_json(200, {'summary': summary, 'result': result})
+    
+    def get_job(self, url, job_id, want_result):
+        """查询任务状态（/api/jobs/<任务编号>）或下载结果（/api/jobs/<任务编号>/result）"""
+        job = MATCH_JOBS.get(job_id)
+        if job is None:
+            self.send_json(404, {'error': f"任务不存在或已过期: {job_id}"})
+            return
+        if not want_result:
+            self.send_json(200, job.to_dict())
+            return
+        if job.status != 'done':
+            self.send_json(409, {'error': f"任务{job.to_dict()['status_label']}，暂无结果", **job.to_dict()})
+            return
+        
+        result_df = job.result
+        if result_df is None:
+            self.send_json(410, {'error': "任务结果已过期释放，请重新提交", **job.to_dict()})
+            return
+        
+        options = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            result = result_file(result_df, options)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        self.send_file(result, job.summary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地运行匹配接口")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8600)), help="监听端口")
+    args = parser.parse_args()
+    
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"匹配接口已启动: http://{args.host}:{args.port}/api/match")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
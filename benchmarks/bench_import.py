@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动导入耗时基准测试
+
+每次在新的Python进程中导入模块，测量冷启动导入耗时，并检查是否带入了界面和图表等重量级依赖。
+
+用法:
+    python benchmarks/bench_import.py --repeat 5
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+MODULES = ['matcher_core', 'match_cli', 'streamlit_app']
+HEAVY_MODULES = ['streamlit', 'plotly.express', 'openpyxl', 'pyarrow']
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(module):
+    """在新进程中导入模块，返回(耗时秒数, 已加载的重量级依赖)"""
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动导入耗时基准测试")
+    parser.add_argument('--repeat', type=int, default=5, help="每个模块重复次数")
+    parser.add_argument('modules', nargs='*', default=MODULES, help="要测试的模块")
+    args = parser.parse_args()
+    
+    print(f"{'模块':<16}{'最短(秒)':>10}{'中位(秒)':>10}  已加载的依赖")
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.repeat)]
+        timings = sorted(seconds for seconds, _ in runs)
+        loaded = ', '.join(runs[-1][1]) or '-'
+        print(f"{module:<16}{timings[0]:>10.3f}{timings[len(timings) // 2]:>10.3f}  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行匹配基准测试
+
+在不同数据量下比较串行匹配和按日期分区的进程池匹配（含子进程启动耗时），
+用于确定 PARALLEL_MIN_ROWS：总行数低于该值时进程池不划算，直接串行匹配。
+
+用法:
+    python benchmarks/bench_matching.py --orders 5000 20000 80000 200000 --workers 2 4
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from bench_readers import best_time, generate_meituan, generate_reservations
+from matcher_core import (
+    RESERVATION_ID_COLUMN, add_table_key_columns, match_reservations_parallel, parse_payment_amounts,
+    prepare_meituan_orders, prepare_reservations
+)
+
+
+def prepared_inputs(orders, reservations_per_order, start):
+    """生成并整理一个月的数据，返回(预订, 订单)"""
+    per_sheet = max(1, int(orders * reservations_per_order / 31))
+    meituan_df = generate_meituan(orders, start)
+    meituan_df['营业日期'] = pd.to_datetime(meituan_df['营业日期'])
+    meituan_df['下单时间'] = pd.to_datetime(meituan_df['下单时间'])
+    meituan_df['支付合计'] = parse_payment_amounts(meituan_df['结账方式'])
+    meituan_df = add_table_key_columns(meituan_df, '桌牌号')
+    
+    reservation_df = pd.concat(generate_reservations(31, per_sheet, start).values(), ignore_index=True)
+    reservations = prepare_reservations(add_table_key_columns(reservation_df, '包厢'))
+    reservations[RESERVATION_ID_COLUMN] = pd.array(range(len(reservations)), dtype='int32')
+    return reservations, prepare_meituan_orders(meituan_df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行匹配基准测试")
+    parser.add_argument('--orders', type=int, nargs='+', default=[5000, 20000, 80000, 200000], help="美团订单行数")
+    parser.add_argument('--reservations-per-order', type=float, default=0.05, help="预订数与订单数之比")
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4], help="并行进程数")
+    parser.add_argument('--repeat', type=int, default=3, help="每项重复次数")
+    args = parser.parse_args()
+    
+    start = datetime(2025, 3, 1)
+    print(f"取 {args.repeat} 次最短耗时（并行耗时包含每次启动进程池）")
+    print(f"{'总行数':>10}{'结果行数':>10}{'串行(秒)':>10}" + ''.join(f"{f'{w}进程(秒)':>12}" for w in args.workers))
+    for orders in args.orders:
+        reservations, mt_df = prepared_inputs(orders, args.reservations_per_order, start)
+        result = match_reservations_parallel(reservations, mt_df, workers=1)
+        timings = [best_time(lambda: match_reservations_parallel(reservations, mt_df, workers=1), args.repeat)]
+        for workers in args.workers:
+            timings.append(best_time(
+                lambda: match_reservations_parallel(reservations, mt_df, workers=workers, min_rows=0), args.repeat
+            ))
+        print(f"{len(reservations) + len(mt_df):>10}{len(result):>10}{timings[0]:>10.3f}"
+              + ''.join(f"{t:>12.3f}" for t in timings[1:]))
+
+
+if __name__ == "__main__":
+    main()
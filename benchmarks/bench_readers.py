@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取引擎基准测试
+
+用同一批生成的工作簿分别测试各读取引擎的加载耗时，用于为每个部署环境选择最快的引擎；
+再比较预订文件逐表解析与多进程并行解析（含子进程启动耗时），用于决定是否设置 YOUYI_PARSE_WORKERS。
+
+用法:
+    python benchmarks/bench_readers.py --orders 20000 --sheets 31 --per-sheet 60
+    python benchmarks/bench_readers.py --parse-per-sheet 60 2000 --parse-workers 2 4
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from matcher_core import available_reader_engines, load_meituan_data, load_reservation_data
+
+
+def generate_meituan(orders, start, seed=0):
+    """生成美团订单数据（前两行为标题行，与实际导出格式一致）"""
+    rnd = random.Random(seed)
+    tables = ['A01', 'A02', 'B3', '8', '12号', 'V1', '外卖12', '包厢5', '6桌']
+    rows = []
+    for _ in range(orders):
+        order_time = start + timedelta(days=rnd.randint(0, 30), hours=rnd.randint(10, 21), minutes=rnd.randint(0, 59))
+        rows.append({
+            '营业日期': order_time.strftime('%Y-%m-%d'),
+            '桌牌号': rnd.choice(tables),
+            '下单时间': order_time.strftime('%Y-%m-%d %H:%M:%S'),
+            '结账方式': f"微信:{rnd.randint(50, 2000)}.{rnd.randint(0, 99):02d}",
+            '订单状态': rnd.choice(['已结账', '已结账', '已退单']),
+            '备注': '',
+        })
+    return pd.DataFrame(rows)
+
+
+def generate_reservations(sheets, per_sheet, start, seed=0):
+    """生成预订数据，每天一个工作表"""
+    rnd = random.Random(seed)
+    result = {}
+    for day in range(sheets):
+        date = start + timedelta(days=day)
+        result[date.strftime('%m.%d')] = pd.DataFrame([{
+            '日期': date.strftime('%Y-%m-%d'),
+            '市别': rnd.choice(['午市', '晚市']),
+            '包厢': rnd.choice(['A01', 'A02', 'B3', '8', '12', 'V1']),
+            '姓名': rnd.choice(['张先生', '李女士']),
+            '预订人': rnd.choice(['平哥', '刘霞', 'SK', '王五']),
+            '经手人': rnd.choice(['甲', '乙']),
+        } for _ in range(per_sheet)])
+    return result
+
+
+def to_workbooks(meituan_df, reservation_sheets):
+    """写出xlsx和csv两种格式"""
+    meituan_xlsx = io.BytesIO()
+    with pd.ExcelWriter(meituan_xlsx, engine='openpyxl') as writer:
+        pd.DataFrame([['美团订单导出'], ['']]).to_excel(writer, index=False, header=False)
+        meituan_df.to_excel(writer, index=False, startrow=2)
+    meituan_csv = ('美团订单导出\n\n' + meituan_df.to_csv(index=False)).encode('utf-8-sig')
+    reservation_csv = pd.concat(reservation_sheets.values()).to_csv(index=False).encode('utf-8-sig')
+    return {
+        'xlsx': (meituan_xlsx.getvalue(), reservation_workbook(reservation_sheets)),
+        'csv': (meituan_csv, reservation_csv),
+    }
+
+
+def reservation_workbook(reservation_sheets):
+    """预订数据写出为xlsx，每天一个工作表"""
+    reservation_xlsx = io.BytesIO()
+    with pd.ExcelWriter(reservation_xlsx, engine='openpyxl') as writer:
+        for sheet_name, sheet_df in reservation_sheets.items():
+            sheet_df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return reservation_xlsx.getvalue()
+
+
+def best_time(func, repeat):
+    """多次运行取最短耗时"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="读取引擎基准测试")
+    parser.add_argument('--orders', type=int, default=20000, help="美团订单行数")
+    parser.add_argument('--sheets', type=int, default=31, help="预订工作表数量")
+    parser.add_argument('--per-sheet', type=int, default=60, help="每个工作表的预订数")
+    parser.add_argument('--repeat', type=int, default=3, help="每项重复次数")
+    parser.add_argument('--parse-per-sheet', type=int, nargs='*', default=[60, 2000],
+                        help="并行解析对比中每个工作表的预订数（可多个，不填则跳过对比）")
+    parser.add_argument('--parse-workers', type=int, nargs='+', default=[2], help="并行解析的进程数")
+    args = parser.parse_args()
+    
+    start = datetime(2025, 3, 1)
+    files = to_workbooks(
+        generate_meituan(args.orders, start),
+        generate_reservations(args.sheets, args.per_sheet, start)
+    )
+    
+    print(f"美团订单 {args.orders} 行，预订 {args.sheets} 个工作表 × {args.per_sheet} 行，取 {args.repeat} 次最短耗时")
+    print(f"{'引擎':<10}{'美团(秒)':>12}{'预订(秒)':>12}")
+    cases = [(engine, 'xlsx') for engine in available_reader_engines()] + [('csv', 'csv')]
+    for engine, file_format in cases:
+        meituan_bytes, reservation_bytes = files[file_format]
+        meituan_time = best_time(lambda: load_meituan_data(io.BytesIO(meituan_bytes), engine=engine), args.repeat)
+        reservation_time = best_time(lambda: load_reservation_data(io.BytesIO(reservation_bytes), engine=engine), args.repeat)
+        print(f"{engine:<10}{meituan_time:>12.3f}{reservation_time:>12.3f}")
+    
+    if args.parse_per_sheet:
+        compare_parse_workers(args.sheets, args.parse_per_sheet, args.parse_workers, args.repeat, start)
+
+
+def compare_parse_workers(sheets, per_sheet_sizes, workers_list, repeat, start):
+    """预订xlsx文件逐表解析与多进程并行解析的耗时对比（openpyxl引擎）"""
+    print(f"\n预订工作表解析（openpyxl，{sheets} 个工作表，并行耗时包含每次启动进程池）")
+    print(f"{'每表行数':>10}{'串行(秒)':>10}" + ''.join(f"{f'{w}进程(秒)':>12}" for w in workers_list))
+    for per_sheet in per_sheet_sizes:
+        reservation_bytes = reservation_workbook(generate_reservations(sheets, per_sheet, start))
+        timings = [
+            best_time(lambda: load_reservation_data(io.BytesIO(reservation_bytes), engine='openpyxl', workers=workers), repeat)
+            for workers in [1] + list(workers_list)
+        ]
+        print(f"{per_sheet:>10}{timings[0]:>10.3f}" + ''.join(f"{t:>12.3f}" for t in timings[1:]))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,9 +17,44 @@ import sys
 current_dir = Path(__file__).parent
 sys.path.insert(0, str(current_dir))
 
+class ToolInstanceRegistry:
+    """工具实例登记表：每个会话的每个工具只创建一次实例
+    
+    实例保存在 st.session_state 中（按会话隔离），页面交互时复用已上传的数据和匹配结果；
+    离开工具时调用 release 释放，实例有 close 方法时一并调用。
+    """
+    
+    SESSION_KEY = 'tool_instances'
+    
+    def __init__(self, factory):
+        self.factory = factory
+    
+    @property
+    def instances(self):
+        if self.SESSION_KEY not in st.session_state:
+            st.session_state[self.SESSION_KEY] = {}
+        return st.session_state[self.SESSION_KEY]
+    
+    def get(self, tool_id):
+        """返回当前会话中的工具实例，不存在时创建；创建失败返回None（下次继续尝试）"""
+        instance = self.instances.get(tool_id)
+        if instance is None:
+            instance = self.factory(tool_id)
+            if instance is not None:
+                self.instances[tool_id] = instance
+        return instance
+    
+    def release(self, tool_id):
+        """释放当前会话中的工具实例"""
+        instance = self.instances.pop(tool_id, None)
+        if instance is not None and hasattr(instance, 'close'):
+            instance.close()
+
+
 class ToolboxApp:
     def __init__(self):
         self.tools_config = self.load_tools_config()
+        self.tool_registry = ToolInstanceRegistry(self.load_tool_module)
         self.setup_page_config()
         
     def setup_page_config(self):
@@ -219,6 +254,7 @@ class ToolboxApp:
             if st.button("⬅️ 返回", key="back_to_home"):
                 if 'current_tool' in st.session_state:
                     del st.session_state.current_tool
+                self.tool_registry.release(tool_id)
                 st.rerun()
         
         with col2:
@@ -226,8 +262,8 @@ class ToolboxApp:
         
         st.divider()
         
-        # 加载工具
-        tool_instance = self.load_tool_module(tool_id)
+        # 加载工具（同一会话内复用实例）
+        tool_instance = self.tool_registry.get(tool_id)
         if tool_instance:
             # 根据不同工具类型调用不同方法
             if tool_id == "reservation_matcher":
@@ -256,16 +292,13 @@ class ToolboxApp:
                     st.warning(message)
                 else:
                     st.success("文件已就绪")
+                    tool_instance.render_match_settings()
                     
                     if st.button("🚀 开始匹配", type="primary", use_container_width=True):
-                        with st.spinner("匹配中..."):
-                            success, result_message = tool_instance.match_data()
-                            
-                        if success:
-                            st.success(result_message)
-                            st.info("请切换到'结果查看'标签页")
-                        else:
-                            st.error(result_message)
+                        tool_instance.submit_match_job()
+                
+                # 后台匹配任务进度和结果（刷新页面后按任务编号恢复）
+                tool_instance.render_match_job()
         
         with tab2:
             col1, col2 = st.columns([3, 1])
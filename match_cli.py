@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预定匹配命令行工具
+
+不启动界面，使用与网页版相同的读取和匹配流程，适合在服务器上定时执行月末对账。
+
+用法:
+    python match_cli.py --meituan 美团订单.xlsx --reservation 预订记录/ -o 匹配结果.xlsx
+    python match_cli.py -m exports/ -r bookings/ -o result.parquet --all-records --summary summary.json
+    python match_cli.py --list-overrides      # 列出网页中保存的手动匹配/移除匹配
+    python match_cli.py --delete-override 3 5 # 按编号删除其中几条
+    python match_cli.py --clear-overrides     # 清空保存的手动匹配/移除匹配
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from matcher_core import (
+    EXPORT_FORMATS, PARSE_CACHE, MATCH_OVERRIDES,
+    describe_overrides, export_result_bytes, load_meituan_data, load_reservation_data, match_summary, run_matching
+)
+
+INPUT_SUFFIXES = {'.xlsx', '.xls', '.csv'}
+
+
+def collect_inputs(paths):
+    """展开输入路径：目录取其中的Excel/CSV文件（按文件名排序，跳过Excel临时文件）"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(
+                child for child in path.iterdir()
+                if child.suffix.lower() in INPUT_SUFFIXES and not child.name.startswith('~$')
+            ))
+        elif path.is_file():
+            files.append(path)
+        else:
+            raise FileNotFoundError(f"找不到输入文件: {path}")
+    if not files:
+        raise FileNotFoundError(f"没有找到可读取的文件: {', '.join(map(str, paths))}")
+    return files
+
+
+def load_inputs(files, loader, engine=None):
+    """读取并合并多个文件（经过解析缓存），返回(DataFrame, 解析失败的工作表)"""
+    frames = []
+    failed_sheets = []
+    for path in files:
+        df, _ = PARSE_CACHE.get_or_load(path.read_bytes(), loader, engine=engine)
+        failed_sheets.extend([f"{path.name}:{sheet_name}", error] for sheet_name, error in df.attrs.get('failed_sheets', []))
+        if not df.empty:
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(), failed_sheets
+    return pd.concat(frames, ignore_index=True), failed_sheets
+
+
+def write_result(result_df, output, all_records=False):
+    """按输出文件扩展名写出结果，返回写出的行数"""
+    data, rows = export_result_bytes(result_df, output.suffix.lower().lstrip('.'), all_records)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(data)
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="预定匹配命令行工具")
+    parser.add_argument('-m', '--meituan', nargs='+', help="美团订单文件或目录")
+    parser.add_argument('-r', '--reservation', nargs='+', help="预订记录文件或目录")
+    parser.add_argument('-o', '--output', help="结果文件（.xlsx/.csv/.parquet）")
+    parser.add_argument('--summary', help="统计信息JSON文件（默认与结果文件同名）")
+    parser.add_argument('--all-records', action='store_true', help="输出全部记录（含未匹配），默认只输出已匹配记录")
+    parser.add_argument('--engine', help="Excel读取引擎（openpyxl/calamine）")
+    parser.add_argument('--workers', type=int, help="并行匹配进程数")
+    parser.add_argument('--top-k', type=int, help="按时间就近匹配时每个预订最多保留的订单数")
+    parser.add_argument('--tolerance', type=int, help="按时间就近匹配的时间窗口（分钟）")
+    parser.add_argument('--no-overrides', action='store_true', help="不套用网页中保存的手动匹配/移除匹配")
+    overrides = parser.add_mutually_exclusive_group()
+    overrides.add_argument('--list-overrides', action='store_true', help="列出保存的手动匹配/移除匹配后退出")
+    overrides.add_argument('--delete-override', type=int, nargs='+', metavar='编号',
+                           help="按编号（见 --list-overrides）删除保存的手动匹配/移除匹配后退出")
+    overrides.add_argument('--clear-overrides', action='store_true', help="清空保存的手动匹配/移除匹配后退出")
+    args = parser.parse_args(argv)
+    if args.list_overrides or args.delete_override or args.clear_overrides:
+        return args
+    missing = [flag for flag, value in (('-m', args.meituan), ('-r', args.reservation), ('-o', args.output)) if not value]
+    if missing:
+        parser.error(f"缺少参数: {' '.join(missing)}")
+    if Path(args.output).suffix.lower().lstrip('.') not in EXPORT_FORMATS:
+        parser.error(f"结果文件扩展名必须是 {'/'.join('.' + fmt for fmt in EXPORT_FORMATS)}")
+    return args
+
+
+def manage_overrides(args):
+    """列出、删除或清空保存的手动修改，返回退出码"""
+    if args.delete_override:
+        deleted = MATCH_OVERRIDES.delete(args.delete_override)
+        if deleted is None:
+            print(f"删除失败: 无法写入 {MATCH_OVERRIDES.path}", file=sys.stderr)
+            return 1
+        print(f"已删除 {deleted} 条手动修改（{MATCH_OVERRIDES.path}）")
+        if deleted < len(set(args.delete_override)):
+            print("部分编号不存在，请用 --list-overrides 查看当前编号", file=sys.stderr)
+            return 1
+        return 0
+    
+    if args.clear_overrides:
+        cleared = MATCH_OVERRIDES.clear()
+        if cleared is None:
+            print(f"清空失败: 无法写入 {MATCH_OVERRIDES.path}", file=sys.stderr)
+            return 1
+        print(f"已清空 {cleared} 条手动修改（{MATCH_OVERRIDES.path}）")
+        return 0
+    
+    overrides = describe_overrides(MATCH_OVERRIDES.load())
+    if overrides.empty:
+        print(f"没有保存的手动修改（{MATCH_OVERRIDES.path}）")
+    else:
+        print(overrides.to_string(index=False))
+        print(f"共 {len(overrides)} 条（{MATCH_OVERRIDES.path}）")
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list_overrides or args.delete_override or args.clear_overrides:
+        return manage_overrides(args)
+    started = time.perf_counter()
+    output = Path(args.output)
+    summary_path = Path(args.summary) if args.summary else output.with_suffix('.json')
+    
+    try:
+        # 先确认统计文件的目录可用，避免结果写出后才失败
+        summary_path.parent.mkdir(parents=True, exist_ok=True)
+        meituan_files = collect_inputs(args.meituan)
+        reservation_files = collect_inputs(args.reservation)
+        meituan_df, _ = load_inputs(meituan_files, load_meituan_data, args.engine)
+        reservation_df, failed_sheets = load_inputs(reservation_files, load_reservation_data, args.engine)
+        if meituan_df.empty or reservation_df.empty:
+            raise ValueError("上传的文件为空，请检查文件内容")
+        
+        result_df = run_matching(
+            meituan_df, reservation_df, args.workers,
+            top_k=args.top_k, tolerance_minutes=args.tolerance
+        )
+        if not args.no_overrides:
+            result_df, _ = MATCH_OVERRIDES.apply(result_df, meituan_df)
+        written = write_result(result_df, output, args.all_records)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"匹配失败: {e}", file=sys.stderr)
+        return 1
+    
+    summary = {
+        'meituan_files': [str(path) for path in meituan_files],
+        'reservation_files': [str(path) for path in reservation_files],
+        'meituan_rows': len(meituan_df),
+        'reservation_rows': len(reservation_df),
+        'failed_sheets': failed_sheets,
+        'output': str(output),
+        'output_rows': written,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+        **match_summary(result_df),
+    }
+    summary_path.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"匹配完成！总记录: {summary['total']}, 已匹配: {summary['matched']}, 未匹配: {summary['unmatched']}")
+    print(f"结果: {output}（{written} 条），统计: {summary_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2007 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预定匹配核心逻辑
+
+文件读取与清洗、预订人名称统一、桌牌号匹配、结果整理和导出，不依赖界面，只需要 pandas。
+网页版（streamlit_app.py）、命令行（match_cli.py）共用这里的流程；openpyxl 等在用到时才导入。
+"""
+
+import numpy as np
+import pandas as pd
+import re
+import os
+import io
+import csv
+import json
+import importlib.util
+import hashlib
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial, lru_cache
+from itertools import chain, islice
+from pathlib import Path
+from collections import OrderedDict
+from contextlib import closing, ExitStack
+import tempfile
+import threading
+import multiprocessing
+import sqlite3
+
+# 外卖订单关键词
+TAKEOUT_KEYWORDS = ['外卖', 'takeout', '配送', '打包']
+
+# 稳定编号：订单ID为美团订单在读取结果中的行位置，预订ID为合并后预订记录的序号，
+# 匹配结果以记录ID为索引；手动编辑和详情查询按编号直接定位
+ORDER_ID_COLUMN = '订单ID'
+RESERVATION_ID_COLUMN = '预订ID'
+ROW_ID_NAME = '记录ID'
+
+# 合并结果中从美团订单带出的列，以及手动编辑前需记录原值的列
+ORDER_RESULT_COLUMNS = ['支付合计', '下单时间', '下单时间_格式化', '结账方式', ORDER_ID_COLUMN]
+EDIT_COLUMNS = ORDER_RESULT_COLUMNS + ['匹配状态', '匹配类型']
+
+# 预订人别名表：标准名 -> 别名列表（不区分大小写），可在 tools_config.json 中覆盖
+DEFAULT_NAME_ALIASES = {
+    '平和': ['平哥', '平'],
+    '刘霞': ['刘'],
+    '周思玗': ['周'],
+    'SK': ['sk'],
+}
+
+# 预订人标准名列，匹配后计算一次供搜索和分析复用
+CANONICAL_NAME_COLUMN = '预订人标准名'
+
+# 匹配结果的紧凑存储类型：低基数列用分类类型，高基数文本列用Arrow字符串
+MATCH_TYPE_LABELS = ['完全匹配', '数字匹配', '外卖匹配', '手动匹配', '未匹配']
+MATCH_STATUS_LABELS = ['已匹配', '未匹配']
+CATEGORY_COLUMNS = ['市别', '桌牌号', '预订人', CANONICAL_NAME_COLUMN, '经手人']
+STRING_COLUMNS = ['客户姓名', '结账方式', '下单时间_格式化']
+
+# 美团文件表头探测：只读取前几行，按原有优先级（第3、2、1行）查找包含关键列的表头
+HEADER_PROBE_ROWS = 10
+MEITUAN_HEADER_CANDIDATES = [2, 1, 0]
+MEITUAN_HEADER_KEYWORDS = ['营业日期', '桌牌号']
+
+# 文件读取引擎：openpyxl（默认）、calamine（需安装 python-calamine，Rust实现）、csv（按内容自动识别）
+READER_ENGINE_ENV = 'YOUYI_READER_ENGINE'
+# pandas 从2.2起支持 engine='calamine'
+CALAMINE_MIN_PANDAS = (2, 2)
+DEFAULT_READER_ENGINE = 'openpyxl'
+CSV_ENCODINGS = ['utf-8-sig', 'gbk']
+
+# 输入文件结构：目标列 -> 可识别的原始列名（先精确匹配，再按包含匹配）、类型、日期格式
+# 类型 text 为字符串（缺失值保持NaN），date 为日期，datetime 为日期时间，category 为分类；未声明的列读取后直接丢弃
+MEITUAN_SCHEMA = {
+    '营业日期': {'aliases': ['营业日期', '日期'], 'dtype': 'date', 'format': '%Y-%m-%d'},
+    '桌牌号': {'aliases': ['桌牌号', '桌号', '台号'], 'dtype': 'text'},
+    '下单时间': {'aliases': ['下单时间'], 'dtype': 'datetime', 'format': '%Y-%m-%d %H:%M:%S'},
+    '结账方式': {'aliases': ['结账方式'], 'dtype': 'text'},
+    '订单状态': {'aliases': ['订单状态'], 'dtype': 'category'},
+}
+# 匹配用到结构中的全部列：缺少任一列时读取阶段即报 '缺少必要列'，不在匹配中途出现KeyError
+MEITUAN_REQUIRED_COLUMNS = ['营业日期', '桌牌号', '下单时间', '结账方式', '订单状态']
+RESERVATION_REQUIRED_COLUMNS = ['姓名', '预订人']
+RESERVATION_SCHEMA = {
+    '日期': {'aliases': ['日期'], 'dtype': 'date', 'format': '%Y-%m-%d'},
+    '市别': {'aliases': ['市别'], 'dtype': 'text'},
+    '包厢': {'aliases': ['包厢', '桌牌号', '桌号', '台号'], 'dtype': 'text'},
+    '姓名': {'aliases': ['姓名', '客户'], 'dtype': 'text'},
+    '预订人': {'aliases': ['预订人'], 'dtype': 'text'},
+    '经手人': {'aliases': ['经手人'], 'dtype': 'text'},
+}
+
+# 美团文件超过该大小时使用流式只读解析，只保留结构中声明的列和已结账订单
+STREAMING_MIN_BYTES = 20 * 1024 * 1024
+
+# 匹配结果导出格式及对应的MIME类型
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# 上传文件解析缓存最多保留的文件数（按内容哈希，最近最少使用淘汰）
+PARSE_CACHE_MAX_ENTRIES = 8
+# 解析结果格式版本，输入结构或清洗步骤变化时递增，使旧的磁盘缓存失效
+PARSE_CACHE_VERSION = 3
+
+# 解析结果的磁盘缓存（Arrow IPC格式，跨会话共享，需安装 pyarrow）
+DISK_CACHE_DIR_ENV = 'YOUYI_CACHE_DIR'
+DISK_CACHE_MAX_MB_ENV = 'YOUYI_CACHE_MAX_MB'
+DEFAULT_DISK_CACHE_DIR = Path(__file__).parent / '.cache' / 'parsed'
+DEFAULT_DISK_CACHE_MAX_MB = 512
+
+# 就近排序模式下预订的参考时间（预订数据只有日期和市别）
+MARKET_ANCHOR_HOURS = {'午市': 12, '晚市': 18}
+
+# 并行匹配进程数的环境变量（未设置时为1即串行，多核服务器上处理整季数据时再调高）
+MATCH_WORKERS_ENV = 'YOUYI_MATCH_WORKERS'
+DEFAULT_MATCH_WORKERS = 1
+
+# 预订+订单总行数低于该值时串行匹配：spawn子进程各需重新导入pandas，
+# benchmarks/bench_matching.py 中一个月的数据（约5.7万行）串行0.8秒、2进程4.0秒，14万行时串行仍更快
+PARALLEL_MIN_ROWS = 200000
+
+# 子进程用spawn方式启动：匹配和解析会在后台任务线程中发起，fork会复制其他线程持有的锁导致子进程卡死
+PROCESS_CONTEXT = multiprocessing.get_context('spawn')
+
+# 预订文件并行解析工作表的进程数环境变量（未设置时为1即逐表解析）；每个进程各自打开工作簿，进程多时内存峰值成倍增加。
+# spawn子进程各需重新导入pandas并打开工作簿：benchmarks/bench_readers.py 中31个工作表×60行逐表0.7秒、2进程3.5秒，
+# ×2000行时逐表11.8秒、2进程14.7秒；只在多核服务器上用该基准确认并行更快后再调高
+PARSE_WORKERS_ENV = 'YOUYI_PARSE_WORKERS'
+DEFAULT_PARSE_WORKERS = 1
+
+# 设置了多进程时，工作表数少于该值仍逐表解析，避免进程启动开销和多份工作簿的内存占用
+PARALLEL_MIN_SHEETS = 12
+
+# 后台匹配任务同时执行的数量（环境变量，默认2），以及保留状态的已结束任务数（超出时删除最早结束的）
+MATCH_JOB_WORKERS_ENV = 'YOUYI_JOB_WORKERS'
+DEFAULT_MATCH_JOB_WORKERS = 2
+MATCH_JOB_KEEP_FINISHED = 16
+
+# 已结束任务保留结果的内存上限（环境变量，单位MB）和保留时长（秒），超出后释放最早结束任务的结果，
+# 最近结束的一个任务的结果在保留时长内总是保留，保证提交它的页面能取回
+MATCH_JOB_RESULT_MAX_MB_ENV = 'YOUYI_JOB_RESULT_MB'
+DEFAULT_MATCH_JOB_RESULT_MAX_MB = 32
+MATCH_JOB_RESULT_TTL = 30 * 60
+JOB_STATUS_LABELS = {'queued': '排队中', 'running': '执行中', 'done': '已完成', 'failed': '失败'}
+
+# 跨会话共享的匹配结果缓存内存上限（环境变量，单位MB，设为0即关闭）；
+# 默认值按512MB实例估算，约能容纳两三份万行级的结果，内存更大的部署可调高
+RESULT_CACHE_MAX_MB_ENV = 'YOUYI_RESULT_CACHE_MB'
+DEFAULT_RESULT_CACHE_MAX_MB = 48
+
+# 手动匹配/移除匹配的持久化记录（SQLite文件，环境变量可指定路径），重新匹配后自动恢复
+OVERRIDE_DB_ENV = 'YOUYI_OVERRIDE_DB'
+DEFAULT_OVERRIDE_DB = Path(__file__).parent / '.cache' / 'overrides.sqlite3'
+# 识别同一条预订、同一个美团订单所用的列（与行号无关，重新上传文件后仍能对应）
+RESERVATION_KEY_COLUMNS = ['日期', '市别', '桌牌号', '预订人', '客户姓名']
+ORDER_KEY_COLUMNS = ['下单时间', '结账方式']
+OVERRIDE_KIND_LABELS = {'match': '手动匹配', 'unmatch': '移除匹配'}
+# 手动修改表的列；之后版本增加的列在打开旧文件时自动补上（只能是可为空的列）
+OVERRIDE_TABLE_COLUMNS = {
+    'kind': 'TEXT NOT NULL', 'reservation_key': 'TEXT NOT NULL', 'order_key': 'TEXT NOT NULL', 'seq': 'INTEGER NOT NULL',
+    'amount': 'REAL', 'order_time': 'TEXT', 'payment': 'TEXT', 'created_at': 'TEXT NOT NULL',
+    'replaces': 'TEXT', 'booking_date': 'TEXT', 'market': 'TEXT', 'table_no': 'TEXT', 'booker': 'TEXT',
+}
+# 随手动修改保存的预订信息（表中的列 -> 结果列），只用于列表显示，套用时仍按身份键对应
+OVERRIDE_BOOKING_COLUMNS = {'booking_date': '日期', 'market': '市别', 'table_no': '桌牌号', 'booker': '预订人'}
+
+
+@lru_cache(maxsize=1)
+def load_name_aliases():
+    """读取预订人别名表，并编译为 小写名称 -> 标准名 的查找表"""
+    aliases = DEFAULT_NAME_ALIASES
+    config_file = Path(__file__).parent / "tools_config.json"
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        tool = next((t for t in config.get("tools", []) if t.get("id") == "reservation_matcher"), {})
+        aliases = tool.get("name_aliases", aliases)
+    except (OSError, ValueError):
+        pass
+    
+    lookup = {}
+    for canonical, variants in aliases.items():
+        for name in [canonical] + list(variants):
+            lookup[str(name).strip().lower()] = canonical
+    return lookup
+
+
+def canonical_name(name):
+    """单个预订人姓名转换为标准名，空值返回None"""
+    if pd.isna(name) or str(name).strip() == '':
+        return None
+    name = str(name).strip()
+    return load_name_aliases().get(name.lower(), name)
+
+
+def canonical_names(names):
+    """批量转换预订人标准名，只对去重后的姓名查表一次"""
+    codes, uniques = pd.factorize(names, use_na_sentinel=True)
+    mapped = [canonical_name(name) for name in uniques] + [None]
+    return pd.Series(mapped, dtype=object).take(codes).set_axis(names.index)
+
+
+def string_dtype():
+    """优先使用Arrow字符串类型，pyarrow不可用时退回pandas字符串类型"""
+    try:
+        import pyarrow  # noqa: F401
+        return 'string[pyarrow]'
+    except ImportError:
+        return 'string'
+
+
+def compact_result_frame(df):
+    """把匹配结果转换为紧凑类型：分类、Arrow字符串、整数降位"""
+    df = df.copy()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    # 匹配类型和状态使用固定类别，手动修改时可直接赋值
+    if '匹配类型' in df.columns:
+        df['匹配类型'] = pd.Categorical(df['匹配类型'], categories=MATCH_TYPE_LABELS)
+    if '匹配状态' in df.columns:
+        df['匹配状态'] = pd.Categorical(df['匹配状态'], categories=MATCH_STATUS_LABELS)
+    for col in STRING_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(string_dtype())
+    # 编号列不降位，手动编辑追加的编号不会超出范围；订单ID在追加行拼接后可能变成Int64或object，转回Int32
+    if ORDER_ID_COLUMN in df.columns:
+        df[ORDER_ID_COLUMN] = df[ORDER_ID_COLUMN].astype('Int32')
+    id_cols = [ORDER_ID_COLUMN, RESERVATION_ID_COLUMN]
+    for col in df.select_dtypes(include='integer').columns.difference(id_cols):
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def env_megabytes(env, default):
+    """读取以MB为单位的内存上限环境变量，返回字节数；未设置或无效时使用默认值"""
+    try:
+        megabytes = float(os.environ.get(env) or default)
+    except ValueError:
+        megabytes = default
+    return int(megabytes * 1024 * 1024)
+
+
+def frame_memory_bytes(df):
+    """DataFrame实际占用内存（含字符串对象）"""
+    if df is None or not hasattr(df, 'memory_usage'):
+        return 0
+    return int(df.memory_usage(deep=True).sum())
+
+
+def parse_payment_amounts(payments):
+    """从结账方式文本中批量提取支付金额（第一个数字，含负数和小数），无法提取时为NaN"""
+    numbers = payments.astype(str).str.extract(r'(-?\d+\.?\d*)', expand=False)
+    return pd.to_numeric(numbers, errors='coerce').where(payments.notna())
+
+
+def format_amount(amount, prefix=''):
+    """金额显示格式，空值显示为空字符串"""
+    if pd.isna(amount):
+        return ''
+    return f"{prefix}{float(amount):.2f}"
+
+
+# 桌牌号预计算列：完全匹配键、数字键、外卖标记
+TABLE_EXACT_KEY = '_桌号精确键'
+TABLE_DIGIT_KEY = '_桌号数字键'
+TABLE_TAKEOUT_FLAG = '_桌号外卖'
+TABLE_KEY_COLUMNS = [TABLE_EXACT_KEY, TABLE_DIGIT_KEY, TABLE_TAKEOUT_FLAG]
+
+
+def extract_table_digits(table_str):
+    """提取桌牌号中的数字部分"""
+    if pd.isna(table_str):
+        return None
+    numbers = re.findall(r'\d+', str(table_str))
+    return ''.join(numbers) if numbers else None
+
+
+def is_takeout_table(table_str):
+    """判断桌牌号是否为外卖订单"""
+    if pd.isna(table_str):
+        return False
+    table_str = str(table_str).lower()
+    return any(keyword in table_str for keyword in TAKEOUT_KEYWORDS)
+
+
+def add_table_key_columns(df, table_col):
+    """为数据添加桌牌号预计算列，只对去重后的桌牌号解析一次"""
+    df = df.copy()
+    if table_col not in df.columns:
+        return df
+    
+    codes, uniques = pd.factorize(df[table_col], use_na_sentinel=True)
+    exact = [str(value) for value in uniques] + ['nan']
+    digits = [extract_table_digits(value) for value in uniques] + [None]
+    takeout = [is_takeout_table(value) for value in uniques] + [False]
+    
+    # 缺失值的编码为-1，正好取到列表末尾的缺失值占位
+    df[TABLE_EXACT_KEY] = pd.Series(exact, dtype=object).take(codes).to_numpy()
+    df[TABLE_DIGIT_KEY] = pd.Series(digits, dtype=object).take(codes).to_numpy()
+    df[TABLE_TAKEOUT_FLAG] = pd.Series(takeout, dtype=bool).take(codes).to_numpy()
+    return df
+
+
+def match_reservations(res_df, mt_df, top_k=None, tolerance_minutes=None):
+    """基于连接的匹配引擎：按(下单日期, 市别, 桌牌号键)一次性关联预订与美团订单
+    
+    标签规则与原逐行桌牌号比较相同：桌牌号字符串相同为完全匹配，
+    数字部分相同为数字匹配（美团桌牌号含外卖关键词时为外卖匹配），否则未匹配。
+    默认每个预订记录对应每个匹配订单输出一行，顺序与逐行匹配时相同；
+    指定 top_k 或 tolerance_minutes 时启用就近排序模式，见 rank_pairs_by_time。
+    """
+    # 桌牌号键通常在加载文件时已预计算，缺失时补算
+    if not all(col in res_df.columns for col in TABLE_KEY_COLUMNS):
+        res_df = add_table_key_columns(res_df, '桌牌号')
+    if not all(col in mt_df.columns for col in TABLE_KEY_COLUMNS):
+        mt_df = add_table_key_columns(mt_df, '桌牌号')
+    res_df = res_df.reset_index(drop=True)
+    mt_df = mt_df.reset_index(drop=True)
+    return build_match_rows(res_df, mt_df, match_pairs(res_df, mt_df, top_k, tolerance_minutes))
+
+
+def match_pairs(res_df, mt_df, top_k=None, tolerance_minutes=None):
+    """计算匹配组合，返回按输出顺序排列的(_res_pos, _mt_pos, 匹配类型)，位置为两侧的行位置
+    
+    两侧需已有桌牌号键列（见 add_table_key_columns）。
+    """
+    res_keys = pd.DataFrame({
+        '_res_pos': range(len(res_df)),
+        '_日期键': pd.to_datetime(res_df['日期'], errors='coerce').dt.normalize(),
+        '_市别键': res_df['市别'],
+        '_精确键': res_df[TABLE_EXACT_KEY],
+        '_数字键': res_df[TABLE_DIGIT_KEY],
+    }).dropna(subset=['_日期键', '_市别键'])
+    
+    mt_keys = pd.DataFrame({
+        '_mt_pos': range(len(mt_df)),
+        '_日期键': mt_df['下单时间'].dt.normalize(),
+        '_市别键': mt_df['市别'],
+        '_精确键': mt_df[TABLE_EXACT_KEY],
+        '_数字键': mt_df[TABLE_DIGIT_KEY],
+        '_外卖': mt_df[TABLE_TAKEOUT_FLAG],
+    }).dropna(subset=['_日期键', '_市别键'])
+    
+    # 完全匹配（最高优先级）
+    exact_pairs = res_keys.merge(mt_keys, on=['_日期键', '_市别键', '_精确键'])
+    exact_pairs['匹配类型'] = '完全匹配'
+    
+    # 数字部分匹配（排除已完全匹配的组合）
+    digit_pairs = res_keys.dropna(subset=['_数字键']).merge(
+        mt_keys.dropna(subset=['_数字键']),
+        on=['_日期键', '_市别键', '_数字键'],
+        suffixes=('', '_mt')
+    )
+    digit_pairs = digit_pairs[digit_pairs['_精确键'] != digit_pairs['_精确键_mt']].copy()
+    digit_pairs['匹配类型'] = digit_pairs['_外卖'].map({True: '外卖匹配', False: '数字匹配'})
+    
+    pair_cols = ['_res_pos', '_mt_pos', '_日期键', '_市别键', '匹配类型']
+    pairs = pd.concat([exact_pairs[pair_cols], digit_pairs[pair_cols]], ignore_index=True)
+    if top_k or tolerance_minutes is not None:
+        pairs = rank_pairs_by_time(pairs, mt_df['下单时间'], top_k, tolerance_minutes)
+    else:
+        pairs = pairs.sort_values(['_res_pos', '_mt_pos'], kind='mergesort', ignore_index=True)
+    return pairs[['_res_pos', '_mt_pos', '匹配类型']]
+
+
+def build_match_rows(res_df, mt_df, pairs):
+    """按匹配组合组装结果：每个(预订, 订单)组合一行，没有匹配订单的预订一行（未匹配），按预订顺序排列
+    
+    res_df和mt_df为行位置从0开始的整理后数据，pairs见 match_pairs。
+    """
+    pairs = pairs.assign(_rank=range(len(pairs)))
+    
+    # 匹配成功的记录：每个(预订, 订单)组合一行
+    matched = res_df.iloc[pairs['_res_pos'].to_numpy()].reset_index(drop=True)
+    order_values = mt_df.iloc[pairs['_mt_pos'].to_numpy()].reset_index(drop=True)
+    order_cols = [col for col in ORDER_RESULT_COLUMNS if col in mt_df.columns]
+    for col in order_cols:
+        matched[col] = order_values[col]
+    matched['匹配类型'] = pairs['匹配类型'].to_numpy()
+    matched['_res_pos'] = pairs['_res_pos'].to_numpy()
+    matched['_rank'] = pairs['_rank'].to_numpy()
+    
+    # 没有匹配订单的预订记录
+    unmatched_mask = ~pd.Series(range(len(res_df))).isin(pairs['_res_pos'])
+    unmatched = res_df[unmatched_mask.to_numpy()].copy()
+    for col in order_cols:
+        # 保持订单列原有类型（空值），避免合并后退化为object
+        unmatched[col] = mt_df[col].iloc[0:0].reindex(unmatched.index)
+    unmatched['匹配类型'] = '未匹配'
+    unmatched['_res_pos'] = unmatched.index
+    unmatched['_rank'] = -1
+    
+    merged = pd.concat([matched, unmatched.reset_index(drop=True)], ignore_index=True)
+    merged = merged.sort_values(['_res_pos', '_rank'], kind='mergesort', ignore_index=True)
+    return merged.drop(columns=['_res_pos', '_rank'] + TABLE_KEY_COLUMNS, errors='ignore')
+
+
+def rank_pairs_by_time(pairs, order_times, top_k=None, tolerance_minutes=None):
+    """就近排序模式：按下单时间与预订参考时间的距离排序候选订单
+    
+    参考时间为预订日期加上市别对应的时刻（MARKET_ANCHOR_HOURS）。
+    超出时间窗口的订单被丢弃，每个预订最多保留 top_k 个最近的订单，
+    同一预订的订单按时间距离从近到远排列。
+    """
+    if pairs.empty:
+        return pairs
+    
+    anchor = pairs['_日期键'] + pd.to_timedelta(pairs['_市别键'].map(MARKET_ANCHOR_HOURS), unit='h')
+    pairs = pairs.assign(
+        _时间差=(order_times.iloc[pairs['_mt_pos'].to_numpy()].to_numpy() - anchor.to_numpy())
+    )
+    pairs['_时间差'] = pairs['_时间差'].abs()
+    if tolerance_minutes is not None:
+        pairs = pairs[pairs['_时间差'] <= pd.Timedelta(minutes=tolerance_minutes)]
+    
+    # 排序后用组内序号截取前k个，避免逐组处理
+    pairs = pairs.sort_values(['_res_pos', '_时间差', '_mt_pos'], kind='mergesort', ignore_index=True)
+    if top_k:
+        pairs = pairs[pairs.groupby('_res_pos').cumcount() < top_k]
+    return pairs.drop(columns=['_时间差']).reset_index(drop=True)
+
+
+def find_header_row(preview, keywords, candidates=()):
+    """在预览行中查找同时包含所有关键词的表头行，找不到返回None"""
+    rows = list(candidates) + [i for i in range(len(preview)) if i not in candidates]
+    for row in rows:
+        if row >= len(preview):
+            continue
+        values = [str(value) for value in preview.iloc[row] if pd.notna(value)]
+        if all(any(keyword in value for value in values) for keyword in keywords):
+            return row
+    return None
+
+
+def drop_empty(df):
+    """移除完全空的列和行"""
+    return df.dropna(how='all', axis=1).dropna(how='all', axis=0)
+
+
+def resolve_schema_columns(columns, schema):
+    """按结构中的别名识别原始列，返回{原始列名: 目标列名}
+    
+    每个目标列先找列名完全相同的列，再找包含别名的列；每个原始列只对应一个目标列。
+    """
+    columns = list(columns)
+    mapping = {}
+    for target, spec in schema.items():
+        candidates = [col for col in columns if col not in mapping]
+        match = next((col for alias in spec['aliases'] for col in candidates if str(col) == alias), None)
+        if match is None:
+            match = next((col for alias in spec['aliases'] for col in candidates if alias in str(col)), None)
+        if match is not None:
+            mapping[match] = target
+    return mapping
+
+
+def text_values(series):
+    """转换为字符串列，缺失值保持NaN；整数值的浮点数（如 8.0）转为 '8'"""
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    texts = [
+        str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+        for value in uniques
+    ] + [None]
+    return pd.Series(pd.Series(texts, dtype=object).take(codes).to_numpy(), index=series.index).where(codes >= 0)
+
+
+def parse_datetimes(series, fmt=None, date_only=False):
+    """解析日期时间列：先按声明的格式解析，不符合格式的值再自动识别；已是日期类型时直接返回
+    
+    date_only为True时只取文本的第一段（如 '2025-03-01 周六'）并去掉时间部分。
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        parsed = series
+    else:
+        if fmt:
+            parsed = pd.to_datetime(series, format=fmt, errors='coerce')
+        else:
+            parsed = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+        retry = parsed.isna() & series.notna()
+        if retry.any():
+            values = series[retry].astype(str)
+            if date_only:
+                values = values.str.split().str[0]
+            # 逐个去重后的值识别，不同写法（如 2025/03/01）互不影响
+            lookup = {value: pd.to_datetime(value, errors='coerce') for value in values.unique()}
+            parsed = parsed.copy()
+            parsed[retry] = pd.to_datetime(values.map(lookup))
+    return parsed.dt.normalize() if date_only else parsed
+
+
+def apply_schema(df, schema, required=()):
+    """按结构识别、转换并只保留声明的列，缺少必要列时抛出ValueError"""
+    mapping = resolve_schema_columns(df.columns, schema)
+    missing = [col for col in required if col not in mapping.values()]
+    if missing:
+        raise ValueError(f"缺少必要列: {', '.join(missing)}")
+    
+    sources = {target: source for source, target in mapping.items()}
+    typed = {}
+    for target, spec in schema.items():
+        if target not in sources:
+            continue
+        values = df[sources[target]]
+        if spec['dtype'] == 'date':
+            typed[target] = parse_datetimes(values, spec.get('format'), date_only=True)
+        elif spec['dtype'] == 'datetime':
+            typed[target] = parse_datetimes(values, spec.get('format'))
+        elif spec['dtype'] == 'category':
+            typed[target] = text_values(values).astype('category')
+        else:
+            typed[target] = text_values(values)
+    return pd.DataFrame(typed, index=df.index).dropna(how='all').reset_index(drop=True)
+
+
+def source_size(source):
+    """数据源大小（字节），支持文件路径和内存文件"""
+    if hasattr(source, 'getbuffer'):
+        return source.getbuffer().nbytes
+    return os.path.getsize(source)
+
+
+def source_head(source, size=8):
+    """读取数据源开头的几个字节，用于识别文件格式"""
+    if hasattr(source, 'getbuffer'):
+        return bytes(source.getbuffer()[:size])
+    with open(source, 'rb') as f:
+        return f.read(size)
+
+
+def is_xlsx_source(source):
+    """是否为xlsx格式（zip压缩包）"""
+    return source_head(source, 2) == b'PK'
+
+
+def is_excel_source(source):
+    """是否为Excel文件（xlsx或旧版xls），否则按CSV处理"""
+    return is_xlsx_source(source) or source_head(source, 4) == b'\xd0\xcf\x11\xe0'
+
+
+def pandas_version():
+    """pandas 主、次版本号"""
+    return tuple(int(part) for part in re.findall(r'\d+', pd.__version__)[:2])
+
+
+def available_reader_engines():
+    """当前环境可用的Excel读取引擎（calamine 需要 pandas>=2.2 和 python-calamine）"""
+    engines = ['openpyxl']
+    if pandas_version() >= CALAMINE_MIN_PANDAS and importlib.util.find_spec('python_calamine') is not None:
+        engines.append('calamine')
+    return engines
+
+
+def default_reader_engine(engine=None):
+    """Excel读取引擎：参数优先，其次环境变量，默认openpyxl；不可用时退回openpyxl"""
+    engine = engine or os.environ.get(READER_ENGINE_ENV) or DEFAULT_READER_ENGINE
+    if engine not in available_reader_engines():
+        return 'openpyxl'
+    return engine
+
+
+def resolve_reader_engine(source, engine=None):
+    """确定读取引擎：CSV内容固定用csv，Excel文件见 default_reader_engine"""
+    if not is_excel_source(source):
+        return 'csv'
+    return default_reader_engine(engine)
+
+
+def open_excel(source, engine):
+    """按引擎打开工作簿；openpyxl不支持xls，此时交给pandas默认引擎"""
+    if engine == 'openpyxl' and not is_xlsx_source(source):
+        engine = None
+    return pd.ExcelFile(source, engine=engine)
+
+
+def source_bytes(source):
+    """读取数据源的全部字节，支持文件路径和内存文件"""
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def read_csv_text(source):
+    """读取CSV文本，依次尝试UTF-8和GBK编码"""
+    data = source_bytes(source)
+    for encoding in CSV_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("无法识别CSV文件编码，请另存为UTF-8格式")
+
+
+def read_meituan_table(source, engine=None):
+    """读取美团订单文件：只打开一次，先用前几行定位表头再读取整表"""
+    engine = resolve_reader_engine(source, engine)
+    if engine == 'csv':
+        text = read_csv_text(source)
+        preview = pd.DataFrame(list(islice(csv.reader(io.StringIO(text)), HEADER_PROBE_ROWS)))
+        header_row = find_header_row(preview, MEITUAN_HEADER_KEYWORDS, MEITUAN_HEADER_CANDIDATES)
+        if header_row is None:
+            raise ValueError("无法识别美团文件格式，请检查文件是否正确")
+        return pd.read_csv(io.StringIO(text), skiprows=header_row)
+    
+    with open_excel(source, engine) as excel_file:
+        sheet_name = excel_file.sheet_names[0]
+        preview = excel_file.parse(sheet_name, header=None, nrows=HEADER_PROBE_ROWS)
+        header_row = find_header_row(preview, MEITUAN_HEADER_KEYWORDS, MEITUAN_HEADER_CANDIDATES)
+        if header_row is None:
+            raise ValueError("无法识别美团文件格式，请检查文件是否正确")
+        return excel_file.parse(sheet_name, header=header_row)
+
+
+def stream_meituan_excel(source):
+    """流式读取美团订单文件：逐行迭代只读工作簿，只保留匹配所需的列和已结账订单
+    
+    内存占用只与保留的行数有关，不需要先构建整张工作表。
+    缺少所需列时返回None，由调用方改用完整读取。
+    """
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        preview = list(islice(rows, HEADER_PROBE_ROWS))
+        header_row = find_header_row(pd.DataFrame(preview), MEITUAN_HEADER_KEYWORDS, MEITUAN_HEADER_CANDIDATES)
+        if header_row is None:
+            raise ValueError("无法识别美团文件格式，请检查文件是否正确")
+        
+        header = [str(value) if value is not None else '' for value in preview[header_row]]
+        sources = {target: header.index(col) for col, target in resolve_schema_columns(header, MEITUAN_SCHEMA).items()}
+        if any(col not in sources for col in MEITUAN_SCHEMA):
+            return None
+        keep_idx = [sources[col] for col in MEITUAN_SCHEMA]
+        status_idx = sources['订单状态']
+        
+        kept_rows = []
+        for row in chain(preview[header_row + 1:], rows):
+            if len(row) <= status_idx or row[status_idx] != '已结账':
+                continue
+            kept_rows.append(tuple(row[i] if i < len(row) else None for i in keep_idx))
+    finally:
+        workbook.close()
+    meituan_df = pd.DataFrame(kept_rows, columns=list(MEITUAN_SCHEMA))
+    # 空单元格统一为NaN，与pandas读取结果一致
+    return meituan_df.mask(meituan_df.isna())
+
+
+def load_meituan_data(source, engine=None, streaming=None):
+    """读取并清洗美团订单数据，按 MEITUAN_SCHEMA 转换列类型，预计算桌牌号匹配键和支付金额
+    
+    engine为读取引擎（见 resolve_reader_engine），无论使用哪个引擎清洗步骤都相同。
+    streaming为None时，openpyxl引擎下超过 STREAMING_MIN_BYTES 的xlsx文件自动使用流式读取。
+    """
+    engine = resolve_reader_engine(source, engine)
+    if streaming is None:
+        streaming = engine == 'openpyxl' and is_xlsx_source(source) and source_size(source) >= STREAMING_MIN_BYTES
+    
+    meituan_df = stream_meituan_excel(source) if streaming else None
+    if meituan_df is None:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        meituan_df = read_meituan_table(source, engine)
+    
+    meituan_df = drop_empty(meituan_df)
+    # 营业日期为 '--' 的是合计等占位行，只去掉这些行；其他营业日期为空或无法识别的订单保留（匹配按下单时间）
+    date_col = next((col for col, target in resolve_schema_columns(meituan_df.columns, MEITUAN_SCHEMA).items()
+                     if target == '营业日期'), None)
+    if date_col is not None:
+        meituan_df = meituan_df[meituan_df[date_col].astype(str).str.strip() != '--']
+    meituan_df = apply_schema(meituan_df, MEITUAN_SCHEMA, MEITUAN_REQUIRED_COLUMNS)
+    meituan_df = add_table_key_columns(meituan_df, '桌牌号')
+    # 解析支付金额（数值类型，后续匹配、分析、导出直接使用）
+    meituan_df['支付合计'] = parse_payment_amounts(meituan_df['结账方式'])
+    return meituan_df
+
+
+def resolve_workers(workers=None, env=MATCH_WORKERS_ENV, default=None):
+    """确定进程数：参数优先，其次环境变量，再次default，默认CPU核心数"""
+    if workers is None:
+        workers = os.environ.get(env) or default or os.cpu_count() or 1
+    try:
+        return max(1, int(workers))
+    except (TypeError, ValueError):
+        return 1
+
+
+def clean_reservation_sheet(sheet_df, sheet_name):
+    """按 RESERVATION_SCHEMA 清洗单个工作表，并添加工作表名称列用于标识数据来源"""
+    sheet_df = apply_schema(drop_empty(sheet_df), RESERVATION_SCHEMA)
+    if not sheet_df.empty:
+        sheet_df['数据来源工作表'] = sheet_name
+    return sheet_df
+
+
+def parse_reservation_sheets(excel_file, sheet_names):
+    """从已打开的工作簿逐表解析并清洗，返回[(工作表名, DataFrame, 错误信息)]，解析失败时DataFrame为None"""
+    results = []
+    for sheet_name in sheet_names:
+        try:
+            results.append((sheet_name, clean_reservation_sheet(excel_file.parse(sheet_name), sheet_name), None))
+        except Exception as e:
+            results.append((sheet_name, None, str(e)))
+    return results
+
+
+def _parse_sheet_batch(path, engine, sheet_names):
+    """进程池任务：各自从文件打开一次工作簿，解析并清洗一批连续的工作表"""
+    with open_excel(path, engine) as excel_file:
+        return parse_reservation_sheets(excel_file, sheet_names)
+
+
+def read_reservation_sheets(source, engine=None, workers=None):
+    """读取预订记录文件的所有工作表，结果按工作表顺序排列；CSV视为单个工作表
+    
+    设置了多进程（见 PARSE_WORKERS_ENV）且工作表较多时，把连续的工作表分批交给进程池，每个进程只打开一次工作簿。
+    子进程按文件路径读取（内存文件先写入临时文件），不在进程间传递整个工作簿的字节。
+    进程数为1、工作表较少或进程池不可用时在当前进程逐表解析。
+    """
+    engine = resolve_reader_engine(source, engine)
+    if engine == 'csv':
+        return [('CSV', clean_reservation_sheet(pd.read_csv(io.StringIO(read_csv_text(source))), 'CSV'), None)]
+    
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    with open_excel(source, engine) as excel_file:
+        sheet_names = excel_file.sheet_names
+        workers = min(resolve_workers(workers, PARSE_WORKERS_ENV, DEFAULT_PARSE_WORKERS), len(sheet_names))
+        if workers <= 1 or len(sheet_names) < PARALLEL_MIN_SHEETS:
+            return parse_reservation_sheets(excel_file, sheet_names)
+    
+    batches = [
+        sheet_names[i * len(sheet_names) // workers:(i + 1) * len(sheet_names) // workers]
+        for i in range(workers)
+    ]
+    with ExitStack() as stack:
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+        else:
+            suffix = '.xlsx' if is_xlsx_source(source) else '.xls'
+            tmp = stack.enter_context(tempfile.NamedTemporaryFile(suffix=suffix, delete=False))
+            stack.callback(os.unlink, tmp.name)
+            with tmp:
+                tmp.write(source.getbuffer() if hasattr(source, 'getbuffer') else source_bytes(source))
+            path = tmp.name
+        parse_batch = partial(_parse_sheet_batch, path, engine)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=PROCESS_CONTEXT) as executor:
+                results = list(executor.map(parse_batch, batches))
+        except (OSError, RuntimeError):
+            # 进程池不可用（受限环境等），退回逐表解析
+            results = [parse_batch(batch) for batch in batches]
+    return list(chain.from_iterable(results))
+
+
+def load_reservation_data(source, engine=None, workers=None):
+    """读取并清洗预订数据，按工作表顺序合并所有有数据的工作表
+    
+    解析失败的工作表不会中断读取，记录在结果的 attrs['failed_sheets'] 中（[工作表名, 错误信息]）。
+    """
+    all_sheets_data = []
+    failed_sheets = []
+    for sheet_name, sheet_df, error in read_reservation_sheets(source, engine, workers):
+        if error is not None:
+            failed_sheets.append([sheet_name, error])
+        elif not sheet_df.empty:
+            all_sheets_data.append(sheet_df)
+    
+    if all_sheets_data:
+        # 预计算桌牌号匹配键
+        reservation_df = add_table_key_columns(pd.concat(all_sheets_data, ignore_index=True), '包厢')
+    else:
+        reservation_df = pd.DataFrame()
+    reservation_df.attrs['failed_sheets'] = failed_sheets
+    return reservation_df
+
+
+class DiskFrameCache:
+    """把解析清洗后的DataFrame以Arrow IPC文件保存在本地目录，按总大小淘汰最久未用的文件
+    
+    读取时内存映射文件，不再解析Excel。未安装 pyarrow 或目录不可写时自动停用。
+    """
+    
+    def __init__(self, directory=None, max_bytes=None):
+        if directory is None:
+            directory = os.environ.get(DISK_CACHE_DIR_ENV) or DEFAULT_DISK_CACHE_DIR
+        if max_bytes is None:
+            try:
+                max_mb = float(os.environ.get(DISK_CACHE_MAX_MB_ENV) or DEFAULT_DISK_CACHE_MAX_MB)
+            except ValueError:
+                max_mb = DEFAULT_DISK_CACHE_MAX_MB
+            max_bytes = int(max_mb * 1024 * 1024)
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0 and importlib.util.find_spec('pyarrow') is not None
+        self.lock = threading.Lock()
+    
+    def path_for(self, key):
+        name = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return self.directory / f"{name}.arrow"
+    
+    def load(self, key):
+        """读取缓存文件，不存在或损坏时返回None"""
+        if not self.enabled:
+            return None
+        path = self.path_for(key)
+        if not path.exists():
+            return None
+        try:
+            import pyarrow as pa
+            with pa.memory_map(str(path), 'r') as source:
+                df = pa.ipc.open_file(source).read_all().to_pandas()
+            os.utime(path)
+            return df
+        except (OSError, pa.ArrowException):
+            path.unlink(missing_ok=True)
+            return None
+    
+    def store(self, key, df):
+        """写入缓存文件（先写临时文件再替换），无法转换为Arrow的数据不缓存"""
+        if not self.enabled:
+            return
+        path = self.path_for(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with pa.OSFile(str(tmp_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        except (OSError, pa.ArrowException):
+            tmp_path.unlink(missing_ok=True)
+            return
+        self.evict()
+    
+    def evict(self):
+        """总大小超过上限时按最后使用时间删除最旧的缓存文件"""
+        with self.lock:
+            try:
+                files = [(path.stat(), path) for path in self.directory.glob('*.arrow')]
+            except OSError:
+                return
+            files.sort(key=lambda item: item[0].st_mtime)
+            total = sum(stat.st_size for stat, _ in files)
+            for stat, path in files:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= stat.st_size
+    
+    def clear(self):
+        for path in self.directory.glob('*.arrow'):
+            path.unlink(missing_ok=True)
+
+
+class ParsedFileCache:
+    """按上传文件内容的SHA-256缓存解析清洗后的DataFrame，容量有限，按最近最少使用淘汰
+    
+    内存未命中时再查磁盘缓存，都未命中才解析文件。
+    缓存的DataFrame在会话之间共享，使用方不得原地修改。
+    """
+    
+    def __init__(self, max_entries=PARSE_CACHE_MAX_ENTRIES, disk_cache=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.disk_cache = disk_cache
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    
+    def get_or_load(self, data, loader, **options):
+        """返回(DataFrame, 是否命中缓存)，未命中时调用loader(数据, **options)解析"""
+        key = (loader.__name__, PARSE_CACHE_VERSION, tuple(sorted(options.items())), hashlib.sha256(data).hexdigest())
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key], True
+        
+        df = self.disk_cache.load(key) if self.disk_cache is not None else None
+        if df is not None:
+            with self.lock:
+                self.disk_hits += 1
+                self.remember(key, df)
+            return df, True
+        
+        df = loader(io.BytesIO(data), **options)
+        if self.disk_cache is not None:
+            self.disk_cache.store(key, df)
+        with self.lock:
+            self.misses += 1
+            self.remember(key, df)
+        return df, False
+    
+    def remember(self, key, df):
+        """放入内存缓存（调用方持有锁）"""
+        self.entries[key] = df
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# 进程内共享的上传文件解析缓存，磁盘缓存跨会话和重启保留
+PARSE_CACHE = ParsedFileCache(disk_cache=DiskFrameCache())
+
+
+def resolve_match_workers(workers=None):
+    """确定并行匹配进程数，见 resolve_workers（默认串行）"""
+    return resolve_workers(workers, MATCH_WORKERS_ENV, DEFAULT_MATCH_WORKERS)
+
+
+def _match_partition(partition, top_k=None, tolerance_minutes=None):
+    """进程池任务：匹配单个日期分区批次"""
+    res_part, mt_part = partition
+    return match_reservations(res_part, mt_part, top_k, tolerance_minutes)
+
+
+def match_reservations_parallel(res_df, mt_df, workers=None, min_rows=PARALLEL_MIN_ROWS,
+                                top_k=None, tolerance_minutes=None):
+    """按日期分区并行匹配，结果顺序与串行匹配完全一致
+    
+    每个预订只会与同一下单日期的订单匹配，因此两侧按日期切分后可独立匹配。
+    进程数为1、数据量较小或进程池不可用时退回串行。
+    """
+    workers = resolve_match_workers(workers)
+    match_partition = partial(_match_partition, top_k=top_k, tolerance_minutes=tolerance_minutes)
+    if workers <= 1 or len(res_df) + len(mt_df) < min_rows:
+        return match_partition((res_df, mt_df))
+    
+    res_df = res_df.reset_index(drop=True)
+    res_df['_预订序号'] = range(len(res_df))
+    res_dates = pd.to_datetime(res_df['日期'], errors='coerce').dt.normalize()
+    mt_dates = mt_df['下单时间'].dt.normalize()
+    
+    # 把连续的日期分成若干批，每批作为一个任务，减少任务调度和序列化开销
+    dates = res_dates.dropna().unique()
+    if len(dates) <= 1:
+        return match_partition((res_df, mt_df)).drop(columns=['_预订序号'])
+    batch_count = min(len(dates), workers * 4)
+    date_batches = pd.Series(
+        [i * batch_count // len(dates) for i in range(len(dates))],
+        index=pd.DatetimeIndex(sorted(dates))
+    )
+    res_batch = res_dates.map(date_batches)
+    mt_batch = mt_dates.map(date_batches)
+    
+    mt_groups = {batch: part for batch, part in mt_df.groupby(mt_batch)}
+    partitions = [
+        (part, mt_groups.get(batch, mt_df.iloc[0:0]))
+        for batch, part in res_df.groupby(res_batch)
+    ]
+    # 日期无效的预订不会匹配到任何订单，单独作为一个分区
+    invalid_dates = res_df[res_batch.isna().to_numpy()]
+    if not invalid_dates.empty:
+        partitions.append((invalid_dates, mt_df.iloc[0:0]))
+    
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(partitions)), mp_context=PROCESS_CONTEXT) as executor:
+            results = list(executor.map(match_partition, partitions))
+    except (OSError, RuntimeError):
+        # 进程池不可用（受限环境等），退回串行
+        results = [match_partition(partition) for partition in partitions]
+    
+    # 按原预订顺序合并，同一预订的多条记录保持分区内的订单顺序
+    merged = pd.concat(results, ignore_index=True)
+    merged = merged.sort_values('_预订序号', kind='mergesort', ignore_index=True)
+    return merged.drop(columns=['_预订序号'])
+
+
+def partition_keys(dates, market_periods):
+    """生成(日期, 市别)分区键"""
+    dates = pd.to_datetime(dates, errors='coerce').dt.normalize()
+    return dates.astype(str) + '|' + market_periods.astype(str)
+
+
+def partition_fingerprints(df, keys):
+    """一次性计算所有行的哈希，再按分区汇总为内容指纹（与行索引无关）"""
+    row_hashes = pd.util.hash_pandas_object(df, index=False) if not df.empty else pd.Series(dtype='uint64')
+    columns = '|'.join(str(col) for col in df.columns).encode('utf-8')
+    fingerprints = {}
+    for key, hashes in row_hashes.groupby(keys.to_numpy(), sort=False):
+        digest = hashlib.sha256(columns)
+        digest.update(hashes.to_numpy().tobytes())
+        fingerprints[key] = digest.hexdigest()
+    return fingerprints
+
+
+class PartitionMatchCache:
+    """按(日期, 市别)分区缓存匹配组合，重新匹配时只计算内容变化的分区
+    
+    每个分区只保存分区内的(预订序号, 订单序号, 匹配类型)，不保存结果行；
+    结果每次由当前的预订和订单数据按组合重新组装，缓存只占很少的内存。
+    """
+    
+    def __init__(self):
+        self.partitions = {}
+        self.settings = None
+        self.last_reused = 0
+        self.last_recomputed = 0
+        # 后台任务可能与页面同时使用缓存，匹配过程串行执行
+        self.lock = threading.Lock()
+    
+    def clear(self):
+        with self.lock:
+            self.partitions = {}
+            self.settings = None
+    
+    def memory_bytes(self):
+        """缓存的匹配组合占用的内存"""
+        with self.lock:
+            return sum(
+                res_local.nbytes + mt_local.nbytes + type_codes.nbytes
+                for _, res_local, mt_local, type_codes in self.partitions.values()
+            )
+    
+    def match(self, res_df, mt_df, workers=None, top_k=None, tolerance_minutes=None):
+        """增量匹配，结果与一次性全量匹配完全一致"""
+        with self.lock:
+            return self.match_locked(res_df, mt_df, workers, top_k, tolerance_minutes)
+    
+    def match_locked(self, res_df, mt_df, workers=None, top_k=None, tolerance_minutes=None):
+        settings = (top_k, tolerance_minutes)
+        if settings != self.settings:
+            self.partitions = {}
+            self.settings = settings
+        
+        if not all(col in res_df.columns for col in TABLE_KEY_COLUMNS):
+            res_df = add_table_key_columns(res_df, '桌牌号')
+        if not all(col in mt_df.columns for col in TABLE_KEY_COLUMNS):
+            mt_df = add_table_key_columns(mt_df, '桌牌号')
+        res_df = res_df.reset_index(drop=True)
+        mt_df = mt_df.reset_index(drop=True)
+        res_keys = partition_keys(res_df['日期'], res_df['市别'])
+        mt_keys = partition_keys(mt_df['下单时间'], mt_df['市别'])
+        res_positions = grouped_positions(res_keys)
+        mt_positions = grouped_positions(mt_keys)
+        
+        # 比较每个分区两侧的指纹（编号随整体行位置变化，不计入指纹）
+        id_cols = [ORDER_ID_COLUMN, RESERVATION_ID_COLUMN]
+        res_fingerprints = partition_fingerprints(res_df.drop(columns=id_cols, errors='ignore'), res_keys)
+        mt_fingerprints = partition_fingerprints(mt_df.drop(columns=id_cols, errors='ignore'), mt_keys)
+        
+        fingerprints = {key: (res_fingerprints[key], mt_fingerprints.get(key)) for key in res_positions}
+        changed = [
+            key for key, fingerprint in fingerprints.items()
+            if key not in self.partitions or self.partitions[key][0] != fingerprint
+        ]
+        partitions = {key: self.partitions[key] for key in res_positions if key not in changed}
+        if changed:
+            partitions.update(self.match_partitions(
+                res_df, mt_df, res_keys, mt_keys, changed, fingerprints, workers, top_k, tolerance_minutes
+            ))
+        
+        self.partitions = partitions
+        self.last_reused = len(res_positions) - len(changed)
+        self.last_recomputed = len(changed)
+        
+        # 分区内序号换回整体行位置；每个预订只属于一个分区，按预订位置稳定排序即为全量匹配的顺序
+        res_pos, mt_pos, type_codes = [], [], []
+        for key, (_, res_local, mt_local, codes) in partitions.items():
+            if len(res_local):
+                res_pos.append(res_positions[key][res_local])
+                mt_pos.append(mt_positions[key][mt_local])
+                type_codes.append(codes)
+        pairs = pd.DataFrame({
+            '_res_pos': np.concatenate(res_pos) if res_pos else np.array([], dtype='int64'),
+            '_mt_pos': np.concatenate(mt_pos) if mt_pos else np.array([], dtype='int64'),
+            '匹配类型': pd.Categorical.from_codes(
+                np.concatenate(type_codes) if type_codes else np.array([], dtype='int8'), MATCH_TYPE_LABELS
+            ).astype(object),
+        })
+        pairs = pairs.sort_values('_res_pos', kind='mergesort', ignore_index=True)
+        return build_match_rows(res_df, mt_df, pairs)
+    
+    def match_partitions(self, res_df, mt_df, res_keys, mt_keys, keys, fingerprints, workers, top_k, tolerance_minutes):
+        """匹配指定分区，返回{分区键: (指纹, 分区内预订序号, 分区内订单序号, 匹配类型编码)}"""
+        # 订单ID临时换成分区内订单序号，匹配结果中即可直接读出组合
+        res_changed = res_df.assign(
+            _分区键=res_keys, _分区预订序号=res_df.groupby(res_keys.to_numpy(), sort=False).cumcount()
+        )[res_keys.isin(keys).to_numpy()]
+        mt_changed = mt_df.assign(**{
+            ORDER_ID_COLUMN: pd.array(mt_df.groupby(mt_keys.to_numpy(), sort=False).cumcount(), dtype='Int32')
+        })[mt_keys.isin(keys).to_numpy()]
+        rows = match_reservations_parallel(
+            res_changed, mt_changed, workers, top_k=top_k, tolerance_minutes=tolerance_minutes
+        )
+        rows = rows[rows[ORDER_ID_COLUMN].notna().to_numpy()]
+        
+        empty = (np.array([], dtype='int32'), np.array([], dtype='int32'), np.array([], dtype='int8'))
+        partitions = {key: (fingerprints[key],) + empty for key in keys}
+        for key, part in rows.groupby('_分区键', sort=False):
+            partitions[key] = (
+                fingerprints[key],
+                part['_分区预订序号'].to_numpy(dtype='int32'),
+                part[ORDER_ID_COLUMN].to_numpy(dtype='int32'),
+                pd.Categorical(part['匹配类型'], categories=MATCH_TYPE_LABELS).codes.astype('int8'),
+            )
+        return partitions
+
+
+def grouped_positions(keys):
+    """每个分区键对应的行位置（按行顺序）"""
+    return {key: positions.to_numpy() for key, positions in pd.Series(np.arange(len(keys))).groupby(keys.to_numpy(), sort=False)}
+
+
+def prepare_meituan_orders(meituan_df):
+    """整理美团订单：只保留已结账订单，按下单时间判断市别，返回匹配所需的列
+    
+    订单ID为订单在输入数据中的行位置，过滤后保持不变。
+    """
+    df = meituan_df.copy()
+    df[ORDER_ID_COLUMN] = pd.array(range(len(df)), dtype='Int32')
+    
+    # 数据清洗和预处理
+    df = df[df['订单状态'] == '已结账']
+    
+    # 支付金额通常在加载文件时已解析，缺失时补算
+    if '支付合计' not in df.columns:
+        df['支付合计'] = parse_payment_amounts(df['结账方式'])
+    # 去掉营业日期为 '--' 的占位行（load_meituan_data 读取时已去掉）；其他营业日期为空的订单仍按下单时间参与匹配
+    if not pd.api.types.is_datetime64_any_dtype(df['营业日期']):
+        df = df[df['营业日期'].astype(str).str.strip() != '--']
+    # 日期列通常在加载文件时已按结构转换，此处不会重复解析
+    df['营业日期'] = parse_datetimes(df['营业日期'], date_only=True)
+    df['下单时间'] = parse_datetimes(df['下单时间'])
+    
+    # 根据下单时间判断市别 - 午市: 6:00-16:00, 晚市: 16:00-24:00
+    hour = df['下单时间'].dt.hour
+    df['市别'] = None
+    df.loc[(hour >= 6) & (hour < 16), '市别'] = '午市'
+    df.loc[(hour >= 16) & (hour <= 23), '市别'] = '晚市'
+    
+    # 选择需要的列，保留下单时间和结账方式用于显示
+    if not all(col in df.columns for col in TABLE_KEY_COLUMNS):
+        df = add_table_key_columns(df, '桌牌号')
+    mt_df = df[['营业日期', '桌牌号', '下单时间', '支付合计', '市别', '结账方式', ORDER_ID_COLUMN] + TABLE_KEY_COLUMNS].copy()
+    # 过滤掉非营业时间的订单
+    mt_df = mt_df[mt_df['市别'].notna()]
+    
+    # 格式化下单时间为更易读的格式
+    mt_df['下单时间_格式化'] = mt_df['下单时间'].dt.strftime('%H:%M:%S')
+    return mt_df
+
+
+def prepare_reservations(day_df):
+    """清洗预订数据并统一列名，缺少匹配所需列时返回None"""
+    # 数据清洗
+    day_df = day_df[day_df['姓名'].notna() & day_df['预订人'].notna()].copy()
+    
+    # 预订人标准名（按别名表统一同一人的不同写法）
+    day_df[CANONICAL_NAME_COLUMN] = canonical_names(day_df['预订人'])
+    
+    # 选择和重命名列
+    available_cols = ['日期', '市别', '包厢', '姓名', '预订人', '经手人', CANONICAL_NAME_COLUMN] + TABLE_KEY_COLUMNS
+    existing_cols = [col for col in available_cols if col in day_df.columns]
+    day_df = day_df[existing_cols].copy()
+    
+    # 标准化列名
+    col_mapping = {'包厢': '桌牌号', '姓名': '客户姓名'}
+    day_df.rename(columns=col_mapping, inplace=True)
+    
+    if not all(col in day_df.columns for col in ['日期', '桌牌号', '市别']):
+        return None
+    if not all(col in day_df.columns for col in TABLE_KEY_COLUMNS):
+        day_df = add_table_key_columns(day_df, '桌牌号')
+    
+    # 处理日期
+    day_df['日期'] = parse_datetimes(day_df['日期'], date_only=True)
+    return day_df
+
+
+def match_prepared_data(mt_df, reservation_frames, workers=None, top_k=None, tolerance_minutes=None, cache=None):
+    """合并已整理的预订数据并一次性连接匹配，添加匹配状态并排序
+    
+    cache为 PartitionMatchCache 时只重新匹配内容变化的分区，否则直接并行匹配。
+    合并后的预订按顺序编号（预订ID），结果每行按顺序编号作为索引（记录ID）。
+    """
+    merged_all = pd.DataFrame()
+    if reservation_frames:
+        reservations = pd.concat(reservation_frames, ignore_index=True)
+        reservations[RESERVATION_ID_COLUMN] = pd.array(range(len(reservations)), dtype='int32')
+        if not reservations.empty:
+            match = cache.match if cache is not None else match_reservations_parallel
+            merged_all = match(reservations, mt_df, workers, top_k=top_k, tolerance_minutes=tolerance_minutes)
+    
+    # 数据后处理
+    if not merged_all.empty:
+        # 添加匹配状态列（支付合计保持数值类型，仅在显示和导出时格式化）
+        merged_all['匹配状态'] = merged_all['支付合计'].notna().map({True: '已匹配', False: '未匹配'})
+            
+        # 排序
+        sort_cols = []
+        if '日期' in merged_all.columns:
+            sort_cols.append('日期')
+        if '桌牌号' in merged_all.columns:
+            sort_cols.append('桌牌号')
+        if sort_cols:
+            merged_all.sort_values(sort_cols, inplace=True, ignore_index=True)
+    
+    merged_all = compact_result_frame(merged_all)
+    merged_all.index = pd.RangeIndex(len(merged_all), name=ROW_ID_NAME)
+    return merged_all
+
+
+def run_matching(meituan_df, reservation_df, workers=None, top_k=None, tolerance_minutes=None, cache=None):
+    """完整匹配流程，不依赖界面：整理 load_meituan_data 和 load_reservation_data 的结果并匹配
+    
+    预订数据缺少必要列时抛出ValueError。
+    """
+    missing_cols = [col for col in RESERVATION_REQUIRED_COLUMNS if col not in reservation_df.columns]
+    if missing_cols:
+        raise ValueError(f"预订文件缺少必要列: {missing_cols}")
+    
+    reservations = prepare_reservations(reservation_df)
+    return match_prepared_data(
+        prepare_meituan_orders(meituan_df),
+        [reservations] if reservations is not None else [],
+        workers, top_k, tolerance_minutes, cache
+    )
+
+
+def frame_fingerprint(df):
+    """DataFrame内容指纹（列名、类型和全部单元格，与行索引无关）"""
+    digest = hashlib.sha256('|'.join(f"{col}:{dtype}" for col, dtype in df.dtypes.items()).encode('utf-8'))
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+class MatchResultCache:
+    """按两份输入数据的内容指纹和匹配设置缓存完整匹配结果，跨会话共享
+    
+    总内存不超过上限，超出时按最近最少使用淘汰。取出的是副本，会话之间互不影响；
+    同一组输入同时被多个会话提交时只计算一次，其余会话等待并复用结果。
+    """
+    
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = env_megabytes(RESULT_CACHE_MAX_MB_ENV, DEFAULT_RESULT_CACHE_MAX_MB)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.key_locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(meituan_df, reservation_df, top_k=None, tolerance_minutes=None):
+        return (frame_fingerprint(meituan_df), frame_fingerprint(reservation_df), top_k, tolerance_minutes)
+    
+    def get(self, key):
+        """返回缓存结果的副本，未命中返回None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy()
+    
+    def put(self, key, result_df):
+        """保存一份结果副本，单个结果超过上限时不缓存"""
+        size = frame_memory_bytes(result_df)
+        if size > self.max_bytes:
+            return
+        result_df = result_df.copy()
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (result_df, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+    
+    def get_or_match(self, meituan_df, reservation_df, workers=None, top_k=None, tolerance_minutes=None, cache=None):
+        """返回(匹配结果, 是否命中缓存)，未命中时调用 run_matching 并保存结果"""
+        if self.max_bytes <= 0:
+            return run_matching(meituan_df, reservation_df, workers, top_k, tolerance_minutes, cache), False
+        
+        key = self.make_key(meituan_df, reservation_df, top_k, tolerance_minutes)
+        result = self.get(key)
+        if result is not None:
+            return result, True
+        
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                # 等待期间其他会话可能已算完同一组输入
+                result = self.get(key)
+                if result is not None:
+                    return result, True
+                result = run_matching(meituan_df, reservation_df, workers, top_k, tolerance_minutes, cache)
+                self.put(key, result)
+                with self.lock:
+                    self.misses += 1
+                return result, False
+        finally:
+            with self.lock:
+                if self.key_locks.get(key) is key_lock and not key_lock.locked():
+                    del self.key_locks[key]
+    
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+
+# 进程内共享的匹配结果缓存：多个会话上传同一组文件时只匹配一次
+MATCH_RESULTS = MatchResultCache()
+
+
+def order_result_values(order, order_id=None):
+    """美团订单（Series或dict）对应写入结果行的值，order_id默认取订单的订单ID列；缺失的值保持为空"""
+    order_time = pd.to_datetime(order.get('下单时间'), errors='coerce')
+    return {
+        '支付合计': order.get('支付合计'),
+        '下单时间': order_time,
+        '下单时间_格式化': order_time.strftime('%H:%M:%S') if pd.notna(order_time) else None,
+        '结账方式': order.get('结账方式'),
+        ORDER_ID_COLUMN: order_id if order_id is not None else order.get(ORDER_ID_COLUMN),
+    }
+
+
+def apply_match_edit(df, edit):
+    """在结果上执行一条手动编辑，返回编辑后的结果（可能是新的DataFrame）
+    
+    unmatch：清空该行的订单信息并标记为未匹配；
+    match：第一个订单写入该行，其余订单复制该行追加，行号为 edit['added_ids']，匹配类型均为手动匹配。
+    """
+    row_id = edit['row_id']
+    if edit['kind'] == 'unmatch':
+        for col in ORDER_RESULT_COLUMNS:
+            if col in df.columns:
+                df.at[row_id, col] = None
+        df.at[row_id, '匹配状态'] = '未匹配'
+        df.at[row_id, '匹配类型'] = '未匹配'
+        return df
+    
+    orders = edit['orders']
+    extra = df.loc[[row_id] * (len(orders) - 1)]
+    for col, value in orders[0].items():
+        df.at[row_id, col] = value
+    df.at[row_id, '匹配状态'] = '已匹配'
+    df.at[row_id, '匹配类型'] = '手动匹配'
+    if extra.empty:
+        return df
+    extra = extra.copy()
+    extra.index = pd.Index(edit['added_ids'], dtype=df.index.dtype, name=df.index.name)
+    for col in ORDER_RESULT_COLUMNS:
+        extra[col] = [order[col] for order in orders[1:]]
+    extra['匹配状态'] = '已匹配'
+    extra['匹配类型'] = '手动匹配'
+    return compact_result_frame(pd.concat([df, extra]))
+
+
+def revert_match_edit(df, edit):
+    """撤销一条手动编辑：删除追加的行，并恢复该行编辑前的值"""
+    if edit.get('added_ids'):
+        df = df.drop(index=edit['added_ids'])
+    for col, value in edit['before'].items():
+        df.at[edit['row_id'], col] = value
+    return df
+
+
+class MatchEditLog:
+    """手动匹配/移除匹配的编辑记录，按结果行号记录，支持撤销和重做
+    
+    当前结果 = 自动匹配结果 + 前 cursor 条编辑。每条编辑只保存涉及的行号、订单值和该行编辑前的值，
+    撤销时据此还原，不需要保留一份完整的原始结果。撤销后再做新的编辑会丢弃被撤销的记录。
+    """
+    
+    def __init__(self):
+        self.entries = []
+        self.cursor = 0
+    
+    @property
+    def can_undo(self):
+        return self.cursor > 0
+    
+    @property
+    def can_redo(self):
+        return self.cursor < len(self.entries)
+    
+    def record(self, df, kind, row_id, orders=None):
+        """记录并执行一条编辑，返回编辑后的结果；kind为'match'时orders为订单值列表（见 order_result_values）"""
+        edit = {
+            'kind': kind,
+            'row_id': row_id,
+            'orders': list(orders or []),
+            'before': {col: df.at[row_id, col] for col in EDIT_COLUMNS if col in df.columns},
+            'added_ids': [],
+            'replaces': None,
+        }
+        if kind == 'match':
+            # 手动匹配写入刚移除匹配的行时，记下被移除的订单，保存后重新匹配时据此找回同一行
+            previous = next((e for e in reversed(self.entries[:self.cursor]) if e['row_id'] == row_id), None)
+            if previous is not None and previous['kind'] == 'unmatch':
+                edit['replaces'] = {col: previous['before'].get(col) for col in ORDER_KEY_COLUMNS}
+        if kind == 'match' and len(edit['orders']) > 1:
+            next_id = int(df.index.max()) + 1
+            edit['added_ids'] = list(range(next_id, next_id + len(edit['orders']) - 1))
+        del self.entries[self.cursor:]
+        self.entries.append(edit)
+        return self.redo(df)
+    
+    def undo(self, df):
+        if not self.can_undo:
+            return df
+        self.cursor -= 1
+        return revert_match_edit(df, self.entries[self.cursor])
+    
+    def redo(self, df):
+        if not self.can_redo:
+            return df
+        df = apply_match_edit(df, self.entries[self.cursor])
+        self.cursor += 1
+        return df
+    
+    def applied(self):
+        """当前生效的编辑（不含已撤销的）"""
+        return self.entries[:self.cursor]
+    
+    def clear(self):
+        self.entries = []
+        self.cursor = 0
+
+
+def identity_keys(df, columns):
+    """按指定列计算每行的身份键（16位十六进制），日期按值比较，与文本写法和行号无关"""
+    parts = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if col in ('日期', '下单时间'):
+            values = parse_datetimes(values, date_only=col == '日期').dt.strftime('%Y-%m-%d %H:%M:%S')
+        parts[col] = values.astype(object).where(values.notna(), '').astype(str)
+    frame = pd.DataFrame(parts, index=df.index)
+    return pd.util.hash_pandas_object(frame, index=False).map('{:016x}'.format)
+
+
+def edit_overrides(df, edit):
+    """把一条手动编辑转换为持久化记录：预订身份键 + 订单身份键 + 订单值 + 预订信息
+    
+    手动匹配写入的是刚移除匹配的行时，replaces为被移除订单的身份键。
+    """
+    reservation_key = identity_keys(df.loc[[edit['row_id']]], RESERVATION_KEY_COLUMNS).iloc[0]
+    row = df.loc[edit['row_id']]
+    booking = {}
+    for name, col in OVERRIDE_BOOKING_COLUMNS.items():
+        value = row.get(col)
+        if pd.isna(value):
+            booking[name] = None
+        elif col == '日期':
+            booking[name] = pd.Timestamp(value).strftime('%Y-%m-%d')
+        else:
+            booking[name] = str(value)
+    replaces = None
+    if edit.get('replaces'):
+        replaced = pd.DataFrame([edit['replaces']], columns=ORDER_KEY_COLUMNS)
+        replaced['下单时间'] = pd.to_datetime(replaced['下单时间'], errors='coerce')
+        replaces = identity_keys(replaced, ORDER_KEY_COLUMNS).iloc[0]
+    if edit['kind'] == 'unmatch':
+        orders = pd.DataFrame([{col: edit['before'].get(col) for col in ORDER_RESULT_COLUMNS}])
+    else:
+        orders = pd.DataFrame(edit['orders'], columns=ORDER_RESULT_COLUMNS)
+    orders['下单时间'] = pd.to_datetime(orders['下单时间'], errors='coerce')
+    order_keys = identity_keys(orders, ORDER_KEY_COLUMNS)
+    
+    overrides = []
+    for seq, (order_key, order) in enumerate(zip(order_keys, orders.to_dict('records'))):
+        # 移除匹配也保存订单值，只用于列表显示
+        order_time = order.get('下单时间')
+        overrides.append({
+            'kind': edit['kind'],
+            'reservation_key': reservation_key,
+            'order_key': order_key,
+            'seq': seq,
+            'amount': None if pd.isna(order.get('支付合计')) else float(order['支付合计']),
+            'order_time': order_time.isoformat() if pd.notna(order_time) else None,
+            'payment': None if pd.isna(order.get('结账方式')) else order['结账方式'],
+            'replaces': replaces,
+            **booking,
+        })
+    return overrides
+
+
+def apply_overrides(df, overrides, orders=None):
+    """把保存的手动修改批量套用到自动匹配结果上，返回(结果, 套用条数)
+    
+    先按（预订, 订单）清除被移除的匹配，再把手动匹配的订单写入该预订未匹配的行：
+    写入刚移除匹配的行的手动匹配按（预订, 被移除的订单）找回该行；其余的按保存顺序
+    依次对应该预订剩下的各个未匹配行。每次的第一个订单写入对应行，其余订单追加行。
+    订单已被其他预订匹配、或找不到对应的未匹配行时跳过。
+    overrides需保持保存顺序（见 MatchOverrideStore.load）。
+    orders为本次的美团订单（读取结果），用于按订单身份键查回订单ID。
+    """
+    if df.empty or overrides.empty:
+        return df, 0
+    df = df.copy()
+    reservation_keys = identity_keys(df, RESERVATION_KEY_COLUMNS)
+    order_keys = identity_keys(df, ORDER_KEY_COLUMNS)
+    matched = df['匹配状态'] == '已匹配'
+    
+    removed = overrides[overrides['kind'] == 'unmatch']
+    pair_keys = reservation_keys + order_keys
+    unmatch_mask = matched & pair_keys.isin(removed['reservation_key'] + removed['order_key'])
+    freed_rows = pd.Series(df.index[unmatch_mask], index=pair_keys[unmatch_mask].to_numpy())
+    freed_rows = freed_rows[~freed_rows.index.duplicated()]
+    if unmatch_mask.any():
+        df.loc[unmatch_mask, ORDER_RESULT_COLUMNS] = None
+        df.loc[unmatch_mask, '匹配状态'] = '未匹配'
+        df.loc[unmatch_mask, '匹配类型'] = '未匹配'
+        matched = matched & ~unmatch_mask
+    
+    # 每次手动匹配的订单按序号递增连续保存：预订改变或序号不再递增处开始新的一次（部分记录可能已被删除）
+    added = overrides[overrides['kind'] == 'match'].reset_index(drop=True)
+    previous = added[['reservation_key', 'seq']].shift()
+    starts = (added['reservation_key'] != previous['reservation_key']) | ~(added['seq'] > previous['seq'])
+    added = added.assign(_次=starts.cumsum())
+    replaces = added['replaces'] if 'replaces' in added.columns else pd.Series(None, index=added.index, dtype=object)
+    linked = replaces.notna()
+    added['row_id'] = (added['reservation_key'] + replaces.fillna('')).where(linked).map(freed_rows)
+    
+    # 其余的手动匹配：同一预订的第n次对应其第n个未被占用的未匹配行
+    open_rows = reservation_keys[~matched & ~reservation_keys.index.isin(added['row_id'].dropna())]
+    target_rows = pd.Series(
+        open_rows.index, index=pd.MultiIndex.from_arrays([open_rows.to_numpy(), open_rows.groupby(open_rows).cumcount()])
+    )
+    unlinked = added[~linked]
+    slots = unlinked.groupby('reservation_key')['_次'].rank(method='dense').astype(int) - 1
+    added.loc[~linked, 'row_id'] = target_rows.reindex(
+        pd.MultiIndex.from_arrays([unlinked['reservation_key'], slots])
+    ).to_numpy()
+    
+    added = added[~added['order_key'].isin(order_keys[matched])]
+    added = added.dropna(subset=['row_id']).sort_values(['row_id', 'seq'], kind='mergesort')
+    if added.empty:
+        return df, int(unmatch_mask.sum())
+    
+    added['row_id'] = added['row_id'].astype(df.index.dtype)
+    order_time = pd.to_datetime(added['order_time'], errors='coerce')
+    values = pd.DataFrame({
+        '支付合计': added['amount'].to_numpy(),
+        '下单时间': order_time.to_numpy(),
+        '下单时间_格式化': order_time.dt.strftime('%H:%M:%S').to_numpy(),
+        '结账方式': added['payment'].to_numpy(),
+        ORDER_ID_COLUMN: pd.array([pd.NA] * len(added), dtype='Int32'),
+    })
+    if orders is not None and not orders.empty:
+        ids = orders[ORDER_ID_COLUMN] if ORDER_ID_COLUMN in orders.columns else pd.Series(range(len(orders)))
+        ids = pd.Series(ids.to_numpy(), index=identity_keys(orders, ORDER_KEY_COLUMNS).to_numpy())
+        ids = ids[~ids.index.duplicated()]
+        values[ORDER_ID_COLUMN] = pd.array(added['order_key'].map(ids).to_numpy(), dtype='Int32')
+    first = ~added['row_id'].duplicated().to_numpy()
+    first_rows = added['row_id'].to_numpy()[first]
+    for col in ORDER_RESULT_COLUMNS:
+        df.loc[first_rows, col] = values.loc[first, col].to_numpy()
+    df.loc[first_rows, '匹配状态'] = '已匹配'
+    df.loc[first_rows, '匹配类型'] = '手动匹配'
+    
+    if not first.all():
+        extra = df.loc[added['row_id'].to_numpy()[~first]].copy()
+        next_id = int(df.index.max()) + 1
+        extra.index = pd.RangeIndex(next_id, next_id + len(extra), name=df.index.name)
+        for col in ORDER_RESULT_COLUMNS:
+            extra[col] = values.loc[~first, col].to_numpy()
+        extra['匹配状态'] = '已匹配'
+        extra['匹配类型'] = '手动匹配'
+        df = compact_result_frame(pd.concat([df, extra]))
+    return df, int(unmatch_mask.sum()) + len(added)
+
+
+def describe_overrides(overrides):
+    """保存的手动修改整理为可读的列表（每个订单一行），编号用于删除单条记录"""
+    columns = ['编号', '操作', '日期', '市别', '桌牌号', '预订人', '下单时间', '支付合计', '结账方式', '保存时间']
+    if overrides.empty:
+        return pd.DataFrame(columns=columns)
+    booking = {
+        col: (overrides[name] if name in overrides.columns else pd.Series(None, index=overrides.index, dtype=object))
+        for name, col in OVERRIDE_BOOKING_COLUMNS.items()
+    }
+    # 旧版本保存的记录没有预订信息，以预订身份键前8位区分
+    missing = pd.concat(booking.values(), axis=1).isna().all(axis=1)
+    booking['预订人'] = booking['预订人'].where(~missing, '#' + overrides['reservation_key'].str[:8])
+    return pd.DataFrame({
+        '编号': overrides['id'],
+        '操作': overrides['kind'].map(OVERRIDE_KIND_LABELS),
+        **{col: values.fillna('') for col, values in booking.items()},
+        '下单时间': overrides['order_time'].fillna('').str.replace('T', ' '),
+        '支付合计': overrides['amount'].map(format_amount),
+        '结账方式': overrides['payment'].fillna(''),
+        '保存时间': overrides['created_at'],
+    }, columns=columns)
+
+
+class MatchOverrideStore:
+    """手动修改的SQLite存储，按预订和订单的身份键保存，跨会话、跨重启保留
+    
+    同一对（预订, 订单）只保留最后一次操作。文件不可写时不保存，匹配照常进行。
+    """
+    
+    def __init__(self, path=None):
+        if path is None:
+            path = os.environ.get(OVERRIDE_DB_ENV) or DEFAULT_OVERRIDE_DB
+        self.path = Path(path)
+        self.lock = threading.Lock()
+    
+    def connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        columns = ', '.join(f"{name} {sql_type}" for name, sql_type in OVERRIDE_TABLE_COLUMNS.items())
+        conn.execute(f"CREATE TABLE IF NOT EXISTS overrides ({columns}, PRIMARY KEY (reservation_key, order_key))")
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(overrides)")}
+        for name, sql_type in OVERRIDE_TABLE_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE overrides ADD COLUMN {name} {sql_type}")
+        return conn
+    
+    def add(self, overrides):
+        """保存手动修改（覆盖同一对预订和订单之前的记录），返回是否保存成功"""
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        names = list(OVERRIDE_TABLE_COLUMNS)
+        rows = [tuple(created_at if name == 'created_at' else o.get(name) for name in names) for o in overrides]
+        statement = f"INSERT OR REPLACE INTO overrides ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+        try:
+            with self.lock, closing(self.connect()) as conn, conn:
+                conn.executemany(statement, rows)
+        except (OSError, sqlite3.Error):
+            return False
+        return True
+    
+    def remove(self, overrides):
+        """删除手动修改（撤销时调用），返回是否成功"""
+        rows = [(o['kind'], o['reservation_key'], o['order_key']) for o in overrides]
+        try:
+            with self.lock, closing(self.connect()) as conn, conn:
+                conn.executemany(
+                    "DELETE FROM overrides WHERE kind = ? AND reservation_key = ? AND order_key = ?", rows
+                )
+        except (OSError, sqlite3.Error):
+            return False
+        return True
+    
+    def load(self):
+        """按保存顺序读取全部手动修改（id为记录编号，用于 delete），无法读取时返回空表"""
+        try:
+            with self.lock, closing(self.connect()) as conn:
+                return pd.read_sql_query("SELECT rowid AS id, * FROM overrides ORDER BY created_at, rowid", conn)
+        except (OSError, sqlite3.Error, pd.errors.DatabaseError):
+            return pd.DataFrame()
+    
+    def apply(self, result_df, orders=None):
+        """套用全部保存的手动修改，返回(结果, 套用条数)，见 apply_overrides"""
+        return apply_overrides(result_df, self.load(), orders)
+    
+    def delete(self, ids):
+        """按编号（见 load）删除手动修改，返回删除的条数，无法写入时返回None"""
+        try:
+            with self.lock, closing(self.connect()) as conn, conn:
+                return conn.executemany("DELETE FROM overrides WHERE rowid = ?", [(int(i),) for i in ids]).rowcount
+        except (OSError, sqlite3.Error):
+            return None
+    
+    def clear(self):
+        """删除全部手动修改，返回删除的条数，无法写入时返回None"""
+        try:
+            with self.lock, closing(self.connect()) as conn, conn:
+                return conn.execute("DELETE FROM overrides").rowcount
+        except (OSError, sqlite3.Error):
+            return None
+
+
+# 进程内共享的手动修改存储
+MATCH_OVERRIDES = MatchOverrideStore()
+
+
+def match_summary(result_df):
+    """匹配结果统计：总数、已匹配数、各匹配类型数量、匹配金额及各预订人（标准名）的匹配情况"""
+    if result_df.empty:
+        return {'total': 0, 'matched': 0, 'unmatched': 0, 'match_rate': 0.0,
+                'match_types': {}, 'matched_amount': 0.0, 'bookers': []}
+    
+    matched = result_df[result_df['匹配状态'] == '已匹配']
+    type_counts = result_df['匹配类型'].value_counts()
+    name_col = CANONICAL_NAME_COLUMN if CANONICAL_NAME_COLUMN in matched.columns else '预订人'
+    bookers = matched.groupby(name_col, observed=True)['支付合计'].agg(['count', 'sum'])
+    bookers = bookers.sort_values('sum', ascending=False)
+    return {
+        'total': len(result_df),
+        'matched': len(matched),
+        'unmatched': len(result_df) - len(matched),
+        'match_rate': round(len(matched) / len(result_df) * 100, 1),
+        'match_types': {str(label): int(count) for label, count in type_counts[type_counts > 0].items()},
+        'matched_amount': round(float(matched['支付合计'].sum()), 2),
+        'bookers': [
+            {'name': str(name), 'matched': int(row['count']), 'amount': round(float(row['sum']), 2)}
+            for name, row in bookers.iterrows()
+        ],
+    }
+
+
+def build_export_frame(export_df):
+    """整理导出的列（下单时间、预订人、桌牌号、支付合计、结账方式、匹配类型），按下单时间排序"""
+    # 准备导出的列
+    export_columns = ['下单时间', '预订人', '桌牌号', '支付合计', '结账方式', '匹配类型']
+    
+    # 检查并选择可用的列
+    available_columns = []
+    for col in export_columns:
+        if col in export_df.columns:
+            available_columns.append(col)
+        elif col == '预订人' and '客户姓名' in export_df.columns:
+            available_columns.append('客户姓名')
+            export_df = export_df.rename(columns={'客户姓名': '预订人'})
+    
+    # 创建导出用的DataFrame
+    final_export_df = export_df[available_columns].copy()
+    
+    # 按日期排序（如果有下单时间列）
+    if '下单时间' in final_export_df.columns:
+        final_export_df = final_export_df.sort_values('下单时间')
+    return final_export_df
+
+
+def export_excel_bytes(final_export_df):
+    """生成带格式的匹配结果Excel文件内容"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        final_export_df.to_excel(writer, sheet_name='匹配结果', index=False)
+        
+        # 获取工作表并设置格式
+        worksheet = writer.sheets['匹配结果']
+        
+        # 设置Excel格式
+        from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
+        
+        # 定义样式
+        header_font = Font(bold=True, size=12)
+        header_fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
+        center_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+        border = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+        
+        # 设置表头样式
+        for cell in worksheet[1]:
+            cell.font = header_font
+            cell.fill = header_fill
+            cell.alignment = center_alignment
+            cell.border = border
+        
+        # 设置数据行样式
+        for row in worksheet.iter_rows(min_row=2):
+            for cell in row:
+                cell.alignment = center_alignment
+                cell.border = border
+        
+        # 支付合计以数值写入，只设置显示格式
+        if '支付合计' in final_export_df.columns:
+            amount_col = final_export_df.columns.get_loc('支付合计') + 1
+            for row in worksheet.iter_rows(min_row=2, min_col=amount_col, max_col=amount_col):
+                for cell in row:
+                    cell.number_format = '0.00'
+        
+        # 智能调整列宽
+        for column in worksheet.columns:
+            max_length = 0
+            column_letter = column[0].column_letter
+            
+            # 计算列的最大内容长度
+            for cell in column:
+                try:
+                    cell_value = str(cell.value) if cell.value is not None else ""
+                    # 中文字符按2个字符计算宽度
+                    char_count = sum(2 if ord(char) > 127 else 1 for char in cell_value)
+                    if char_count > max_length:
+                        max_length = char_count
+                except:
+                    pass
+            
+            # 根据列内容设置合适的宽度
+            if column_letter == 'A':  # 下单时间列
+                adjusted_width = max(22, min(max_length + 4, 28))
+            elif column_letter == 'B':  # 预订人列
+                adjusted_width = max(15, min(max_length + 3, 25))
+            elif column_letter == 'C':  # 桌牌号列
+                adjusted_width = max(12, min(max_length + 3, 18))
+            elif column_letter == 'D':  # 支付合计列
+                adjusted_width = max(15, min(max_length + 3, 22))
+            elif column_letter == 'E':  # 结账方式列
+                adjusted_width = max(25, min(max_length + 5, 40))  # 增加结账方式列宽度
+            elif column_letter == 'F':  # 匹配类型列
+                adjusted_width = max(12, min(max_length + 3, 18))
+            else:
+                adjusted_width = max(15, min(max_length + 3, 35))
+            
+            worksheet.column_dimensions[column_letter].width = adjusted_width
+        
+        # 设置行高
+        for row in range(1, worksheet.max_row + 1):
+            worksheet.row_dimensions[row].height = 35  # 增加行高以适应多行内容
+        
+        # 特别处理表头行高
+        worksheet.row_dimensions[1].height = 30
+    return output.getvalue()
+
+
+def export_result_bytes(result_df, file_format='xlsx', all_records=False):
+    """按格式（见 EXPORT_FORMATS）生成结果文件内容，返回(字节, 行数)
+    
+    默认只导出已匹配记录，列和Excel格式与网页版导出相同；all_records为True时导出全部记录（不含内部预计算列）。
+    """
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {file_format}（可选 {'/'.join(EXPORT_FORMATS)}）")
+    if all_records:
+        output_df = result_df.drop(columns=TABLE_KEY_COLUMNS, errors='ignore')
+    else:
+        output_df = build_export_frame(result_df[result_df['匹配状态'] == '已匹配'])
+    
+    if file_format == 'csv':
+        return output_df.to_csv(index=False).encode('utf-8-sig'), len(output_df)
+    output = io.BytesIO()
+    if file_format == 'parquet':
+        output_df.to_parquet(output, index=False)
+    elif all_records:
+        output_df.to_excel(output, sheet_name='匹配结果', index=False)
+    else:
+        return export_excel_bytes(output_df), len(output_df)
+    return output.getvalue(), len(output_df)
+
+
+class MatchJob:
+    """后台匹配任务：状态、进度和结果"""
+    
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = 'queued'
+        self.stage = JOB_STATUS_LABELS['queued']
+        self.progress = 0.0
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.result_bytes = 0
+        self.summary = None
+        self.message = None
+        self.error = None
+    
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+    
+    @property
+    def result_available(self):
+        return self.result is not None
+    
+    def release_result(self):
+        """释放结果数据，任务状态和统计仍保留"""
+        self.result = None
+        self.result_bytes = 0
+    
+    def report(self, stage, progress):
+        """任务执行中更新当前阶段和进度（0~1）"""
+        self.stage = stage
+        self.progress = progress
+    
+    def to_dict(self):
+        """任务状态（不含结果数据），用于接口返回"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'status_label': JOB_STATUS_LABELS[self.status],
+            'stage': self.stage,
+            'progress': round(self.progress, 2),
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'message': self.message,
+            'error': self.error,
+            'summary': self.summary,
+            'result_available': self.result_available,
+        }
+
+
+class MatchJobManager:
+    """后台匹配任务队列：提交后立即返回任务编号，由线程池执行，按编号查询进度和结果
+    
+    任务在进程内共享，不依赖页面会话，页面刷新或重连后仍可按编号取回结果。
+    已结束任务的结果按总内存上限和保留时长释放，释放后只能查询状态。
+    """
+    
+    def __init__(self, max_workers=None, keep_finished=MATCH_JOB_KEEP_FINISHED, result_max_bytes=None,
+                 result_ttl=MATCH_JOB_RESULT_TTL):
+        self.max_workers = resolve_workers(max_workers or os.environ.get(MATCH_JOB_WORKERS_ENV) or DEFAULT_MATCH_JOB_WORKERS)
+        self.keep_finished = keep_finished
+        if result_max_bytes is None:
+            result_max_bytes = env_megabytes(MATCH_JOB_RESULT_MAX_MB_ENV, DEFAULT_MATCH_JOB_RESULT_MAX_MB)
+        self.result_max_bytes = result_max_bytes
+        self.result_ttl = result_ttl
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.executor = None
+    
+    def submit(self, task, *args, **kwargs):
+        """提交任务，返回任务编号；task(job, *args, **kwargs) 返回匹配结果DataFrame"""
+        job = MatchJob(uuid.uuid4().hex[:12])
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='match-job')
+            self.jobs[job.id] = job
+        self.executor.submit(self.run, job, task, args, kwargs)
+        return job.id
+    
+    def run(self, job, task, args, kwargs):
+        job.status = 'running'
+        job.started_at = time.time()
+        job.report(JOB_STATUS_LABELS['running'], 0.05)
+        try:
+            result = task(job, *args, **kwargs)
+            job.summary = match_summary(result)
+            job.result = result
+            job.result_bytes = frame_memory_bytes(result)
+            job.status = 'done'
+            job.report(JOB_STATUS_LABELS['done'], 1.0)
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+            job.report(JOB_STATUS_LABELS['failed'], 1.0)
+        finally:
+            job.finished_at = time.time()
+            self.prune()
+    
+    def get(self, job_id):
+        """按编号查询任务，不存在（或已被清理）时返回None"""
+        self.prune()
+        with self.lock:
+            return self.jobs.get(job_id)
+    
+    def result_bytes(self):
+        """已结束任务保留的结果占用的内存"""
+        with self.lock:
+            return sum(job.result_bytes for job in self.jobs.values())
+    
+    def prune(self):
+        """只保留最近结束的若干个任务；结果超过保留时长或总内存上限时，从最早结束的任务开始释放"""
+        now = time.time()
+        with self.lock:
+            finished = sorted((job for job in self.jobs.values() if job.finished), key=lambda job: job.finished_at or now)
+            for job in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self.jobs[job.id]
+            finished = finished[max(0, len(finished) - self.keep_finished):]
+            
+            retained = [job for job in finished if job.result_available]
+            for job in retained:
+                if now - (job.finished_at or now) > self.result_ttl:
+                    job.release_result()
+            retained = [job for job in retained if job.result_available]
+            total = sum(job.result_bytes for job in retained)
+            for job in retained[:-1]:
+                if total <= self.result_max_bytes:
+                    break
+                total -= job.result_bytes
+                job.release_result()
+
+
+def match_job(job, meituan_df, reservation_df, workers=None, top_k=None, tolerance_minutes=None, cache=None):
+    """后台任务：匹配已读取的数据"""
+    job.report("匹配中", 0.3)
+    result, _ = MATCH_RESULTS.get_or_match(meituan_df, reservation_df, workers, top_k, tolerance_minutes, cache)
+    job.report("整理结果", 0.9)
+    result, _ = MATCH_OVERRIDES.apply(result, meituan_df)
+    return result
+
+
+def match_upload_job(job, meituan_data, reservation_data, engine=None, **settings):
+    """后台任务：读取上传的文件内容（经过解析缓存）后匹配"""
+    job.report("读取美团订单", 0.1)
+    meituan_df, _ = PARSE_CACHE.get_or_load(meituan_data, load_meituan_data, engine=engine)
+    job.report("读取预订记录", 0.2)
+    reservation_df, _ = PARSE_CACHE.get_or_load(reservation_data, load_reservation_data, engine=engine)
+    if meituan_df.empty or reservation_df.empty:
+        raise ValueError("上传的文件为空，请检查文件内容")
+    return match_job(job, meituan_df, reservation_df, **settings)
+
+
+# 进程内共享的后台匹配任务队列
+MATCH_JOBS = MatchJobManager()
@@ -1,53 +1,99 @@
 import streamlit as st
 import pandas as pd
-import re
-import os
 from datetime import datetime
 import io
-import plotly.express as px
-import plotly.graph_objects as go
-from collections import Counter
+import weakref
+
+from matcher_core import (
+    CANONICAL_NAME_COLUMN, ORDER_ID_COLUMN, RESERVATION_ID_COLUMN, TABLE_KEY_COLUMNS,
+    PARSE_CACHE, MATCH_JOBS, MATCH_RESULTS, MATCH_OVERRIDES, PartitionMatchCache, MatchEditLog,
+    canonical_name, canonical_names, frame_fingerprint, frame_memory_bytes, order_result_values, edit_overrides,
+    describe_overrides, parse_payment_amounts, format_amount,
+    available_reader_engines, default_reader_engine, load_meituan_data, load_reservation_data,
+    resolve_match_workers, build_export_frame, export_excel_bytes
+)
+
+# 上传数据预览最多显示的行数
+PREVIEW_ROWS = 500
+
+# 结果表格分页：可选的每页行数和默认值，可排序的列
+PAGE_SIZE_OPTIONS = [50, 100, 200, 500]
+DEFAULT_PAGE_SIZE = 100
+TABLE_SORT_COLUMNS = ['日期', '桌牌号', '预订人', '市别', '匹配状态', '匹配类型']
+
+# 后台匹配任务：地址栏中的任务编号参数、刷新进度的间隔（秒）
+JOB_QUERY_PARAM = 'job'
+JOB_POLL_SECONDS = 1.0
+
+# 匹配结果中记录所用美团订单内容指纹的属性名，订单ID（行位置）只在同一份订单数据上有效
+RESULT_SOURCE_ATTR = 'meituan_fingerprint'
+
+
+def get_job_query_param():
+    """读取地址栏中的任务编号"""
+    return st.query_params.get(JOB_QUERY_PARAM)
+
+
+def set_job_query_param(job_id):
+    """在地址栏中记录任务编号，None表示移除"""
+    if job_id:
+        st.query_params[JOB_QUERY_PARAM] = job_id
+    elif JOB_QUERY_PARAM in st.query_params:
+        del st.query_params[JOB_QUERY_PARAM]
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job_id):
+    """后台任务进度：按间隔只重跑这一部分，不占用整页脚本；任务结束后整页重跑以载入结果"""
+    job = MATCH_JOBS.get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress, text=f"⏳ {job.stage}（任务 {job.id}）")
+
+
+def display_text(series):
+    """转换为显示用文本，缺失值显示为空"""
+    return series.astype(str).where(series.notna(), '')
+
 
 class ReservationMatcherWeb:
-    def __init__(self):
+    def __init__(self, match_workers=None):
         self.meituan_file = None
         self.reservation_file = None
         self.merged_df = pd.DataFrame()
-        self.original_df = pd.DataFrame()
-        
-    def smart_table_match(self, reservation_table, meituan_table):
-        """智能桌牌号匹配函数"""
-        # 提取数字部分
-        def extract_numbers(table_str):
-            if pd.isna(table_str):
-                return None
-            numbers = re.findall(r'\d+', str(table_str))
-            return ''.join(numbers) if numbers else None
+        # 手动匹配/移除匹配的编辑记录（撤销、重做）
+        self.edit_log = MatchEditLog()
+        # 并行匹配进程数，None表示按环境变量（默认1即串行）
+        self.match_workers = match_workers
+        # Excel读取引擎，None表示按环境变量或默认openpyxl
+        self.reader_engine = None
+        # 就近排序模式：每个预订最多保留的订单数、时间窗口（分钟），均为None时保留全部匹配订单
+        self.match_top_k = None
+        self.match_tolerance_minutes = None
+        # 分区匹配结果缓存，用于增量重新匹配
+        self.partition_cache = PartitionMatchCache()
+        # 后台匹配任务编号，以及已载入结果的任务编号
+        self.match_job_id = None
+        self.applied_job_id = None
+        # 当前结果所用美团订单的内容指纹，以及当前美团订单指纹的缓存（弱引用, 指纹）
+        self.result_source = None
+        self.meituan_fingerprint_memo = (None, None)
+        # 最近生成的导出文件（(导出数据指纹, 文件名后缀), Excel内容），导出的数据不变时直接复用
+        self.export_file = (None, None)
         
-        # 判断是否为外卖订单
-        def is_takeout(table_str):
-            if pd.isna(table_str):
-                return False
-            table_str = str(table_str).lower()
-            takeout_keywords = ['外卖', 'takeout', '配送', '打包']
-            return any(keyword in table_str for keyword in takeout_keywords)
-        
-        # 完全匹配（最高优先级）
-        if str(reservation_table) == str(meituan_table):
-            return True, "完全匹配"
-        
-        # 数字部分匹配（包括外卖订单）
-        res_numbers = extract_numbers(reservation_table)
-        mt_numbers = extract_numbers(meituan_table)
-        
-        if res_numbers and mt_numbers and res_numbers == mt_numbers:
-            # 区分外卖和堂食的数字匹配
-            if is_takeout(meituan_table):
-                return True, "外卖匹配"
-            else:
-                return True, "数字匹配"
-        
-        return False, "无匹配"
+    def close(self):
+        """释放上传的数据、匹配结果和缓存（在工具集合中离开本工具时调用）"""
+        self.meituan_file = None
+        self.reservation_file = None
+        self.merged_df = pd.DataFrame()
+        self.edit_log.clear()
+        self.partition_cache.clear()
+        self.match_job_id = None
+        self.applied_job_id = None
+        self.result_source = None
+        self.meituan_fingerprint_memo = (None, None)
+        self.export_file = (None, None)
+        set_job_query_param(None)
     
     def show_record_details(self, selected_record, display_df, selected_idx):
         """显示选中记录的详细信息"""
@@ -60,6 +106,8 @@ class ReservationMatcherWeb:
         with col1:
             st.markdown("### 📋 预订信息")
             reservation_info = {
+                "记录ID": selected_record.name,
+                "预订ID": selected_record.get(RESERVATION_ID_COLUMN, ''),
                 "日期": selected_record.get('日期', ''),
                 "桌牌号": selected_record.get('桌牌号', ''),
                 "预订人": selected_record.get('预订人', ''),
@@ -75,13 +123,22 @@ class ReservationMatcherWeb:
             st.markdown("### 🛒 美团订单信息")
             if selected_record.get('匹配状态') == '已匹配':
                 meituan_info = {
+                    "订单ID": selected_record.get(ORDER_ID_COLUMN, ''),
                     "下单时间": selected_record.get('下单时间', ''),
                     "桌牌号": selected_record.get('桌牌号', ''),
-                    "支付合计": selected_record.get('支付合计', ''),
+                    "支付合计": format_amount(selected_record.get('支付合计')),
                     "结账方式": selected_record.get('结账方式', ''),
                     "下单时间格式化": selected_record.get('下单时间_格式化', '')
                 }
                 
+                # 按订单ID直接取出美团订单的原始信息（仅当结果来自当前上传的订单文件）
+                order_id = selected_record.get(ORDER_ID_COLUMN)
+                orders = self.result_orders()
+                if pd.notna(order_id) and orders is not None and int(order_id) < len(orders):
+                    order = orders.iloc[int(order_id)]
+                    meituan_info["营业日期"] = order.get('营业日期', '')
+                    meituan_info["订单状态"] = order.get('订单状态', '')
+                
                 for key, value in meituan_info.items():
                     st.text(f"{key}: {value}")
                 
@@ -94,109 +151,68 @@ class ReservationMatcherWeb:
                 st.info("此记录未匹配到美团订单")
     
     def remove_match(self, selected_record, selected_idx):
-        """移除匹配记录"""
+        """移除匹配记录（记入编辑记录，可撤销）"""
         try:
-            # 在merged_df中找到对应记录并移除匹配信息
-            mask = (
-                (self.merged_df['日期'] == selected_record['日期']) &
-                (self.merged_df['桌牌号'] == selected_record['桌牌号']) &
-                (self.merged_df['预订人'] == selected_record['预订人']) &
-                (self.merged_df['市别'] == selected_record['市别'])
-            )
-            
-            # 更新匹配状态和相关字段
-            self.merged_df.loc[mask, '匹配状态'] = '未匹配'
-            self.merged_df.loc[mask, '匹配类型'] = '未匹配'
-            self.merged_df.loc[mask, '支付合计'] = None
-            self.merged_df.loc[mask, '下单时间'] = None
-            self.merged_df.loc[mask, '下单时间_格式化'] = None
-            self.merged_df.loc[mask, '结账方式'] = None
+            # 筛选后的记录保留记录ID索引
+            saved = self.record_edit('unmatch', selected_record.name)
             
             st.success("✅ 已成功移除匹配")
+            if not saved:
+                st.warning("移除记录未能保存，重新匹配后需要重新移除")
             
         except Exception as e:
             st.error(f"❌ 移除匹配失败: {str(e)}")
         
     def load_files(self):
         """文件上传界面"""
+        engines = available_reader_engines()
+        if len(engines) > 1:
+            self.reader_engine = st.selectbox(
+                "Excel读取引擎",
+                engines,
+                index=engines.index(default_reader_engine(self.reader_engine)),
+                help="calamine 为Rust实现的快速读取引擎，结果与 openpyxl 相同"
+            )
+        
         # 美团订单文件上传
         st.write("**美团订单文件**")
         meituan_uploaded = st.file_uploader(
             "选择美团订单Excel文件", 
-            type=['xlsx', 'xls'],
+            type=['xlsx', 'xls', 'csv'],
             key="meituan"
         )
         
         if meituan_uploaded:
             try:
-                # 尝试不同的header设置来读取美团文件
-                meituan_df = None
-                for header_row in [2, 1, 0, None]:
-                    try:
-                        temp_df = pd.read_excel(meituan_uploaded, header=header_row)
-                        # 检查是否包含关键列
-                        if any('营业日期' in str(col) for col in temp_df.columns) and \
-                           any('桌牌号' in str(col) for col in temp_df.columns):
-                            meituan_df = temp_df
-                            break
-                    except:
-                        continue
-                
-                if meituan_df is None:
-                    st.error("无法识别美团文件格式，请检查文件是否正确")
-                    return
-                
-                self.meituan_file = meituan_df
+                self.meituan_file, cache_hit = PARSE_CACHE.get_or_load(
+                    meituan_uploaded.getvalue(), load_meituan_data, engine=self.reader_engine
+                )
                 
-                # 清理数据：移除完全空的列和行
-                self.meituan_file = self.meituan_file.dropna(how='all', axis=1)  # 删除全空列
-                self.meituan_file = self.meituan_file.dropna(how='all', axis=0)  # 删除全空行
+                # 列名识别和类型转换在读取时按 MEITUAN_SCHEMA 完成，缺少必要列时抛出ValueError
+                st.success(f"✅ 美团文件已加载 ({len(self.meituan_file)} 条记录)")
+                self.show_cache_status(cache_hit)
                 
-                # 转换所有列为字符串类型以避免类型冲突
-                for col in self.meituan_file.columns:
-                    if self.meituan_file[col].dtype == 'object':
-                        self.meituan_file[col] = self.meituan_file[col].astype(str)
+                with st.expander("预览美团数据", expanded=False):
+                    # 只预览前几百行（不显示内部预计算列）
+                    display_df = self.meituan_file.head(PREVIEW_ROWS).drop(columns=TABLE_KEY_COLUMNS, errors='ignore')
                     
-                # 智能检测列名
-                date_col = None
-                table_col = None
-                customer_col = None
-                
-                for col in self.meituan_file.columns:
-                    if any(keyword in str(col) for keyword in ['营业日期', '日期', 'date']):
-                        date_col = col
-                    if any(keyword in str(col) for keyword in ['桌牌号', '桌号', '台号']):
-                        table_col = col
-                    if any(keyword in str(col) for keyword in ['客户', '姓名', '顾客']):
-                        customer_col = col
-                
-                missing_cols = []
-                if not date_col: missing_cols.append('日期相关列')
-                if not table_col: missing_cols.append('桌牌号相关列')
-                
-                if missing_cols:
-                    st.error(f"缺少必要列: {', '.join(missing_cols)}")
-                else:
-                    st.success(f"✅ 美团文件已加载 ({len(self.meituan_file)} 条记录)")
+                    # 添加水平滚动样式
+                    st.markdown("""
+                    <style>
+                    .stDataFrame {
+                        overflow-x: auto;
+                    }
+                    .stDataFrame > div {
+                        overflow-x: auto;
+                    }
+                    </style>
+                    """, unsafe_allow_html=True)
                     
-                    with st.expander("预览美团数据", expanded=False):
-                        # 创建显示用的DataFrame副本
-                        display_df = self.meituan_file.copy()
-                        
-                        # 添加水平滚动样式
-                        st.markdown("""
-                        <style>
-                        .stDataFrame {
-                            overflow-x: auto;
-                        }
-                        .stDataFrame > div {
-                            overflow-x: auto;
-                        }
-                        </style>
-                        """, unsafe_allow_html=True)
-                        
-                        st.dataframe(display_df, use_container_width=True)
+                    st.dataframe(display_df, use_container_width=True)
                     
+            except ValueError as e:
+                st.error(str(e))
+                return
             except Exception as e:
                 st.error(f"美团文件加载失败: {str(e)}")
             
@@ -206,56 +222,30 @@ class ReservationMatcherWeb:
             st.write("**预订记录文件**")
             reservation_uploaded = st.file_uploader(
                 "选择预订记录Excel文件", 
-                type=['xlsx', 'xls'],
+                type=['xlsx', 'xls', 'csv'],
                 key="reservation"
             )
             
             if reservation_uploaded:
                 try:
-                    # 读取Excel文件的所有工作表
-                    excel_file = pd.ExcelFile(reservation_uploaded)
-                    all_sheets_data = []
-                    
-                    # 简化显示信息
-                    valid_sheets = 0
-                    total_records = 0
-                    
-                    # 逐个读取每个工作表
-                    for sheet_name in excel_file.sheet_names:
-                        try:
-                            sheet_df = pd.read_excel(reservation_uploaded, sheet_name=sheet_name)
-                            
-                            # 清理数据：移除完全空的列和行
-                            sheet_df = sheet_df.dropna(how='all', axis=1)  # 删除全空列
-                            sheet_df = sheet_df.dropna(how='all', axis=0)  # 删除全空行
-                            
-                            # 如果工作表有数据，添加到列表中
-                            if not sheet_df.empty:
-                                # 添加工作表名称列用于标识数据来源
-                                sheet_df['数据来源工作表'] = sheet_name
-                                all_sheets_data.append(sheet_df)
-                                valid_sheets += 1
-                                total_records += len(sheet_df)
-                        except Exception as e:
-                            continue  # 静默跳过错误的工作表
+                    self.reservation_file, cache_hit = PARSE_CACHE.get_or_load(
+                        reservation_uploaded.getvalue(), load_reservation_data, engine=self.reader_engine
+                    )
                     
-                    # 合并所有工作表的数据
-                    if all_sheets_data:
-                        self.reservation_file = pd.concat(all_sheets_data, ignore_index=True)
-                        
-                        # 转换所有列为字符串类型以避免类型冲突
-                        for col in self.reservation_file.columns:
-                            if self.reservation_file[col].dtype == 'object':
-                                self.reservation_file[col] = self.reservation_file[col].astype(str)
-                        
+                    if not self.reservation_file.empty:
                         st.success(f"✅ 预订文件已加载 ({len(self.reservation_file)} 条记录)")
+                        self.show_cache_status(cache_hit)
                     else:
                         st.error("没有找到有效数据")
-                        self.reservation_file = pd.DataFrame()
+                    
+                    failed_sheets = self.reservation_file.attrs.get('failed_sheets') or []
+                    if failed_sheets:
+                        details = '；'.join(f"{sheet_name}（{error}）" for sheet_name, error in failed_sheets)
+                        st.warning(f"⚠️ {len(failed_sheets)} 个工作表解析失败，已跳过: {details}")
                     
                     with st.expander("👀 预览预订数据", expanded=False):
-                        # 创建显示用的DataFrame副本
-                        display_df = self.reservation_file.copy()
+                        # 只预览前几百行（不显示内部预计算列）
+                        display_df = self.reservation_file.head(PREVIEW_ROWS).drop(columns=TABLE_KEY_COLUMNS, errors='ignore')
                         
                         # 添加水平滚动样式
                         st.markdown("""
@@ -276,6 +266,48 @@ class ReservationMatcherWeb:
             
 
     
+    def show_cache_status(self, cache_hit):
+        """显示解析缓存命中情况"""
+        status = "⚡ 缓存命中，未重新解析" if cache_hit else "🔄 已解析并缓存"
+        st.caption(f"{status}（累计内存命中 {PARSE_CACHE.hits} 次，磁盘命中 {PARSE_CACHE.disk_hits} 次，解析 {PARSE_CACHE.misses} 次）")
+    
+    def render_match_settings(self):
+        """匹配设置"""
+        with st.expander("⚙️ 匹配设置", expanded=False):
+            self.match_workers = st.number_input(
+                "并行进程数",
+                min_value=1,
+                max_value=64,
+                value=resolve_match_workers(self.match_workers),
+                help="按日期分区并行匹配，设为1时串行匹配；数据量较小时进程启动开销大于收益，会自动串行"
+            )
+            
+            rank_by_time = st.checkbox(
+                "按时间就近匹配",
+                value=self.match_top_k is not None or self.match_tolerance_minutes is not None,
+                help="同一桌号有多个订单时，只保留下单时间最接近预订市别（午市12点、晚市18点）的订单"
+            )
+            if rank_by_time:
+                col1, col2 = st.columns(2)
+                with col1:
+                    self.match_top_k = st.number_input(
+                        "每个预订最多保留订单数",
+                        min_value=1,
+                        max_value=20,
+                        value=self.match_top_k or 1
+                    )
+                with col2:
+                    tolerance = st.number_input(
+                        "时间窗口（分钟，0为不限）",
+                        min_value=0,
+                        max_value=720,
+                        value=self.match_tolerance_minutes or 0
+                    )
+                    self.match_tolerance_minutes = tolerance or None
+            else:
+                self.match_top_k = None
+                self.match_tolerance_minutes = None
+    
     def validate_files(self):
         """验证文件是否已加载"""
         if self.meituan_file is None or self.reservation_file is None:
@@ -286,276 +318,124 @@ class ReservationMatcherWeb:
         
         return True, "文件验证通过"
     
-    def match_data(self):
-        """数据匹配核心逻辑 - 使用与桌面版完全相同的匹配算法"""
-        try:
-            # 读取美团数据 - 使用与桌面版相同的处理方式
-            df = self.meituan_file.copy()
-            
-            # 数据清洗和预处理
-            df = df[df['订单状态'] == '已结账']
-            df = df[df['营业日期'] != '--']
-            
-            # 改进的支付金额提取
-            def extract_payment(payment_str):
-                if pd.isna(payment_str):
-                    return None
-                try:
-                    # 查找所有数字（包括负数和小数）
-                    numbers = re.findall(r'-?\d+\.?\d*', str(payment_str))
-                    if numbers:
-                        return float(numbers[0])
-                except (ValueError, IndexError):
-                    pass
-                return None
-                
-            df['支付合计'] = df['结账方式'].apply(extract_payment)
-            df['营业日期'] = pd.to_datetime(df['营业日期'], errors='coerce')
-            df['下单时间'] = pd.to_datetime(df['下单时间'], errors='coerce')
-            
-            # 根据下单时间判断市别
-            def determine_market_period(order_time):
-                if pd.isna(order_time):
-                    return None
-                try:
-                    hour = pd.to_datetime(order_time).hour
-                    # 午市: 6:00-16:00, 晚市: 16:00-24:00
-                    if 6 <= hour < 16:
-                        return '午市'
-                    elif 16 <= hour <= 23:
-                        return '晚市'
-                    else:
-                        return None  # 非营业时间
-                except:
-                    return None
-            
-            df['市别'] = df['下单时间'].apply(determine_market_period)
-            
-            # 选择需要的列，保留下单时间和结账方式用于显示
-            mt_df = df[['营业日期', '桌牌号', '下单时间', '支付合计', '市别', '结账方式']].copy()
-            # 过滤掉非营业时间的订单
-            mt_df = mt_df[mt_df['市别'].notna()]
-            
-            # 格式化下单时间为更易读的格式
-            try:
-                mt_df['下单时间_格式化'] = mt_df['下单时间'].dt.strftime('%H:%M:%S')
-            except AttributeError:
-                # 如果不是datetime类型，尝试转换后格式化
-                mt_df['下单时间'] = pd.to_datetime(mt_df['下单时间'], errors='coerce')
-                mt_df['下单时间_格式化'] = mt_df['下单时间'].dt.strftime('%H:%M:%S')
-            
-            # 提取下单时间的日期部分用于匹配
-            mt_df['下单日期'] = mt_df['下单时间'].dt.date
-            
-            # 读取预订数据
-            merged_all = pd.DataFrame()
-            
-            # 处理预订数据 - 支持多工作表
-            if hasattr(self.reservation_file, 'sheet_names'):
-                # 如果是ExcelFile对象，处理多个工作表
-                for sheet_name in self.reservation_file.sheet_names:
-                    try:
-                        day_df = pd.read_excel(self.reservation_file, sheet_name=sheet_name)
-                        
-                        # 检查必要的列是否存在
-                        required_cols = ['姓名', '预订人']
-                        missing_cols = [col for col in required_cols if col not in day_df.columns]
-                        if missing_cols:
-                            continue
-                            
-                        # 数据清洗
-                        day_df = day_df[day_df['姓名'].notna() & day_df['预订人'].notna()]
-                        
-                        # 预订人姓名标准化处理
-                        def standardize_name(name):
-                            if pd.isna(name):
-                                return name
-                            name_str = str(name).strip()
-                            # 处理同义词
-                            if name_str in ['平和', '平哥']:
-                                return '平和'
-                            # 处理刘霞和刘的映射
-                            if name_str in ['刘霞', '刘']:
-                                return '刘霞'
-                            # 处理周和周思玗的映射
-                            if name_str in ['周', '周思玗']:
-                                return '周思玗'
-                            # 处理大小写统一（sk -> SK）
-                            if name_str.lower() == 'sk':
-                                return 'SK'
-                            return name_str
-                        
-                        day_df['预订人'] = day_df['预订人'].apply(standardize_name)
-                        
-                        # 选择和重命名列
-                        available_cols = ['日期', '市别', '包厢', '姓名', '预订人', '经手人']
-                        existing_cols = [col for col in available_cols if col in day_df.columns]
-                        day_df = day_df[existing_cols].copy()
-                        
-                        # 标准化列名
-                        col_mapping = {'包厢': '桌牌号', '姓名': '客户姓名'}
-                        day_df.rename(columns=col_mapping, inplace=True)
-                        
-                        # 处理日期
-                        if '日期' in day_df.columns:
-                            day_df['日期'] = pd.to_datetime(
-                                day_df['日期'].astype(str).str.split().str[0], 
-                                errors='coerce'
-                            )
-                        
-                        # 合并数据 - 改进的匹配逻辑
-                        if '日期' in day_df.columns and '桌牌号' in day_df.columns and '市别' in day_df.columns:
-                            # 为每个预订记录找到最佳匹配的美团订单
-                            merged_records = []
-                            
-                            for _, reservation in day_df.iterrows():
-                                # 找到同一日期、市别的所有美团订单，然后使用智能桌牌号匹配
-                                reservation_date = reservation['日期'].date() if hasattr(reservation['日期'], 'date') else reservation['日期']
-                                
-                                # 先按日期和市别筛选
-                                candidate_orders = mt_df[
-                                    (mt_df['下单日期'] == reservation_date) &
-                                    (mt_df['市别'] == reservation['市别'])
-                                ].copy()
-                                
-                                # 使用智能匹配找到桌牌号匹配的订单
-                                matching_orders = []
-                                match_info = []
-                                
-                                for _, order in candidate_orders.iterrows():
-                                    is_match, match_type = self.smart_table_match(
-                                        reservation['桌牌号'], 
-                                        order['桌牌号']
-                                    )
-                                    if is_match:
-                                        matching_orders.append(order)
-                                        match_info.append(match_type)
-                                
-                                matching_orders = pd.DataFrame(matching_orders) if matching_orders else pd.DataFrame()
-                                
-                                if not matching_orders.empty:
-                                    # 为每个匹配的订单创建独立记录
-                                    for idx, (_, order) in enumerate(matching_orders.iterrows()):
-                                        merged_record = reservation.copy()
-                                        merged_record['支付合计'] = order['支付合计']
-                                        merged_record['下单时间'] = order['下单时间']
-                                        merged_record['下单时间_格式化'] = order['下单时间_格式化']
-                                        merged_record['结账方式'] = order['结账方式']
-                                        merged_record['匹配类型'] = match_info[idx] if idx < len(match_info) else '未知'
-                                        merged_records.append(merged_record)
-                                else:
-                                    # 没有匹配的订单
-                                    merged_record = reservation.copy()
-                                    merged_record['支付合计'] = None
-                                    merged_record['下单时间'] = None
-                                    merged_record['下单时间_格式化'] = None
-                                    merged_record['结账方式'] = None
-                                    merged_record['匹配类型'] = '未匹配'
-                                    merged_records.append(merged_record)
-                            
-                            if merged_records:
-                                merged = pd.DataFrame(merged_records)
-                                merged_all = pd.concat([merged_all, merged], ignore_index=True)
-                                
-                    except Exception as e:
-                        continue
-            else:
-                # 如果是单个DataFrame，直接处理
-                day_df = self.reservation_file.copy()
-                
-                # 检查必要的列是否存在
-                required_cols = ['姓名', '预订人']
-                missing_cols = [col for col in required_cols if col not in day_df.columns]
-                if missing_cols:
-                    return False, f"预订文件缺少必要列: {missing_cols}"
-                    
-                # 数据清洗
-                day_df = day_df[day_df['姓名'].notna() & day_df['预订人'].notna()]
-                
-                # 选择和重命名列
-                available_cols = ['日期', '市别', '包厢', '姓名', '预订人', '经手人']
-                existing_cols = [col for col in available_cols if col in day_df.columns]
-                day_df = day_df[existing_cols].copy()
-                
-                # 标准化列名
-                col_mapping = {'包厢': '桌牌号', '姓名': '客户姓名'}
-                day_df.rename(columns=col_mapping, inplace=True)
-                
-                # 处理日期
-                if '日期' in day_df.columns:
-                    day_df['日期'] = pd.to_datetime(
-                        day_df['日期'].astype(str).str.split().str[0], 
-                        errors='coerce'
-                    )
-                
-                # 合并数据 - 改进的匹配逻辑
-                if '日期' in day_df.columns and '桌牌号' in day_df.columns and '市别' in day_df.columns:
-                    # 为每个预订记录找到最佳匹配的美团订单
-                    merged_records = []
-                    
-                    for _, reservation in day_df.iterrows():
-                        # 找到同一日期、桌牌号、市别的所有美团订单（使用下单时间的日期进行匹配）
-                        reservation_date = reservation['日期'].date() if hasattr(reservation['日期'], 'date') else reservation['日期']
-                        matching_orders = mt_df[
-                            (mt_df['下单日期'] == reservation_date) &
-                            (mt_df['桌牌号'] == reservation['桌牌号']) &
-                            (mt_df['市别'] == reservation['市别'])
-                        ].copy()
-                        
-                        if not matching_orders.empty:
-                            # 为每个匹配的订单创建独立记录
-                            for _, order in matching_orders.iterrows():
-                                merged_record = reservation.copy()
-                                merged_record['支付合计'] = order['支付合计']
-                                merged_record['下单时间'] = order['下单时间']
-                                merged_record['下单时间_格式化'] = order['下单时间_格式化']
-                                merged_record['结账方式'] = order['结账方式']
-                                merged_records.append(merged_record)
-                        else:
-                            # 没有匹配的订单
-                            merged_record = reservation.copy()
-                            merged_record['支付合计'] = None
-                            merged_record['下单时间'] = None
-                            merged_record['下单时间_格式化'] = None
-                            merged_record['结账方式'] = None
-                            merged_records.append(merged_record)
-                    
-                    if merged_records:
-                        merged_all = pd.DataFrame(merged_records)
-            
-            # 数据后处理
-            if not merged_all.empty:
-                # 添加匹配状态列
-                merged_all['匹配状态'] = merged_all['支付合计'].apply(
-                    lambda x: '已匹配' if pd.notna(x) else '未匹配'
-                )
-                
-                # 格式化数据
-                if '支付合计' in merged_all.columns:
-                    merged_all['支付合计'] = merged_all['支付合计'].apply(
-                        lambda x: f"{x:.2f}" if pd.notna(x) else ""
-                    )
-                    
-                # 排序
-                sort_cols = []
-                if '日期' in merged_all.columns:
-                    sort_cols.append('日期')
-                if '桌牌号' in merged_all.columns:
-                    sort_cols.append('桌牌号')
-                if sort_cols:
-                    merged_all.sort_values(sort_cols, inplace=True, ignore_index=True)
-            
-            self.merged_df = merged_all
-            self.original_df = merged_all.copy()  # 保存原始数据
-            
-            # 显示统计信息
-            total_records = len(self.merged_df)
-            matched_records = len(self.merged_df[self.merged_df['匹配状态'] == '已匹配']) if '匹配状态' in self.merged_df.columns else 0
-            
-            return True, f"匹配完成！总记录: {total_records}, 已匹配: {matched_records}, 未匹配: {total_records - matched_records}"
-            
-        except Exception as e:
-            return False, f"匹配失败: {str(e)}"
+    def match_settings(self):
+        """当前匹配设置"""
+        return dict(
+            workers=self.match_workers,
+            top_k=self.match_top_k,
+            tolerance_minutes=self.match_tolerance_minutes,
+            cache=self.partition_cache
+        )
+    
+    def compute_match(self, meituan_file, reservation_file, settings):
+        """执行匹配，返回(结果, 提示信息)，不修改当前数据；失败时抛出异常（ValueError的信息可直接显示）"""
+        merged_all, shared_hit = MATCH_RESULTS.get_or_match(meituan_file, reservation_file, **settings)
+        
+        # 恢复之前保存的手动匹配和移除匹配
+        merged_all, restored = MATCH_OVERRIDES.apply(merged_all, meituan_file)
+        merged_all.attrs[RESULT_SOURCE_ATTR] = frame_fingerprint(meituan_file)
+        
+        # 统计信息
+        total_records = len(merged_all)
+        matched_records = len(merged_all[merged_all['匹配状态'] == '已匹配']) if '匹配状态' in merged_all.columns else 0
+        
+        message = f"匹配完成！总记录: {total_records}, 已匹配: {matched_records}, 未匹配: {total_records - matched_records}"
+        cache = settings.get('cache')
+        if shared_hit:
+            message += "（与其他会话上传的文件相同，直接使用已有结果）"
+        elif cache is not None and cache.last_reused:
+            message += f"（复用 {cache.last_reused} 个分区，重新计算 {cache.last_recomputed} 个）"
+        if restored:
+            message += f"，已恢复 {restored} 条手动修改"
+        return merged_all, message
+    
+    def apply_match_result(self, merged_df):
+        """载入匹配结果（复制一份，之后的手动修改不影响任务中保存的结果），并清空编辑记录"""
+        # 结果以记录ID为索引，手动编辑按记录ID定位
+        self.merged_df = merged_df.copy()
+        self.result_source = merged_df.attrs.get(RESULT_SOURCE_ATTR)
+        self.edit_log.clear()
+    
+    def meituan_fingerprint(self):
+        """当前美团订单的内容指纹，同一份数据只计算一次"""
+        if self.meituan_file is None:
+            return None
+        source, fingerprint = self.meituan_fingerprint_memo
+        if source is None or source() is not self.meituan_file:
+            fingerprint = frame_fingerprint(self.meituan_file)
+            self.meituan_fingerprint_memo = (weakref.ref(self.meituan_file), fingerprint)
+        return fingerprint
+    
+    def result_orders(self):
+        """当前结果所用的美团订单：结果来自当前上传的文件时返回它，否则（如刷新后取回的任务结果）返回None"""
+        if self.result_source is None or self.result_source != self.meituan_fingerprint():
+            return None
+        return self.meituan_file
+    
+    def match_job_task(self, job, meituan_file, reservation_file, settings):
+        """后台任务：匹配提交时的文件和设置"""
+        job.report("匹配中", 0.3)
+        merged_all, job.message = self.compute_match(meituan_file, reservation_file, settings)
+        return merged_all
+    
+    def submit_match_job(self):
+        """提交后台匹配任务，任务编号记录在地址栏中，页面刷新后仍可取回结果"""
+        self.match_job_id = MATCH_JOBS.submit(
+            self.match_job_task, self.meituan_file, self.reservation_file, self.match_settings()
+        )
+        set_job_query_param(self.match_job_id)
+        return self.match_job_id
+    
+    def render_match_job(self):
+        """显示后台匹配任务的进度，任务完成后载入结果"""
+        job_id = self.match_job_id or get_job_query_param()
+        if not job_id:
+            return
+        
+        job = MATCH_JOBS.get(job_id)
+        if job is None:
+            st.warning("匹配任务不存在或已过期，请重新匹配")
+            self.match_job_id = None
+            set_job_query_param(None)
+            return
+        
+        self.match_job_id = job_id
+        if not job.finished:
+            show_job_progress(job_id)
+        elif job.status == 'failed':
+            st.error(f"匹配失败: {job.error}")
+        else:
+            if self.applied_job_id != job.id:
+                result = job.result
+                if result is None:
+                    st.warning("匹配任务的结果已过期释放，请重新匹配")
+                    self.match_job_id = None
+                    set_job_query_param(None)
+                    return
+                self.apply_match_result(result)
+                self.applied_job_id = job.id
+            st.success(job.message)
+            st.info("请切换到'结果查看'标签页")
+    
+    def memory_report(self):
+        """当前会话各数据占用的内存（字节）"""
+        return {
+            "匹配结果": frame_memory_bytes(self.merged_df),
+            "美团订单": frame_memory_bytes(self.meituan_file),
+            "预订记录": frame_memory_bytes(self.reservation_file),
+            "分区缓存": self.partition_cache.memory_bytes(),
+            "导出文件": len(self.export_file[1] or b''),
+            "匹配结果缓存（进程共享）": MATCH_RESULTS.total_bytes,
+            "后台任务结果（进程共享）": MATCH_JOBS.result_bytes(),
+        }
+    
+    def show_memory_report(self):
+        """显示会话内存占用"""
+        report = self.memory_report()
+        total_mb = sum(report.values()) / 1024 / 1024
+        with st.expander(f"💾 内存占用 ({total_mb:.1f} MB)", expanded=False):
+            for name, size in report.items():
+                st.text(f"{name}: {size / 1024 / 1024:.2f} MB")
     
     def display_results(self):
         """显示匹配结果"""
@@ -568,7 +448,7 @@ class ReservationMatcherWeb:
             st.subheader("📊 匹配统计")
             match_stats = self.merged_df['匹配类型'].value_counts()
             
-            col1, col2, col3, col4, col5 = st.columns(5)
+            col1, col2, col3, col4, col5, col6 = st.columns(6)
             
             with col1:
                 complete_match = match_stats.get('完全匹配', 0)
@@ -583,10 +463,14 @@ class ReservationMatcherWeb:
                 st.metric("外卖匹配", takeout_match, help="预订改为外卖配送的匹配")
             
             with col4:
+                manual_match = match_stats.get('手动匹配', 0)
+                st.metric("手动匹配", manual_match, help="在下方手动指定订单的匹配")
+            
+            with col5:
                 no_match = match_stats.get('未匹配', 0)
                 st.metric("未匹配", no_match, help="未找到对应美团订单")
             
-            with col5:
+            with col6:
                 total_records = len(self.merged_df)
                 match_rate = round((total_records - no_match) / total_records * 100, 1) if total_records > 0 else 0
                 st.metric("匹配率", f"{match_rate}%", help="成功匹配的记录比例")
@@ -608,53 +492,32 @@ class ReservationMatcherWeb:
             st.session_state.search_keyword = search_keyword
         
         # 应用筛选
-        display_df = self.merged_df.copy()
+        display_df = self.filter_records(filter_option, search_keyword)
         
-        if filter_option == "已匹配记录":
-            display_df = display_df[display_df['匹配状态'] == '已匹配']
-        elif filter_option == "未匹配记录":
-            display_df = display_df[display_df['匹配状态'] == '未匹配']
+        self.show_memory_report()
         
-        if search_keyword:
-            if '预订人' in display_df.columns:
-                # 标准化搜索关键词
-                def standardize_search_keyword(keyword):
-                    keyword = keyword.strip()
-                    if keyword in ['平和', '平哥']:
-                        return ['平和', '平哥']  # 返回所有同义词
-                    elif keyword in ['刘霞', '刘']:
-                        return ['刘霞', '刘']  # 返回刘霞和刘的所有变体
-                    elif keyword in ['周', '周思玗']:
-                        return ['周', '周思玗']  # 返回周和周思玗的所有变体
-                    elif keyword.lower() == 'sk':
-                        return ['SK', 'sk', 'Sk', 'sK']  # 返回所有大小写变体
-                    else:
-                        return [keyword]
-                
-                search_terms = standardize_search_keyword(search_keyword)
-                # 创建搜索条件，匹配任何一个同义词
-                search_condition = False
-                for term in search_terms:
-                    search_condition |= display_df['预订人'].astype(str).str.contains(term, case=False, na=False)
-                display_df = display_df[search_condition]
+        self.show_edit_controls()
+        self.show_saved_overrides()
         
-        # 显示数据表格（简化版）
+        # 显示数据表格（先筛选、排序，再分页，只格式化和发送当前页）
         st.subheader(f"📋 数据表格 ({len(display_df)} 条记录)")
         
         if not display_df.empty:
+            display_df, page_df = self.paginate_records(display_df)
+            
             # 配置核心列显示（简化信息）
             columns_to_show = ['日期', '桌牌号', '预订人', '市别', '匹配状态', '匹配类型']
-            available_columns = [col for col in columns_to_show if col in display_df.columns]
+            available_columns = [col for col in columns_to_show if col in page_df.columns]
             
             # 创建显示用的DataFrame副本并处理数据类型
-            table_df = display_df[available_columns].copy()
+            table_df = page_df[available_columns].copy()
             
             # 格式化显示
             for col in table_df.columns:
                 if col == '匹配状态':
-                    table_df[col] = table_df[col].apply(lambda x: '✅已匹配' if str(x) == '已匹配' else '❌未匹配')
+                    table_df[col] = (table_df[col] == '已匹配').map({True: '✅已匹配', False: '❌未匹配'})
                 else:
-                    table_df[col] = table_df[col].astype(str).replace('nan', '')
+                    table_df[col] = display_text(table_df[col])
             
             # 重命名列标题使其更简洁
             column_rename = {
@@ -678,60 +541,167 @@ class ReservationMatcherWeb:
             </style>
             """, unsafe_allow_html=True)
             
-            # 使用可选择的数据表格
+            # 使用可选择的数据表格（仅当前页）
             selected_rows = st.dataframe(
                 table_df,
                 use_container_width=True,
-                height=None,  # 移除高度限制，显示所有内容
                 on_select="rerun",
                 selection_mode="single-row"
             )
             
-            # 处理行选择和详情显示
+            # 处理行选择和详情显示（选中的是当前页内的行）
             if selected_rows.selection.rows:
                 selected_idx = selected_rows.selection.rows[0]
-                if selected_idx < len(display_df):
-                    selected_record = display_df.iloc[selected_idx]
-                    self.show_record_details(selected_record, display_df, selected_idx)
+                if selected_idx < len(page_df):
+                    selected_record = page_df.iloc[selected_idx]
+                    self.show_record_details(selected_record, display_df, selected_record.name)
             
-            # 手动匹配功能
-            if filter_option == "未匹配记录" and not display_df.empty:
-                self.manual_match_interface(display_df)
+            # 手动匹配功能（可选的预订记录为当前页）
+            if filter_option == "未匹配记录" and not page_df.empty:
+                self.manual_match_interface(page_df)
         else:
             st.info("📝 没有符合条件的记录")
     
+    def record_edit(self, kind, row_id, orders=None):
+        """执行一条手动编辑并保存到手动修改存储，返回是否保存成功"""
+        self.merged_df = self.edit_log.record(self.merged_df, kind, row_id, orders)
+        return MATCH_OVERRIDES.add(edit_overrides(self.merged_df, self.edit_log.entries[-1]))
+    
+    def undo_edit(self):
+        """撤销最近一条编辑，并从存储中删除；被它覆盖的更早编辑重新保存"""
+        edit = self.edit_log.entries[self.edit_log.cursor - 1]
+        self.merged_df = self.edit_log.undo(self.merged_df)
+        removed = edit_overrides(self.merged_df, edit)
+        MATCH_OVERRIDES.remove(removed)
+        pairs = {(o['reservation_key'], o['order_key']) for o in removed}
+        for earlier in self.edit_log.applied():
+            overrides = edit_overrides(self.merged_df, earlier)
+            if any((o['reservation_key'], o['order_key']) in pairs for o in overrides):
+                MATCH_OVERRIDES.add(overrides)
+    
+    def redo_edit(self):
+        """重做下一条编辑，并重新保存"""
+        self.merged_df = self.edit_log.redo(self.merged_df)
+        MATCH_OVERRIDES.add(edit_overrides(self.merged_df, self.edit_log.entries[self.edit_log.cursor - 1]))
+    
+    def show_edit_controls(self):
+        """手动编辑的撤销/重做按钮"""
+        log = self.edit_log
+        if not log.entries:
+            return
+        col1, col2, col3 = st.columns([1, 1, 4])
+        with col1:
+            if st.button("↩️ 撤销", disabled=not log.can_undo, key="undo_edit"):
+                self.undo_edit()
+                st.rerun()
+        with col2:
+            if st.button("↪️ 重做", disabled=not log.can_redo, key="redo_edit"):
+                self.redo_edit()
+                st.rerun()
+        with col3:
+            st.caption(f"手动编辑 {log.cursor} 条（共记录 {len(log.entries)} 条）")
+    
+    def show_saved_overrides(self):
+        """列出保存的手动修改（所有上传文件共用，重新匹配时自动套用），可删除选中的记录或全部清空"""
+        overrides = MATCH_OVERRIDES.load()
+        if overrides.empty:
+            return
+        with st.expander(f"🗂️ 已保存的手动修改 ({len(overrides)} 条)", expanded=False):
+            st.caption("手动匹配/移除匹配按预订和订单内容保存，之后匹配任何文件时，内容相同的预订和订单都会自动套用；"
+                       "勾选后可删除单条记录，当前结果不变，重新匹配后不再套用")
+            listing = describe_overrides(overrides)
+            selected = st.dataframe(
+                listing, use_container_width=True, hide_index=True,
+                on_select="rerun", selection_mode="multi-row", key="saved_overrides"
+            )
+            # 删除后列表变短，之前的选择可能越界
+            selected_ids = listing['编号'].iloc[[i for i in selected.selection.rows if i < len(listing)]].tolist()
+            if st.button(f"🗑️ 删除所选 ({len(selected_ids)} 条)", disabled=not selected_ids, key="delete_overrides"):
+                if MATCH_OVERRIDES.delete(selected_ids) is None:
+                    st.error("删除失败：无法写入手动修改存储")
+                else:
+                    st.rerun()
+            if st.button("🗑️ 清空已保存的手动修改", key="clear_overrides"):
+                cleared = MATCH_OVERRIDES.clear()
+                if cleared is None:
+                    st.error("清空失败：无法写入手动修改存储")
+                else:
+                    # 当前结果中已做的修改保留，撤销记录随之清空，重新匹配后不再套用
+                    self.edit_log.clear()
+                    st.rerun()
+    
+    def sort_records(self, display_df, sort_column, ascending=True):
+        """按指定列排序（稳定排序，空值排在最后），sort_column为None时保持原顺序"""
+        if sort_column is None or sort_column not in display_df.columns:
+            return display_df
+        return display_df.sort_values(sort_column, ascending=ascending, kind='stable', na_position='last')
+    
+    def paginate_records(self, display_df):
+        """排序和分页控件：返回(排序后的全部记录, 当前页记录)"""
+        sort_options = ["默认顺序"] + [col for col in TABLE_SORT_COLUMNS if col in display_df.columns]
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            sort_by = st.selectbox("排序", sort_options, key="result_sort")
+        with col2:
+            sort_order = st.selectbox("顺序", ["升序", "降序"], key="result_sort_order")
+        with col3:
+            page_size = st.selectbox(
+                "每页行数", PAGE_SIZE_OPTIONS,
+                index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE), key="result_page_size"
+            )
+        
+        display_df = self.sort_records(
+            display_df, None if sort_by == "默认顺序" else sort_by, ascending=sort_order == "升序"
+        )
+        
+        # 筛选或每页行数变化后页数可能减少，页码超出时显示最后一页
+        total_pages = max(1, -(-len(display_df) // page_size))
+        if st.session_state.get('result_page', 1) > total_pages:
+            st.session_state.result_page = total_pages
+        with col4:
+            page = st.number_input("页码", min_value=1, max_value=total_pages, step=1, key="result_page")
+        
+        start = (page - 1) * page_size
+        page_df = display_df.iloc[start:start + page_size]
+        st.caption(f"第 {page}/{total_pages} 页，显示第 {start + 1}-{start + len(page_df)} 条，共 {len(display_df)} 条")
+        return display_df, page_df
+    
+    def reservation_option_labels(self, unmatched_df):
+        """预订记录的选项文字（日期只显示年月日），按记录ID索引"""
+        def column_text(col):
+            if col not in unmatched_df.columns:
+                return pd.Series('N/A', index=unmatched_df.index)
+            values = unmatched_df[col]
+            if col == '日期' and pd.api.types.is_datetime64_any_dtype(values):
+                text = values.dt.strftime('%Y-%m-%d')
+            elif col == '日期':
+                # 取空格前的日期部分
+                text = values.astype(str).str.split(' ').str[0]
+            else:
+                text = values.astype(str)
+            return text.where(values.notna(), 'N/A')
+        
+        return (
+            "📅" + column_text('日期') + " | 🪑" + column_text('桌牌号') + "桌 | 🏪" + column_text('市别')
+            + " | 👤" + column_text('预订人')
+        )
+    
     def manual_match_interface(self, unmatched_df):
-        """手动匹配界面"""
+        """手动匹配界面（unmatched_df 为当前页的未匹配记录）"""
         st.write("**🔧 手动匹配**")
         
         if unmatched_df.empty:
             return
         
         # 选择要匹配的预订记录（简化显示）
-        reservation_options = []
-        for idx, row in unmatched_df.iterrows():
-            # 格式化日期，只显示年月日
-            date_str = 'N/A'
-            if pd.notna(row.get('日期')):
-                try:
-                    if hasattr(row.get('日期'), 'strftime'):
-                        date_str = row.get('日期').strftime('%Y-%m-%d')
-                    else:
-                        date_str = str(row.get('日期')).split(' ')[0]  # 取空格前的日期部分
-                except:
-                    date_str = str(row.get('日期', 'N/A'))
-            
-            option_text = f"📅{date_str} | 🪑{row.get('桌牌号', 'N/A')}桌 | 🏪{row.get('市别', 'N/A')} | 👤{row.get('预订人', 'N/A')}"
-            reservation_options.append((option_text, idx))
-        
-        selected_reservation = st.selectbox(
+        option_labels = self.reservation_option_labels(unmatched_df)
+        reservation_idx = st.selectbox(
             "选择要匹配的预订记录",
-            options=reservation_options,
-            format_func=lambda x: x[0]
+            options=option_labels.index.tolist(),
+            format_func=option_labels.get
         )
         
-        if selected_reservation and self.meituan_file is not None:
-            reservation_idx = selected_reservation[1]
+        if reservation_idx is not None and self.meituan_file is not None:
             reservation_record = unmatched_df.loc[reservation_idx]
             
             # 获取相关的美团订单
@@ -739,31 +709,16 @@ class ReservationMatcherWeb:
             if hasattr(reservation_date, 'date'):
                 reservation_date = reservation_date.date()
             
-            # 处理美团数据，确保支付合计字段正确提取
-            def extract_payment(payment_str):
-                if pd.isna(payment_str):
-                    return None
-                try:
-                    # 查找所有数字（包括负数和小数）
-                    numbers = re.findall(r'-?\d+\.?\d*', str(payment_str))
-                    if numbers:
-                        return float(numbers[0])
-                except (ValueError, IndexError):
-                    pass
-                return None
-            
-            # 复制美团文件并处理支付合计
-            meituan_processed = self.meituan_file.copy()
+            # 美团数据的支付合计在加载文件时已解析
+            meituan_processed = self.meituan_file
             if '支付合计' not in meituan_processed.columns and '结账方式' in meituan_processed.columns:
-                meituan_processed['支付合计'] = meituan_processed['结账方式'].apply(extract_payment)
+                meituan_processed = meituan_processed.assign(支付合计=parse_payment_amounts(meituan_processed['结账方式']))
             
             # 安全地比较日期（使用下单时间的日期进行匹配）
             try:
                 if '下单时间' in meituan_processed.columns:
-                    # 确保下单时间是datetime类型
-                    meituan_dates = pd.to_datetime(meituan_processed['下单时间'], errors='coerce')
                     related_meituan = meituan_processed[
-                        meituan_dates.dt.date == reservation_date
+                        meituan_processed['下单时间'].dt.date == reservation_date
                     ]
                 else:
                     related_meituan = meituan_processed
@@ -787,9 +742,9 @@ class ReservationMatcherWeb:
                     # 格式化显示
                     for col in meituan_display.columns:
                         if col == '支付合计':
-                            meituan_display[col] = meituan_display[col].apply(lambda x: f"¥{x}" if pd.notna(x) and str(x) != 'nan' else '')
+                            meituan_display[col] = meituan_display[col].map(lambda x: format_amount(x, prefix='¥'))
                         else:
-                            meituan_display[col] = meituan_display[col].astype(str).replace('nan', '')
+                            meituan_display[col] = display_text(meituan_display[col])
                     
                     # 重命名列标题使其更简洁
                     column_rename = {
@@ -827,34 +782,14 @@ class ReservationMatcherWeb:
             # 确认匹配按钮
             if st.button("确认匹配", type="primary"):
                 if selected_meituan_indices:
-                    # 获取原始预订记录
-                    original_reservation = self.merged_df.loc[reservation_idx].copy()
-                    
-                    # 为每个选中的美团订单创建匹配记录
-                    new_records = []
-                    for i, meituan_idx in enumerate(selected_meituan_indices):
-                        meituan_record = related_meituan.loc[meituan_idx]
-                        
-                        # 创建新的匹配记录
-                        new_record = original_reservation.copy()
-                        new_record['匹配状态'] = '已匹配'
-                        new_record['下单时间'] = str(meituan_record.get('下单时间', ''))
-                        new_record['下单时间_格式化'] = str(meituan_record.get('下单时间', ''))
-                        new_record['结账方式'] = str(meituan_record.get('结账方式', ''))
-                        
-                        # 如果是第一个记录，更新原记录；否则添加新记录
-                        if i == 0:
-                            # 更新原记录
-                            for col in new_record.index:
-                                self.merged_df.at[reservation_idx, col] = new_record[col]
-                        else:
-                            # 添加新记录到列表
-                            new_records.append(new_record)
-                    
-                    # 将新记录添加到DataFrame
-                    if new_records:
-                        new_df = pd.DataFrame(new_records)
-                        self.merged_df = pd.concat([self.merged_df, new_df], ignore_index=True)
+                    # 第一个订单写入该预订记录，其余订单各追加一条匹配记录（记入编辑记录，可撤销）
+                    # 订单ID为订单在读取结果中的行位置
+                    order_ids = self.meituan_file.index.get_indexer(selected_meituan_indices)
+                    orders = [
+                        order_result_values(related_meituan.loc[idx], int(order_id))
+                        for idx, order_id in zip(selected_meituan_indices, order_ids)
+                    ]
+                    self.record_edit('match', reservation_idx, orders)
                     
                     st.success(f"匹配成功！已为 {len(selected_meituan_indices)} 个美团订单创建匹配记录。页面将自动刷新")
                     st.rerun()
@@ -902,109 +837,24 @@ class ReservationMatcherWeb:
             st.warning("没有匹配成功的数据可导出")
             return
         
-        # 准备导出的列
-        export_columns = ['下单时间', '预订人', '桌牌号', '支付合计', '结账方式', '匹配类型']
-        
-        # 检查并选择可用的列
-        available_columns = []
-        for col in export_columns:
-            if col in export_df.columns:
-                available_columns.append(col)
-            elif col == '预订人' and '客户姓名' in export_df.columns:
-                available_columns.append('客户姓名')
-                export_df = export_df.rename(columns={'客户姓名': '预订人'})
-        
-        # 创建导出用的DataFrame
-        final_export_df = export_df[available_columns].copy()
-        
-        # 按日期排序（如果有下单时间列）
-        if '下单时间' in final_export_df.columns:
-            final_export_df = final_export_df.sort_values('下单时间')
-        
-        # 创建Excel文件
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            final_export_df.to_excel(writer, sheet_name='匹配结果', index=False)
-            
-            # 获取工作表并设置格式
-            worksheet = writer.sheets['匹配结果']
-            
-            # 设置Excel格式
-            from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-            
-            # 定义样式
-            header_font = Font(bold=True, size=12)
-            header_fill = PatternFill(start_color="E6F3FF", end_color="E6F3FF", fill_type="solid")
-            center_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-            border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-            
-            # 设置表头样式
-            for cell in worksheet[1]:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = center_alignment
-                cell.border = border
-            
-            # 设置数据行样式
-            for row in worksheet.iter_rows(min_row=2):
-                for cell in row:
-                    cell.alignment = center_alignment
-                    cell.border = border
-            
-            # 智能调整列宽
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                
-                # 计算列的最大内容长度
-                for cell in column:
-                    try:
-                        cell_value = str(cell.value) if cell.value is not None else ""
-                        # 中文字符按2个字符计算宽度
-                        char_count = sum(2 if ord(char) > 127 else 1 for char in cell_value)
-                        if char_count > max_length:
-                            max_length = char_count
-                    except:
-                        pass
-                
-                # 根据列内容设置合适的宽度
-                if column_letter == 'A':  # 下单时间列
-                    adjusted_width = max(22, min(max_length + 4, 28))
-                elif column_letter == 'B':  # 预订人列
-                    adjusted_width = max(15, min(max_length + 3, 25))
-                elif column_letter == 'C':  # 桌牌号列
-                    adjusted_width = max(12, min(max_length + 3, 18))
-                elif column_letter == 'D':  # 支付合计列
-                    adjusted_width = max(15, min(max_length + 3, 22))
-                elif column_letter == 'E':  # 结账方式列
-                    adjusted_width = max(25, min(max_length + 5, 40))  # 增加结账方式列宽度
-                elif column_letter == 'F':  # 匹配类型列
-                    adjusted_width = max(12, min(max_length + 3, 18))
-                else:
-                    adjusted_width = max(15, min(max_length + 3, 35))
-                
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-            
-            # 设置行高
-            for row in range(1, worksheet.max_row + 1):
-                worksheet.row_dimensions[row].height = 35  # 增加行高以适应多行内容
-            
-            # 特别处理表头行高
-            worksheet.row_dimensions[1].height = 30
-        
-        excel_data = output.getvalue()
+        # 生成带格式的Excel较慢（数万行需十几秒），只在点击后生成；导出的数据不变时复用上次生成的文件
+        export_key = (frame_fingerprint(export_df), filename_suffix)
+        cached_key, excel_data = self.export_file
+        if cached_key != export_key:
+            excel_data = None
+            if st.button(f"📊 生成Excel ({len(export_df)}条记录)", use_container_width=True, key="build_export"):
+                with st.spinner("正在生成Excel..."):
+                    excel_data = export_excel_bytes(build_export_frame(export_df))
+                self.export_file = (export_key, excel_data)
+        if excel_data is None:
+            return
         
         # 生成文件名
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"匹配结果_{filename_suffix}_{timestamp}.xlsx"
         
         st.download_button(
-            label=f"📥 下载Excel ({len(final_export_df)}条记录)",
+            label=f"📥 下载Excel ({len(export_df)}条记录)",
             data=excel_data,
             file_name=filename,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
@@ -1013,77 +863,48 @@ class ReservationMatcherWeb:
     
     def get_filtered_data(self):
         """获取当前筛选和搜索后的数据"""
-        display_df = self.merged_df.copy()
-        
-        # 应用筛选（从session_state获取当前筛选条件）
+        # 从session_state获取当前筛选条件
         filter_option = getattr(st.session_state, 'filter_option', "全部记录")
         search_keyword = getattr(st.session_state, 'search_keyword', "")
+        return self.filter_records(filter_option, search_keyword)
+    
+    def filter_records(self, filter_option, search_keyword):
+        """按匹配状态和预订人关键词筛选记录（未筛选时返回merged_df本身，调用方不得原地修改）"""
+        display_df = self.merged_df
         
         if filter_option == "已匹配记录":
             display_df = display_df[display_df['匹配状态'] == '已匹配']
         elif filter_option == "未匹配记录":
             display_df = display_df[display_df['匹配状态'] == '未匹配']
         
-        if search_keyword:
-            if '预订人' in display_df.columns:
-                # 标准化搜索关键词
-                def standardize_search_keyword(keyword):
-                    keyword = keyword.strip()
-                    if keyword in ['平和', '平哥']:
-                        return ['平和', '平哥']  # 返回所有同义词
-                    elif keyword in ['刘霞', '刘']:
-                        return ['刘霞', '刘']  # 返回刘霞和刘的所有变体
-                    elif keyword in ['周', '周思玗']:
-                        return ['周', '周思玗']  # 返回周和周思玗的所有变体
-                    elif keyword.lower() == 'sk':
-                        return ['SK', 'sk', 'Sk', 'sK']  # 返回所有大小写变体
-                    else:
-                        return [keyword]
-                
-                search_terms = standardize_search_keyword(search_keyword)
-                # 创建搜索条件，匹配任何一个同义词
-                search_condition = False
-                for term in search_terms:
-                    search_condition |= display_df['预订人'].astype(str).str.contains(term, case=False, na=False)
-                display_df = display_df[search_condition]
+        if search_keyword and search_keyword.strip() and '预订人' in display_df.columns:
+            keyword = search_keyword.strip()
+            canonical_keyword = canonical_name(keyword)
+            # 原始姓名包含关键词，或标准名包含关键词的标准名（同义词）
+            search_condition = (
+                display_df['预订人'].astype(str).str.contains(keyword, case=False, regex=False, na=False) |
+                self.customer_names(display_df).str.contains(canonical_keyword, case=False, regex=False, na=False)
+            )
+            display_df = display_df[search_condition]
         
         return display_df
     
-    def normalize_customer_name(self, name):
-        """标准化预订人姓名"""
-        if pd.isna(name) or str(name).strip() == '':
-            return None
-        
-        name = str(name).strip()
-        
-        # 转换为小写进行比较
-        name_lower = name.lower()
-        
-        # 定义姓名映射规则
-        name_mappings = {
-            'sk': 'SK',  # sk -> SK
-            '平': '平哥',  # 平 -> 平哥
-            '平哥': '平哥',  # 平哥保持不变
-            '周': '周',  # 周保持不变
-        }
-        
-        # 检查是否需要映射
-        for key, value in name_mappings.items():
-            if name_lower == key.lower():
-                return value
-        
-        # 如果没有特殊映射，返回原始名称（保持原有大小写）
-        return name
+    def customer_names(self, df=None):
+        """预订人标准名列（缓存在merged_df中，缺失时补算一次）"""
+        if CANONICAL_NAME_COLUMN not in self.merged_df.columns and '预订人' in self.merged_df.columns:
+            self.merged_df[CANONICAL_NAME_COLUMN] = canonical_names(self.merged_df['预订人'])
+        if df is None:
+            df = self.merged_df
+        if CANONICAL_NAME_COLUMN not in df.columns:
+            return canonical_names(df['预订人'])
+        return df[CANONICAL_NAME_COLUMN]
     
     def get_standardized_customers(self):
         """获取标准化后的预订人列表"""
         if '预订人' not in self.merged_df.columns:
             return []
         
-        # 标准化所有预订人姓名
-        standardized_names = self.merged_df['预订人'].apply(self.normalize_customer_name)
-        standardized_names = standardized_names.dropna().unique()
-        
+        standardized_names = self.customer_names().dropna().unique()
         return sorted([name for name in standardized_names if name])
     
     def show_data_analysis(self):
@@ -1094,6 +915,9 @@ class ReservationMatcherWeb:
             st.warning("暂无数据，请先在'文件处理'标签页中上传文件并进行匹配")
             return
         
+        # 图表库只在有数据可分析时导入，避免拖慢启动
+        import plotly.express as px
+        
         # 创建两列布局
         col1, col2 = st.columns([1, 2])
         
@@ -1140,11 +964,10 @@ class ReservationMatcherWeb:
             
             # 检查是否有选择的客户进行分析
             if hasattr(st.session_state, 'analysis_customer') and st.session_state.analysis_customer:
-                customer_name = st.session_state.analysis_customer
+                customer_name = canonical_name(st.session_state.analysis_customer)
                 
                 # 筛选该客户的数据（使用标准化姓名匹配）
-                standardized_customer_names = self.merged_df['预订人'].apply(self.normalize_customer_name)
-                customer_data = self.merged_df[standardized_customer_names == customer_name]
+                customer_data = self.merged_df[self.customer_names() == customer_name]
                 
                 if customer_data.empty:
                     st.warning(f"未找到预订人'{customer_name}'的相关数据")
@@ -1174,9 +997,7 @@ class ReservationMatcherWeb:
                         # 计算总消费金额（仅匹配成功的订单）
                         matched_data = customer_data[customer_data['匹配状态'] == '已匹配']
                         if not matched_data.empty and '支付合计' in matched_data.columns:
-                            # 提取支付金额的数字部分
-                            amounts = matched_data['支付合计'].astype(str).str.extract(r'([0-9.]+)').astype(float)
-                            total_amount = amounts.sum().iloc[0] if not amounts.empty else 0
+                            total_amount = pd.to_numeric(matched_data['支付合计'], errors='coerce').sum()
                             st.metric("总消费金额", f"¥{total_amount:.2f}")
                         else:
                             st.metric("总消费金额", "¥0.00")
@@ -1281,7 +1102,8 @@ class ReservationMatcherWeb:
                     # 桌牌号偏好分析
                     if '桌牌号' in customer_data.columns:
                         st.markdown("#### 🪑 桌牌号偏好分析")
-                        table_counts = customer_data['桌牌号'].value_counts().head(10)
+                        table_counts = customer_data['桌牌号'].value_counts()
+                        table_counts = table_counts[table_counts > 0].head(10)
                         
                         if not table_counts.empty:
                              fig_bar = px.bar(
@@ -1319,7 +1141,10 @@ class ReservationMatcherWeb:
                         st.dataframe(
                             display_data,
                             use_container_width=True,
-                            hide_index=True
+                            hide_index=True,
+                            column_config={
+                                "支付合计": st.column_config.NumberColumn("支付合计", format="¥%.2f")
+                            }
                         )
                         
                         # 导出该客户的数据
@@ -1350,9 +1175,9 @@ class ReservationMatcherWeb:
                 # 最活跃的预订人Top 10
                 if '预订人' in self.merged_df.columns:
                     # 使用标准化后的姓名进行统计
-                    standardized_names = self.merged_df['预订人'].apply(self.normalize_customer_name)
-                    valid_customers = standardized_names.dropna()
-                    top_customers = valid_customers.value_counts().head(10)
+                    valid_customers = self.customer_names().dropna()
+                    top_customers = valid_customers.value_counts()
+                    top_customers = top_customers[top_customers > 0].head(10)
                     
                     if not top_customers.empty:
                          st.markdown("#### 🏆 最活跃预订人 (Top 10)")
@@ -1513,16 +1338,13 @@ def main():
                 st.warning(message)
             else:
                 st.success("文件已就绪")
+                app.render_match_settings()
                 
                 if st.button("🚀 开始匹配", type="primary", use_container_width=True):
-                    with st.spinner("匹配中..."):
-                        success, result_message = app.match_data()
-                        
-                    if success:
-                        st.success(result_message)
-                        st.info("请切换到'结果查看'标签页")
-                    else:
-                        st.error(result_message)
+                    app.submit_match_job()
+            
+            # 后台匹配任务进度和结果（刷新页面后按任务编号恢复）
+            app.render_match_job()
     
     with tab2:
         # 查看结果和导出合并
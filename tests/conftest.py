@@ -0,0 +1,77 @@
+"""
+测试公用数据：一份小的美团订单CSV和预订记录CSV，覆盖完全匹配、数字匹配、外卖匹配和未匹配
+
+运行: python -m pytest -q
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import matcher_core
+from matcher_core import (
+    RESERVATION_ID_COLUMN, DiskFrameCache,
+    load_meituan_data, load_reservation_data, prepare_meituan_orders, prepare_reservations
+)
+
+# 美团订单：表头在第3行；包含未结账、非营业时间的订单和 '--' 合计行
+MEITUAN_CSV = """美团订单导出
+门店: 测试店
+营业日期,桌牌号,下单时间,结账方式,订单状态
+2025-03-01,8,2025-03-01 12:05:00,微信:120.5,已结账
+2025-03-01,A8,2025-03-01 12:30:00,现金 80,已结账
+2025-03-01,外卖8,2025-03-01 13:00:00,美团:45,已结账
+2025-03-01,8,2025-03-01 18:10:00,支付宝:300,已结账
+2025-03-01,12,2025-03-01 18:20:00,微信:99,未结账
+2025-03-01,12,2025-03-01 03:20:00,微信:10,已结账
+2025-03-02,V2,2025-03-02 19:00:00,微信:200,已结账
+2025-03-02,08,2025-03-02 11:00:00,微信:66,已结账
+2025-03-02,,2025-03-02 12:00:00,微信:50,已结账
+2025-03-02,6,2025-03-02 13:30:00,微信:75,已结账
+--,合计,,,
+"""
+
+# 预订记录：包含别名写法、空桌牌号和匹配不到订单的预订
+RESERVATION_CSV = """日期,市别,包厢,姓名,预订人,经手人
+2025-03-01,午市,8,张三,平哥,小李
+2025-03-01,晚市,8,李四,刘,小李
+2025-03-01,晚市,12,王五,周,小王
+2025-03-02,晚市,V2,赵六,sk,小王
+2025-03-02,午市,8,钱七,平和,小李
+2025-03-02,午市,,孙八,刘霞,小李
+2025-03-02,午市,6,周九,SK,小王
+"""
+
+
+@pytest.fixture(autouse=True)
+def isolated_shared_state(tmp_path, monkeypatch):
+    """进程内共享的手动修改存储和解析磁盘缓存改用临时目录，测试结束后清空共享缓存"""
+    monkeypatch.setattr(matcher_core.MATCH_OVERRIDES, 'path', tmp_path / 'overrides.sqlite3')
+    monkeypatch.setattr(matcher_core.PARSE_CACHE, 'disk_cache', DiskFrameCache(tmp_path / 'parsed'))
+    yield
+    matcher_core.PARSE_CACHE.clear()
+    matcher_core.MATCH_RESULTS.clear()
+
+
+def load_csv(text, loader):
+    return loader(io.BytesIO(text.encode('utf-8')))
+
+
+@pytest.fixture
+def inputs():
+    """读取后的(美团订单, 预订记录)"""
+    return load_csv(MEITUAN_CSV, load_meituan_data), load_csv(RESERVATION_CSV, load_reservation_data)
+
+
+@pytest.fixture
+def prepared(inputs):
+    """整理后可直接匹配的(预订记录, 美团订单)，预订按顺序编号"""
+    meituan_df, reservation_df = inputs
+    reservations = prepare_reservations(reservation_df)
+    reservations[RESERVATION_ID_COLUMN] = pd.array(range(len(reservations)), dtype='int32')
+    return reservations, prepare_meituan_orders(meituan_df)
@@ -0,0 +1,157 @@
+"""匹配接口和后台任务接口：在本地端口启动 api/index.py 的服务，按HTTP请求检查返回内容"""
+
+import base64
+import importlib.util
+import io
+import json
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pandas as pd
+import pytest
+
+from conftest import MEITUAN_CSV, RESERVATION_CSV
+
+spec = importlib.util.spec_from_file_location('api_index', Path(__file__).resolve().parent.parent / 'api' / 'index.py')
+api = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(api)
+
+
+@pytest.fixture
+def server():
+    """在随机端口启动接口服务，返回服务地址"""
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), api.handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def multipart(fields):
+    """组装multipart/form-data请求体，值为bytes的字段作为文件上传"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        if isinstance(value, bytes):
+            head = f'Content-Disposition: form-data; name="{name}"; filename="{name}.csv"\r\nContent-Type: text/csv'
+        else:
+            head, value = f'Content-Disposition: form-data; name="{name}"', str(value).encode('utf-8')
+        parts.append(f"--{boundary}\r\n{head}\r\n\r\n".encode('utf-8') + value + b"\r\n")
+    return b''.join(parts) + f"--{boundary}--\r\n".encode('utf-8'), f"multipart/form-data; boundary={boundary}"
+
+
+def request(url, fields=None):
+    """发送请求，返回(状态码, 响应头, 响应内容)；有fields时POST上传"""
+    if fields is None:
+        req = Request(url)
+    else:
+        body, content_type = multipart(fields)
+        req = Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    try:
+        with urlopen(req, timeout=60) as response:
+            return response.status, response.headers, response.read()
+    except HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def uploads(**options):
+    return {'meituan': MEITUAN_CSV.encode('utf-8'), 'reservation': RESERVATION_CSV.encode('utf-8'), **options}
+
+
+def test_match_returns_summary_and_result_file(server):
+    status, _, body = request(f"{server}/api/match", uploads(format='csv', all_records='1'))
+    assert status == 200
+    payload = json.loads(body)
+    summary, result = payload['summary'], payload['result']
+    assert (summary['meituan_rows'], summary['reservation_rows']) == (10, 7)
+    assert (summary['total'], summary['matched'], summary['unmatched']) == (9, 7, 2)
+    assert result['format'] == 'csv' and result['rows'] == 9
+    result_df = pd.read_csv(io.BytesIO(base64.b64decode(result['content_base64'])))
+    assert len(result_df) == 9
+    
+    # 直接下载：内容为结果文件，统计信息在响应头中
+    status, headers, body = request(f"{server}/api/match?download=1&format=csv", uploads())
+    assert status == 200
+    assert headers['Content-Type'] == 'text/csv'
+    assert json.loads(headers['X-Match-Summary'])['matched'] == 7
+    assert len(pd.read_csv(io.BytesIO(body))) == 7
+
+
+def test_match_rejects_bad_requests(server, monkeypatch):
+    status, _, body = request(f"{server}/api/match", {'meituan': MEITUAN_CSV.encode('utf-8')})
+    assert status == 400 and 'reservation' in json.loads(body)['error']
+    
+    status, _, body = request(f"{server}/api/match", uploads(format='pdf'))
+    assert status == 400 and '不支持的导出格式' in json.loads(body)['error']
+    
+    status, _, body = request(f"{server}/api/match", uploads(top_k='many'))
+    assert status == 400 and 'top_k' in json.loads(body)['error']
+    
+    monkeypatch.setenv(api.MAX_UPLOAD_MB_ENV, '0.001')
+    status, _, _ = request(f"{server}/api/match", uploads())
+    assert status == 413
+    
+    status, _, _ = request(f"{server}/api/match")
+    assert status == 405
+    status, _, body = request(f"{server}/api/health")
+    assert status == 200 and json.loads(body) == {'status': 'ok'}
+
+
+def wait_for_job(server, status_url, timeout=60):
+    """轮询任务状态直到结束，返回最后一次的状态"""
+    deadline = time.monotonic() + timeout
+    while True:
+        status, _, body = request(f"{server}{status_url}")
+        assert status == 200
+        job = json.loads(body)
+        if job['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+
+def test_job_runs_in_background_and_serves_result(server):
+    status, _, body = request(f"{server}/api/jobs", uploads(format='csv'))
+    assert status == 202
+    submitted = json.loads(body)
+    assert submitted['result_url'] == f"/api/jobs/{submitted['job_id']}/result?format=csv"
+    
+    job = wait_for_job(server, submitted['status_url'])
+    assert job['status'] == 'done' and job['result_available']
+    assert (job['summary']['total'], job['summary']['matched']) == (9, 7)
+    
+    status, headers, body = request(f"{server}{submitted['result_url']}")
+    assert status == 200
+    assert headers['Content-Type'] == 'text/csv'
+    assert len(pd.read_csv(io.BytesIO(body))) == 7
+    status, _, body = request(f"{server}/api/jobs/{submitted['job_id']}/result?format=pdf")
+    assert status == 400
+    
+    # 结果释放后只能查询状态，下载返回410
+    api.MATCH_JOBS.get(submitted['job_id']).release_result()
+    status, _, body = request(f"{server}{submitted['result_url']}")
+    assert status == 410 and json.loads(body)['result_available'] is False
+
+
+def test_job_errors(server):
+    status, _, body = request(f"{server}/api/jobs", uploads(format='pdf'))
+    assert status == 400 and '不支持的导出格式' in json.loads(body)['error']
+    
+    status, _, _ = request(f"{server}/api/jobs/unknown")
+    assert status == 404
+    status, _, _ = request(f"{server}/api/jobs/unknown/result")
+    assert status == 404
+    
+    # 读取失败的任务记录错误信息，不提供结果
+    header = '营业日期,桌牌号,下单时间,结账方式,订单状态'
+    broken = MEITUAN_CSV.replace(header, header.replace('订单状态', '备注')).encode('utf-8')
+    status, _, body = request(f"{server}/api/jobs", uploads(meituan=broken))
+    job = wait_for_job(server, json.loads(body)['status_url'])
+    assert job['status'] == 'failed' and '缺少必要列' in job['error']
+    status, _, _ = request(f"{server}/api/jobs/{job['job_id']}/result")
+    assert status == 409
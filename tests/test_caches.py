@@ -0,0 +1,139 @@
+"""缓存：上传文件解析缓存及其磁盘缓存、跨会话共享的匹配结果缓存"""
+
+import os
+import threading
+import time
+
+import pandas as pd
+
+import matcher_core
+from matcher_core import (
+    DiskFrameCache, MatchResultCache, ParsedFileCache, load_meituan_data, load_reservation_data, run_matching
+)
+
+from conftest import MEITUAN_CSV, RESERVATION_CSV
+
+
+def counting(loader):
+    """记录调用次数的加载函数，保持原函数名（缓存键包含加载函数名）"""
+    def wrapper(source, **options):
+        wrapper.calls += 1
+        return loader(source, **options)
+    wrapper.calls = 0
+    wrapper.__name__ = loader.__name__
+    return wrapper
+
+
+def test_parsed_file_cache_hits_by_content():
+    cache = ParsedFileCache(max_entries=2)
+    loader = counting(load_meituan_data)
+    data = MEITUAN_CSV.encode('utf-8')
+    
+    first, hit = cache.get_or_load(data, loader)
+    assert not hit
+    # 内容相同（不同的bytes对象）直接返回同一个DataFrame
+    second, hit = cache.get_or_load(bytes(bytearray(data)), loader)
+    assert hit and second is first
+    # 解析选项不同时分别缓存
+    _, hit = cache.get_or_load(data, loader, engine='csv')
+    assert not hit
+    assert loader.calls == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_parsed_file_cache_evicts_least_recently_used():
+    cache = ParsedFileCache(max_entries=2)
+    meituan, reservation = counting(load_meituan_data), counting(load_reservation_data)
+    meituan_data, reservation_data = MEITUAN_CSV.encode('utf-8'), RESERVATION_CSV.encode('utf-8')
+    
+    cache.get_or_load(meituan_data, meituan)
+    cache.get_or_load(reservation_data, reservation)
+    cache.get_or_load(meituan_data, meituan)
+    # 第三个条目淘汰最久未用的预订文件
+    cache.get_or_load(meituan_data, meituan, engine='csv')
+    _, hit = cache.get_or_load(meituan_data, meituan)
+    assert hit
+    _, hit = cache.get_or_load(reservation_data, reservation)
+    assert not hit
+    assert (meituan.calls, reservation.calls) == (2, 2)
+
+
+def test_disk_cache_survives_restart(tmp_path):
+    data = RESERVATION_CSV.encode('utf-8')
+    loader = counting(load_reservation_data)
+    original, _ = ParsedFileCache(disk_cache=DiskFrameCache(tmp_path, 1024 * 1024)).get_or_load(data, loader)
+    
+    # 新的进程内缓存（相当于重启后）从磁盘读取，不再解析文件；类型和 attrs 保持不变
+    cache = ParsedFileCache(disk_cache=DiskFrameCache(tmp_path, 1024 * 1024))
+    restored, hit = cache.get_or_load(data, loader)
+    assert hit and loader.calls == 1 and cache.disk_hits == 1
+    pd.testing.assert_frame_equal(restored, original, check_exact=True)
+    assert restored.attrs['failed_sheets'] == []
+    
+    # 损坏的缓存文件被删除并重新解析
+    next(tmp_path.glob('*.arrow')).write_bytes(b'broken')
+    _, hit = ParsedFileCache(disk_cache=DiskFrameCache(tmp_path, 1024 * 1024)).get_or_load(data, loader)
+    assert not hit and loader.calls == 2
+
+
+def test_disk_cache_evicts_oldest_files(tmp_path):
+    frame = pd.DataFrame({'值': range(1000)})
+    cache = DiskFrameCache(tmp_path, 1024 * 1024)
+    cache.store('旧', frame)
+    old_path = cache.path_for('旧')
+    os.utime(old_path, (0, 0))
+    
+    # 上限只够放一个文件：写入新文件后删除最久未用的旧文件
+    cache.max_bytes = old_path.stat().st_size * 3 // 2
+    cache.store('新', frame)
+    assert not old_path.exists()
+    pd.testing.assert_frame_equal(cache.load('新'), frame)
+    cache.clear()
+    assert cache.load('新') is None
+
+
+def test_match_result_cache_shares_copies(inputs):
+    meituan_df, reservation_df = inputs
+    cache = MatchResultCache(max_bytes=1024 * 1024)
+    first, hit = cache.get_or_match(meituan_df, reservation_df, workers=1)
+    assert not hit
+    # 内容相同的另一份输入命中缓存，取出的是副本
+    second, hit = cache.get_or_match(meituan_df.copy(), reservation_df.copy(), workers=1)
+    assert hit and second is not first
+    second.loc[0, '匹配状态'] = '已匹配'
+    third, _ = cache.get_or_match(meituan_df, reservation_df, workers=1)
+    pd.testing.assert_frame_equal(third, first)
+    # 匹配设置不同时分别缓存
+    _, hit = cache.get_or_match(meituan_df, reservation_df, workers=1, top_k=1)
+    assert not hit
+    assert (cache.hits, cache.misses, len(cache.entries)) == (2, 2, 2)
+    
+    # 超过内存上限的结果不缓存
+    small = MatchResultCache(max_bytes=1)
+    small.get_or_match(meituan_df, reservation_df, workers=1)
+    assert small.total_bytes == 0 and not small.entries
+
+
+def test_match_result_cache_computes_concurrent_requests_once(inputs, monkeypatch):
+    meituan_df, reservation_df = inputs
+    calls = []
+    
+    def slow_matching(*args):
+        calls.append(args)
+        time.sleep(0.2)
+        return run_matching(*args)
+    
+    monkeypatch.setattr(matcher_core, 'run_matching', slow_matching)
+    cache = MatchResultCache(max_bytes=1024 * 1024)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_match(meituan_df, reservation_df, workers=1)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(hit for _, hit in results) == [False, True, True, True]
+    assert not cache.key_locks
@@ -0,0 +1,152 @@
+"""手动编辑：移除匹配、手动匹配及其撤销和重做，保存的手动修改在重新匹配后恢复"""
+
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import pytest
+
+import match_cli
+from matcher_core import (
+    MATCH_OVERRIDES, ORDER_ID_COLUMN, MatchEditLog, MatchOverrideStore,
+    describe_overrides, edit_overrides, order_result_values, run_matching
+)
+
+
+@pytest.fixture
+def matched(inputs):
+    """(美团订单, 自动匹配结果)"""
+    meituan_df, reservation_df = inputs
+    return meituan_df, run_matching(meituan_df, reservation_df, workers=1)
+
+
+def manual_edits(log, result_df, meituan_df):
+    """移除第一条已匹配记录，再把两个自动匹配不到的订单手动匹配给第一条未匹配记录"""
+    matched_id = result_df.index[result_df['匹配状态'] == '已匹配'][0]
+    unmatched_id = result_df.index[result_df['匹配状态'] == '未匹配'][0]
+    orders = [order_result_values(meituan_df.iloc[i], i) for i in (5, 7)]
+    result_df = log.record(result_df, 'unmatch', matched_id)
+    return log.record(result_df, 'match', unmatched_id, orders)
+
+
+def test_edit_log_undo_restores_base_frame(matched):
+    meituan_df, base = matched
+    log = MatchEditLog()
+    edited = manual_edits(log, base.copy(), meituan_df)
+    assert len(edited) == len(base) + 1
+    assert edited[ORDER_ID_COLUMN].dtype == base[ORDER_ID_COLUMN].dtype
+    
+    # 手动匹配的两行标记为手动匹配，被移除的匹配标记为未匹配
+    unmatch_edit, match_edit = log.applied()
+    manual_ids = [match_edit['row_id']] + match_edit['added_ids']
+    assert edited.loc[manual_ids, '匹配类型'].tolist() == ['手动匹配', '手动匹配']
+    assert edited.loc[manual_ids, ORDER_ID_COLUMN].tolist() == [5, 7]
+    assert edited.loc[unmatch_edit['row_id'], '匹配类型'] == '未匹配'
+    
+    restored = log.undo(log.undo(edited.copy()))
+    pd.testing.assert_frame_equal(restored, base)
+    assert '手动匹配' not in restored['匹配类型'].tolist()
+    
+    redone = log.redo(log.redo(restored))
+    pd.testing.assert_frame_equal(redone, edited)
+
+
+def test_order_values_keep_missing_payment(matched):
+    meituan_df, base = matched
+    order = meituan_df.iloc[7].copy()
+    order['结账方式'] = None
+    values = order_result_values(order, 7)
+    assert values['结账方式'] is None
+    
+    row_id = base.index[base['匹配状态'] == '未匹配'][0]
+    edited = MatchEditLog().record(base.copy(), 'match', row_id, [values])
+    assert pd.isna(edited.loc[row_id, '结账方式'])
+    assert edited.loc[row_id, '下单时间_格式化'] == '11:00:00'
+
+
+def save_edits(store, log, edited):
+    for edit in log.applied():
+        assert store.add(edit_overrides(edited, edit))
+
+
+def test_overrides_reapplied_after_rematch(inputs, matched, tmp_path):
+    meituan_df, base = matched
+    store = MatchOverrideStore(tmp_path / 'overrides.sqlite3')
+    log = MatchEditLog()
+    edited = manual_edits(log, base.copy(), meituan_df)
+    save_edits(store, log, edited)
+    
+    # 重新匹配后套用保存的修改，结果与手动编辑后的相同
+    meituan_df, reservation_df = inputs
+    rematched = run_matching(meituan_df, reservation_df, workers=1)
+    restored, count = store.apply(rematched, meituan_df)
+    assert count == 3
+    pd.testing.assert_frame_equal(restored, edited)
+    
+    assert store.clear() == 3
+    _, count = store.apply(rematched, meituan_df)
+    assert count == 0
+
+
+def test_manual_match_reapplied_to_booking_with_other_matches(inputs, matched, tmp_path):
+    meituan_df, base = matched
+    store = MatchOverrideStore(tmp_path / 'overrides.sqlite3')
+    log = MatchEditLog()
+    # 张三还有其他自动匹配的订单：移除订单0和订单1，再按相反的顺序手动匹配订单7、订单5到这两行
+    row_ids = [base.index[(base['客户姓名'] == '张三') & (base[ORDER_ID_COLUMN] == i)][0] for i in (0, 1)]
+    edited = log.record(base.copy(), 'unmatch', row_ids[0])
+    edited = log.record(edited, 'unmatch', row_ids[1])
+    edited = log.record(edited, 'match', row_ids[1], [order_result_values(meituan_df.iloc[7], 7)])
+    edited = log.record(edited, 'match', row_ids[0], [order_result_values(meituan_df.iloc[5], 5)])
+    save_edits(store, log, edited)
+    
+    restored, count = store.apply(run_matching(*inputs, workers=1), meituan_df)
+    assert count == 4
+    assert restored.loc[row_ids, ORDER_ID_COLUMN].tolist() == [5, 7]
+    assert restored.loc[row_ids, '匹配类型'].tolist() == ['手动匹配', '手动匹配']
+    pd.testing.assert_frame_equal(restored, edited)
+
+
+def test_override_store_upgrades_old_table(matched, tmp_path):
+    meituan_df, base = matched
+    path = tmp_path / 'overrides.sqlite3'
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute(
+            "CREATE TABLE overrides (kind TEXT NOT NULL, reservation_key TEXT NOT NULL, order_key TEXT NOT NULL, "
+            "seq INTEGER NOT NULL, amount REAL, order_time TEXT, payment TEXT, created_at TEXT NOT NULL, "
+            "PRIMARY KEY (reservation_key, order_key))"
+        )
+    store = MatchOverrideStore(path)
+    log = MatchEditLog()
+    save_edits(store, log, manual_edits(log, base.copy(), meituan_df))
+    overrides = store.load()
+    assert len(overrides) == 3 and 'replaces' in overrides.columns
+    
+    # 旧版本保存的记录没有预订信息，列表中以身份键区分
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("UPDATE overrides SET booking_date = NULL, market = NULL, table_no = NULL, booker = NULL")
+    listing = describe_overrides(store.load())
+    assert listing['预订人'].str.startswith('#').all()
+
+
+def test_saved_overrides_are_listed_and_deleted_one_by_one(matched, inputs, capsys):
+    meituan_df, base = matched
+    log = MatchEditLog()
+    save_edits(MATCH_OVERRIDES, log, manual_edits(log, base.copy(), meituan_df))
+    
+    # 列表显示预订信息：移除了张三（平哥）的订单0，把订单5、7手动匹配给王五（周）
+    listing = describe_overrides(MATCH_OVERRIDES.load())
+    assert listing[['操作', '日期', '市别', '桌牌号', '预订人', '支付合计']].values.tolist() == [
+        ['移除匹配', '2025-03-01', '午市', '8', '平哥', '120.50'],
+        ['手动匹配', '2025-03-01', '晚市', '12', '周', '10.00'],
+        ['手动匹配', '2025-03-01', '晚市', '12', '周', '66.00'],
+    ]
+    assert match_cli.main(['--list-overrides']) == 0
+    assert '平哥' in capsys.readouterr().out
+    
+    # 删除订单7那条：重新匹配后只恢复移除匹配和订单5
+    assert match_cli.main(['--delete-override', str(listing['编号'].iloc[2])]) == 0
+    assert match_cli.main(['--delete-override', str(listing['编号'].iloc[2])]) == 1
+    restored, count = MATCH_OVERRIDES.apply(run_matching(*inputs, workers=1), meituan_df)
+    assert count == 2
+    assert restored.loc[restored['客户姓名'] == '王五', ORDER_ID_COLUMN].tolist() == [5]
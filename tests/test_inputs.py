@@ -0,0 +1,116 @@
+"""输入整理：预订人别名统一、美团订单的占位行过滤和列类型、预订工作表解析"""
+
+import io
+
+import pandas as pd
+import pytest
+
+import matcher_core
+from matcher_core import (
+    CANONICAL_NAME_COLUMN, PARALLEL_MIN_SHEETS, PARSE_WORKERS_ENV,
+    canonical_names, load_meituan_data, prepare_meituan_orders, prepare_reservations
+)
+
+import match_cli
+from conftest import MEITUAN_CSV, RESERVATION_CSV, load_csv
+
+# 营业日期列名带后缀，日期有多种写法，营业日期为空的订单和 '--' 合计行混在中间
+MEITUAN_MIXED_CSV = """营业日期(自然日),桌牌号,下单时间,结账方式,订单状态,备注
+2025/03/01 周六,8,2025-03-01 12:05:00,微信:120.5,已结账,无
+,9,2025-03-01 12:30:00,现金 80,已结账,
+--,合计,,,,
+2025-03-01,10,2025/3/1 18:00,,未结账,
+"""
+
+
+def test_canonical_names_follow_alias_table():
+    names = pd.Series(['平哥', '平', ' 刘 ', '周', 'sk', 'Sk', '刘霞', '陌生人', None, ''], index=range(10, 20))
+    expected = ['平和', '平和', '刘霞', '周思玗', 'SK', 'SK', '刘霞', '陌生人', None, None]
+    assert canonical_names(names).tolist() == expected
+    assert canonical_names(names).index.equals(names.index)
+
+
+def test_prepared_reservations_carry_canonical_name(inputs):
+    _, reservation_df = inputs
+    reservations = prepare_reservations(reservation_df)
+    assert dict(zip(reservations['客户姓名'], reservations[CANONICAL_NAME_COLUMN])) == {
+        '张三': '平和', '李四': '刘霞', '王五': '周思玗', '赵六': 'SK',
+        '钱七': '平和', '孙八': '刘霞', '周九': 'SK',
+    }
+    # 原始写法保持不变，只新增标准名列
+    assert reservations['预订人'].tolist() == ['平哥', '刘', '周', 'sk', '平和', '刘霞', 'SK']
+
+
+def test_meituan_loading_drops_summary_rows_and_types_columns():
+    meituan_df = load_csv(MEITUAN_MIXED_CSV, load_meituan_data)
+    assert meituan_df['桌牌号'].tolist() == ['8', '9', '10']
+    assert '备注' not in meituan_df.columns
+    
+    assert pd.api.types.is_datetime64_any_dtype(meituan_df['营业日期'])
+    assert pd.api.types.is_datetime64_any_dtype(meituan_df['下单时间'])
+    assert isinstance(meituan_df['订单状态'].dtype, pd.CategoricalDtype)
+    assert meituan_df['营业日期'].tolist()[0] == pd.Timestamp('2025-03-01')
+    assert pd.isna(meituan_df['营业日期'].iloc[1])
+    assert meituan_df['下单时间'].iloc[2] == pd.Timestamp('2025-03-01 18:00')
+    assert meituan_df['支付合计'].tolist()[:2] == [120.5, 80.0]
+    assert pd.isna(meituan_df['结账方式'].iloc[2])
+    
+    # 营业日期为空的已结账订单仍按下单时间参与匹配
+    orders = prepare_meituan_orders(meituan_df)
+    assert orders['桌牌号'].tolist() == ['8', '9']
+    assert orders['市别'].tolist() == ['午市', '午市']
+
+
+def test_summary_row_in_fixture_is_dropped(inputs):
+    meituan_df, reservation_df = inputs
+    assert len(meituan_df) == 10
+    assert '合计' not in meituan_df['桌牌号'].tolist()
+    assert pd.api.types.is_datetime64_any_dtype(reservation_df['日期'])
+
+
+def reservation_workbook(sheets):
+    """把测试预订数据按行拆成多个工作表写出为xlsx"""
+    rows = pd.read_csv(io.StringIO(RESERVATION_CSV))
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for i in range(sheets):
+            rows.iloc[[i % len(rows)]].to_excel(writer, sheet_name=f'{i + 1:02d}', index=False)
+    return buffer.getvalue()
+
+
+def test_reservation_sheets_parse_serially_by_default(monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("默认不应启动进程池")
+    
+    data = reservation_workbook(PARALLEL_MIN_SHEETS + 1)
+    monkeypatch.delenv(PARSE_WORKERS_ENV, raising=False)
+    monkeypatch.setattr(matcher_core, 'ProcessPoolExecutor', no_pool)
+    serial = matcher_core.load_reservation_data(io.BytesIO(data))
+    assert serial['数据来源工作表'].tolist() == [f'{i + 1:02d}' for i in range(PARALLEL_MIN_SHEETS + 1)]
+    
+    # 设置多进程时分批解析（进程池不可用时同样分批在当前进程解析），结果顺序不变
+    def unavailable_pool(*args, **kwargs):
+        raise OSError("进程池不可用")
+    
+    monkeypatch.setenv(PARSE_WORKERS_ENV, '3')
+    monkeypatch.setattr(matcher_core, 'ProcessPoolExecutor', unavailable_pool)
+    batched = matcher_core.load_reservation_data(io.BytesIO(data))
+    pd.testing.assert_frame_equal(batched, serial)
+
+
+@pytest.mark.parametrize('column', ['下单时间', '结账方式', '订单状态'])
+def test_missing_meituan_column_is_reported_when_loading(column, tmp_path, capsys):
+    header = '营业日期,桌牌号,下单时间,结账方式,订单状态'
+    text = MEITUAN_CSV.replace(header, header.replace(column, '备注'))
+    with pytest.raises(ValueError, match=f"缺少必要列: {column}"):
+        load_csv(text, load_meituan_data)
+    
+    # 命令行同样在读取阶段报错退出
+    meituan_path, reservation_path = tmp_path / 'meituan.csv', tmp_path / 'reservation.csv'
+    meituan_path.write_text(text, encoding='utf-8')
+    reservation_path.write_text(RESERVATION_CSV, encoding='utf-8')
+    exit_code = match_cli.main([
+        '-m', str(meituan_path), '-r', str(reservation_path), '-o', str(tmp_path / 'out.csv'), '--no-overrides'
+    ])
+    assert exit_code == 1
+    assert f"缺少必要列: {column}" in capsys.readouterr().err
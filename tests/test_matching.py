@@ -0,0 +1,151 @@
+"""匹配引擎：连接匹配与原逐行匹配结果一致，并行匹配、增量匹配与一次性串行匹配结果一致"""
+
+import re
+
+import pandas as pd
+
+from matcher_core import (
+    MATCH_WORKERS_ENV, ORDER_ID_COLUMN, RESERVATION_ID_COLUMN, ROW_ID_NAME, PartitionMatchCache,
+    match_reservations, match_reservations_parallel, resolve_match_workers, run_matching
+)
+
+
+def legacy_smart_table_match(reservation_table, meituan_table):
+    """原界面中的逐行桌牌号比较（连接匹配引擎替换前的实现）"""
+    def extract_numbers(table_str):
+        if pd.isna(table_str):
+            return None
+        numbers = re.findall(r'\d+', str(table_str))
+        return ''.join(numbers) if numbers else None
+
+    def is_takeout(table_str):
+        if pd.isna(table_str):
+            return False
+        table_str = str(table_str).lower()
+        return any(keyword in table_str for keyword in ['外卖', 'takeout', '配送', '打包'])
+
+    if str(reservation_table) == str(meituan_table):
+        return True, "完全匹配"
+    res_numbers = extract_numbers(reservation_table)
+    mt_numbers = extract_numbers(meituan_table)
+    if res_numbers and mt_numbers and res_numbers == mt_numbers:
+        return True, "外卖匹配" if is_takeout(meituan_table) else "数字匹配"
+    return False, "无匹配"
+
+
+def legacy_match(reservations, mt_df):
+    """原逐行匹配循环：每个预订按日期、市别筛选订单后逐个比较桌牌号，返回[(预订ID, 订单ID, 匹配类型)]"""
+    rows = []
+    order_dates = mt_df['下单时间'].dt.date
+    for _, reservation in reservations.iterrows():
+        candidates = mt_df[(order_dates == reservation['日期'].date()) & (mt_df['市别'] == reservation['市别'])]
+        matched = False
+        for _, order in candidates.iterrows():
+            is_match, match_type = legacy_smart_table_match(reservation['桌牌号'], order['桌牌号'])
+            if is_match:
+                rows.append((reservation[RESERVATION_ID_COLUMN], order[ORDER_ID_COLUMN], match_type))
+                matched = True
+        if not matched:
+            rows.append((reservation[RESERVATION_ID_COLUMN], None, '未匹配'))
+    return rows
+
+
+def match_rows(result_df):
+    return [
+        (reservation_id, None if pd.isna(order_id) else order_id, match_type)
+        for reservation_id, order_id, match_type in zip(
+            result_df[RESERVATION_ID_COLUMN], result_df[ORDER_ID_COLUMN], result_df['匹配类型']
+        )
+    ]
+
+
+def test_match_reservations_same_as_row_loop(prepared):
+    reservations, mt_df = prepared
+    expected = legacy_match(reservations, mt_df)
+
+    assert match_rows(match_reservations(reservations, mt_df)) == expected
+    # 固定写法的预期，防止两边同时出错
+    assert [match_type for _, _, match_type in expected] == [
+        '完全匹配', '数字匹配', '外卖匹配', '完全匹配', '未匹配', '完全匹配', '未匹配', '完全匹配', '完全匹配'
+    ]
+
+
+def test_parallel_matching_keeps_row_order(prepared):
+    reservations, mt_df = prepared
+    serial = match_reservations(reservations, mt_df)
+    parallel = match_reservations_parallel(reservations, mt_df, workers=2, min_rows=0)
+    pd.testing.assert_frame_equal(parallel.reset_index(drop=True), serial.reset_index(drop=True))
+
+
+def test_match_workers_default_to_serial(monkeypatch):
+    monkeypatch.delenv(MATCH_WORKERS_ENV, raising=False)
+    assert resolve_match_workers() == 1
+    monkeypatch.setenv(MATCH_WORKERS_ENV, '4')
+    assert resolve_match_workers() == 4
+    assert resolve_match_workers(2) == 2
+
+
+def test_partition_cache_recomputes_only_changed_partitions(inputs):
+    meituan_df, reservation_df = inputs
+    cache = PartitionMatchCache()
+    first = run_matching(meituan_df, reservation_df, workers=1, cache=cache)
+    assert (cache.last_reused, cache.last_recomputed) == (0, 4)
+    pd.testing.assert_frame_equal(first, run_matching(meituan_df, reservation_df, workers=1))
+
+    # 追加一天的预订：只计算新的分区
+    extra_day = reservation_df.iloc[[0]].assign(日期=pd.Timestamp('2025-03-03'))
+    grown = pd.concat([reservation_df, extra_day], ignore_index=True)
+    second = run_matching(meituan_df, grown, workers=1, cache=cache)
+    assert (cache.last_reused, cache.last_recomputed) == (4, 1)
+    pd.testing.assert_frame_equal(second, run_matching(meituan_df, grown, workers=1))
+
+    # 在订单最前面插入一行不参与匹配的订单：分区内容不变，全部复用，订单ID仍指向当前数据
+    shifted = pd.concat([meituan_df.iloc[[4]], meituan_df], ignore_index=True)
+    third = run_matching(shifted, grown, workers=1, cache=cache)
+    assert (cache.last_reused, cache.last_recomputed) == (5, 0)
+    pd.testing.assert_frame_equal(third, run_matching(shifted, grown, workers=1))
+
+    # 修改某个分区的订单：只重新计算该分区
+    changed = shifted.copy()
+    changed.loc[1, '桌牌号'] = 'A99'
+    fourth = run_matching(changed, grown, workers=1, cache=cache)
+    assert (cache.last_reused, cache.last_recomputed) == (4, 1)
+    pd.testing.assert_frame_equal(fourth, run_matching(changed, grown, workers=1))
+    assert cache.memory_bytes() < 1024
+
+
+def matched_orders(result_df):
+    """每个预订按输出顺序匹配到的订单ID，未匹配为空列表"""
+    orders = result_df.groupby('客户姓名', sort=False)[ORDER_ID_COLUMN].agg(lambda ids: [int(i) for i in ids.dropna()])
+    return orders.to_dict()
+
+
+def test_time_ranking_keeps_closest_orders(prepared):
+    reservations, mt_df = prepared
+    # 张三（午市参考时间12:00）的候选订单：12:05、12:30、13:00
+    assert matched_orders(match_reservations(reservations, mt_df))['张三'] == [0, 1, 2]
+    assert matched_orders(match_reservations(reservations, mt_df, top_k=1))['张三'] == [0]
+    
+    # 时间窗口45分钟：13:00 的外卖订单和钱七 11:00 的订单超出窗口
+    ranked = match_reservations(reservations, mt_df, top_k=2, tolerance_minutes=45)
+    orders = matched_orders(ranked)
+    assert orders['张三'] == [0, 1]
+    assert orders['钱七'] == []
+    assert ranked.loc[ranked['客户姓名'] == '钱七', '匹配类型'].tolist() == ['未匹配']
+    assert len(ranked) == len(reservations) + 1
+
+
+def test_result_ids_point_to_source_rows(inputs):
+    meituan_df, reservation_df = inputs
+    result = run_matching(meituan_df, reservation_df, workers=1)
+    assert result.index.name == ROW_ID_NAME and list(result.index) == list(range(len(result)))
+    assert str(result[ORDER_ID_COLUMN].dtype) == 'Int32'
+    assert str(result[RESERVATION_ID_COLUMN].dtype) == 'int32'
+    
+    # 订单ID是订单在读取结果中的行位置；预订ID是清洗后预订的顺序（测试数据中的预订都有效，即读取结果中的行位置）
+    matched = result[result[ORDER_ID_COLUMN].notna()]
+    source = meituan_df.iloc[matched[ORDER_ID_COLUMN].astype(int)]
+    assert source['下单时间'].tolist() == matched['下单时间'].tolist()
+    assert source['结账方式'].tolist() == matched['结账方式'].astype(object).tolist()
+    names = reservation_df['姓名'].iloc[result[RESERVATION_ID_COLUMN]].tolist()
+    assert names == result['客户姓名'].astype(object).tolist()